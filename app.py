@@ -3,6 +3,7 @@
 # Sets up the Bot Framework adapter with Teams credentials and defines the message route.
 
 import os
+import time
 import asyncio
 from flask import Flask, request, Response, jsonify, make_response, render_template
 from botbuilder.core import BotFrameworkAdapter, BotFrameworkAdapterSettings
@@ -16,11 +17,16 @@ import logging
 
 from bot.teams_bot import TeamsBot
 from flask import send_from_directory
+from botocore.exceptions import ClientError
+from aws_crew_tools import metrics
+import crew_handler
 
 # Load environment variables from .env (Teams app ID and password, etc.)
 load_dotenv()
 APP_ID = os.getenv("BOT_APP_ID", "")
 APP_PW = os.getenv("BOT_APP_PASSWORD", "")
+# Tolerance between this host's clock and S3's when checking an upload's LastModified.
+CLOCK_SKEW = int(os.getenv("UPLOAD_CLOCK_SKEW", "300"))
 
 logging.basicConfig(
     filename='bot.log',
@@ -44,6 +50,11 @@ app = Flask(__name__)
 def download_static(filename):
     return send_from_directory('static', filename, as_attachment=True)
 
+@app.route("/metrics")
+def metrics_snapshot():
+    # Counters, gauges and stage timings (e.g. EC2 preflight/launch latencies)
+    return jsonify(metrics.snapshot())
+
 # Error handler for the adapter (optional: logs errors and sends trace messages if needed)
 async def on_error(context, error):
     print(f"Bot error: {error}")
@@ -96,7 +107,7 @@ def upload_page():
         acl = request.form.get("acl", "private")
         storage_class = request.form.get("storage_class", "STANDARD")
 
-        success, message = upload_file_to_s3(bucket, file.read(), file.filename, prefix, acl, storage_class)
+        success, message = upload_file_to_s3(bucket, file.stream, file.filename, prefix, acl, storage_class)
 
         if success:
             html_success = f"""
@@ -149,14 +160,332 @@ def upload_page():
             return wrap_html(html_error)
 
     # GET request
-    html = render_template("upload.html")
+    from aws_crew_tools.s3_transfer import MULTIPART_THRESHOLD
+    html = render_template("upload.html", session_id=request.args.get("session", ""),
+                           multipart_threshold=MULTIPART_THRESHOLD)
     return wrap_html(html)
 
 
+@app.route("/upload/presign", methods=["POST"])
+def upload_presign():
+    # The browser asks for a POST policy and then sends the file straight to S3.
+    from aws_crew_tools.s3 import generate_presigned_upload_post, UPLOAD_MAX_BYTES
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session_id = body.get("session")
+    if not transfer_sessions.get(session_id):
+        return jsonify({"error": "Unknown or expired upload session."}), 403
+    if not body.get("bucket_name") or not body.get("file_name"):
+        return jsonify({"error": "bucket_name and file_name are required."}), 400
+    size = _requested_size(body)
+    if size is None:
+        return jsonify({"error": "size must be a positive whole number of bytes."}), 400
+    if size > UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"File is larger than the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit."}), 413
+
+    success, post = generate_presigned_upload_post(
+        body["bucket_name"], os.path.basename(body["file_name"]), body.get("prefix", ""),
+        body.get("acl", "private"), body.get("storage_class", "STANDARD")
+    )
+    if not success:
+        return jsonify({"error": post}), 500
+    transfer_sessions.update_upload(session_id, post["key"], bucket_name=body["bucket_name"], status="presigned",
+                                    acl=body.get("acl", "private"), storage_class=body.get("storage_class", "STANDARD"),
+                                    presigned_at=time.time())
+    metrics.incr("s3.direct_upload.presigned")
+    return jsonify(post)
+
+
+@app.route("/upload/complete", methods=["POST"])
+async def upload_complete():
+    # Called by the browser once S3 accepted the upload; verifies it and posts the success card.
+    from aws_crew_tools.s3 import get_s3_object_info
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session_id, key = body.get("session"), body.get("key")
+    session = transfer_sessions.get(session_id)
+    upload = _upload_record(session, key)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    if upload.get("status") != "presigned":
+        return jsonify({"error": "This upload was already completed."}), 409
+
+    success, info = await asyncio.to_thread(get_s3_object_info, upload["bucket_name"], key)
+    if not success:
+        return jsonify({"error": info}), 409
+    # An object that predates the policy was not sent through this session.
+    if info["LastModified"].timestamp() < upload["presigned_at"] - CLOCK_SKEW:
+        return jsonify({"error": "The object was not uploaded through this session."}), 409
+    transfer_sessions.update_upload(session_id, key, status="complete", size=info["ContentLength"])
+    metrics.incr("s3.direct_upload.completed")
+    metrics.incr("s3.direct_upload.bytes", info["ContentLength"])
+
+    await _post_upload_card(session, upload, key)
+    return jsonify({"ok": True, "size": info["ContentLength"]})
+
+
+async def _post_upload_card(session, upload, key):
+    from botbuilder.core import MessageFactory
+    from botbuilder.schema import Attachment, ConversationReference
+    from bot import adaptive_cards
+
+    card = adaptive_cards.s3_upload_success_card(upload["bucket_name"], key, upload["acl"], upload["storage_class"])
+
+    async def send_card(turn_context):
+        await turn_context.send_activity(
+            MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card))
+        )
+
+    reference = ConversationReference().deserialize(session["conversation"])
+    await adapter.continue_conversation(reference, send_card, bot_id=APP_ID)
+
+
+def _requested_size(body):
+    """
+    The declared file size in bytes, or None if it is not a positive whole number. Empty files
+    can't use the presigned POST (its policy starts at 1 byte); the page then posts them to /upload.
+    """
+    try:
+        size = int(body.get("size") or 0)
+    except (TypeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+
+def _upload_record(session, key):
+    # Knowing the (unguessable) session id is what authorizes a request for its uploads.
+    return (session or {}).get("uploads", {}).get(key or "")
+
+
+def _part_number(value, upload):
+    """value as a part number of upload (1..part_count), or None."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if 1 <= number <= upload["part_count"] else None
+
+
+def _session_upload(body):
+    """(session, upload) for a multipart request, or (None, None) if either is unknown."""
+    from bot import transfer_sessions
+    session = transfer_sessions.get(body.get("session"))
+    upload = _upload_record(session, body.get("key"))
+    if not upload or not upload.get("upload_id"):
+        return None, None
+    return session, upload
+
+
+@app.route("/upload/multipart/create", methods=["POST"])
+def multipart_create():
+    # Starts (or resumes) a browser multipart upload. A reload may open a new session; the old
+    # upload is adopted when the page passes its previous session and key for the same user.
+    from aws_crew_tools import s3_transfer
+    from aws_crew_tools.s3 import UPLOAD_MAX_BYTES
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session_id = body.get("session")
+    session = transfer_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Unknown or expired upload session."}), 403
+    if not body.get("bucket_name") or not body.get("file_name"):
+        return jsonify({"error": "bucket_name and file_name are required."}), 400
+
+    prefix = body.get("prefix", "")
+    key = f"{prefix}{os.path.basename(body['file_name'])}"
+    size = _requested_size(body)
+    if size is None:
+        return jsonify({"error": "size must be a positive whole number of bytes."}), 400
+    if size > UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"File is larger than the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit."}), 413
+    fingerprint = body.get("fingerprint", "")
+
+    previous = transfer_sessions.get(body.get("resume_session")) if body.get("resume_session") else session
+    if previous and previous.get("user_id") == session.get("user_id"):
+        upload = previous.get("uploads", {}).get(key)
+        if (upload and upload.get("upload_id") and upload.get("status") == "in_progress"
+                and upload.get("fingerprint") == fingerprint and upload.get("bucket_name") == body["bucket_name"]):
+            transfer_sessions.update_upload(session_id, key, **upload)
+            metrics.incr("s3.browser_multipart.resumed")
+            return jsonify({"key": key, "upload_id": upload["upload_id"], "part_size": upload["part_size"],
+                            "part_count": upload["part_count"], "resumed": True})
+
+    acl, storage_class = body.get("acl", "private"), body.get("storage_class", "STANDARD")
+    part_size = s3_transfer.browser_part_size(size)
+    part_count = max(1, -(-size // part_size))
+    try:
+        upload_id = s3_transfer.create_browser_upload(body["bucket_name"], key, acl, storage_class)
+    except Exception as e:
+        logger.exception("Could not start multipart upload")
+        return jsonify({"error": str(e)}), 500
+    transfer_sessions.update_upload(session_id, key, bucket_name=body["bucket_name"], acl=acl,
+                                    storage_class=storage_class, upload_id=upload_id, part_size=part_size,
+                                    part_count=part_count, size=size, fingerprint=fingerprint,
+                                    status="in_progress", parts={})
+    return jsonify({"key": key, "upload_id": upload_id, "part_size": part_size,
+                    "part_count": part_count, "resumed": False})
+
+
+@app.route("/upload/multipart/urls", methods=["POST"])
+def multipart_urls():
+    from aws_crew_tools import s3_transfer
+
+    body = request.get_json(silent=True) or {}
+    session, upload = _session_upload(body)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    if upload.get("status") != "in_progress":
+        return jsonify({"error": f"This upload is {upload.get('status')}."}), 409
+    requested = body.get("part_numbers")
+    numbers = [_part_number(n, upload) for n in requested] if isinstance(requested, list) else [None]
+    if None in numbers:
+        return jsonify({"error": f"part_numbers must be a list of part numbers from 1 to {upload['part_count']}."}), 400
+    urls = s3_transfer.presign_parts(upload["bucket_name"], body["key"], upload["upload_id"], numbers)
+    return jsonify({"urls": urls, "expires_in": s3_transfer.PART_URL_TTL})
+
+
+@app.route("/upload/multipart/part-done", methods=["POST"])
+def multipart_part_done():
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session, upload = _session_upload(body)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    if upload.get("status") != "in_progress":
+        return jsonify({"error": f"This upload is {upload.get('status')}."}), 409
+    number = _part_number(body.get("part_number"), upload)
+    if number is None:
+        return jsonify({"error": f"part_number must be a part number from 1 to {upload['part_count']}."}), 400
+    parts = dict(upload.get("parts", {}))
+    parts[str(number)] = body.get("etag", "")
+    transfer_sessions.update_upload(body["session"], body["key"], parts=parts)
+    return jsonify({"ok": True, "done": len(parts), "part_count": upload["part_count"]})
+
+
+@app.route("/upload/multipart/status")
+def multipart_status():
+    # Which parts S3 already holds, so a reloaded page only sends the missing ones.
+    from aws_crew_tools import s3_transfer
+    from bot import transfer_sessions
+
+    body = {"session": request.args.get("session"), "key": request.args.get("key")}
+    session, upload = _session_upload(body)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    try:
+        uploaded = s3_transfer.list_uploaded_parts(upload["bucket_name"], body["key"], upload["upload_id"])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 410
+    parts = {str(p["PartNumber"]): p["ETag"] for p in uploaded}
+    transfer_sessions.update_upload(body["session"], body["key"], parts=parts)
+    done = sorted(int(n) for n in parts)
+    missing = sorted(set(range(1, upload["part_count"] + 1)) - set(done))
+    return jsonify({"completed": done, "missing": missing, "part_size": upload["part_size"],
+                    "part_count": upload["part_count"]})
+
 
+@app.route("/upload/multipart/complete", methods=["POST"])
+async def multipart_complete():
+    from aws_crew_tools import s3_transfer
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session, upload = _session_upload(body)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    if upload.get("status") != "in_progress":
+        return jsonify({"error": f"This upload is {upload.get('status')}."}), 409
+    try:
+        size = await asyncio.to_thread(s3_transfer.complete_browser_upload, upload["bucket_name"], body["key"],
+                                       upload["upload_id"], upload["part_count"], upload.get("size"))
+    except s3_transfer.SizeMismatch as e:
+        # More (or less) than was declared and checked against UPLOAD_MAX_BYTES: never complete it.
+        await asyncio.to_thread(_abort_quietly, upload, body["key"])
+        transfer_sessions.update_upload(body["session"], body["key"], status="aborted")
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    except ClientError as e:
+        return _multipart_client_error(body, e)
+    transfer_sessions.update_upload(body["session"], body["key"], status="complete", size=size)
+    await _post_upload_card(session, upload, body["key"])
+    return jsonify({"ok": True, "size": size})
+
+
+@app.route("/upload/multipart/abort", methods=["POST"])
+def multipart_abort():
+    from aws_crew_tools import s3_transfer
+    from bot import transfer_sessions
+
+    body = request.get_json(silent=True) or {}
+    session, upload = _session_upload(body)
+    if not upload:
+        return jsonify({"error": "Unknown upload."}), 404
+    if upload.get("status") != "in_progress":
+        return jsonify({"error": f"This upload is {upload.get('status')}."}), 409
+    try:
+        s3_transfer.abort_browser_upload(upload["bucket_name"], body["key"], upload["upload_id"])
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+            return _multipart_client_error(body, e)
+    transfer_sessions.update_upload(body["session"], body["key"], status="aborted")
+    return jsonify({"ok": True})
+
+
+def _abort_quietly(upload, key):
+    from aws_crew_tools import s3_transfer
+    try:
+        s3_transfer.abort_browser_upload(upload["bucket_name"], key, upload["upload_id"])
+    except ClientError as e:
+        logger.warning(f"Could not abort multipart upload of {key}: {e}")
+
+
+def _multipart_client_error(body, error):
+    # NoSuchUpload: S3 already completed, aborted or expired the upload; the session must not offer it again.
+    from bot import transfer_sessions
+    if error.response.get("Error", {}).get("Code") == "NoSuchUpload":
+        session, upload = _session_upload(body)
+        if upload and upload.get("status") != "in_progress":
+            # A concurrent request completed or aborted it first.
+            return jsonify({"error": f"This upload is {upload.get('status')}."}), 409
+        transfer_sessions.update_upload(body["session"], body["key"], status="expired")
+        return jsonify({"error": "S3 no longer has this upload; start it again."}), 410
+    logger.error(f"Multipart upload request failed: {error}")
+    return jsonify({"error": str(error)}), 502
+
+
+@app.route("/download/zip/<token>")
+def download_zip(token):
+    # Streams the archive while it is being built; nothing is buffered beyond the read-ahead window.
+    from aws_crew_tools import s3_zip
+    from bot import transfer_sessions
+
+    download = transfer_sessions.claim_zip_download(token)
+    if not download:
+        return Response("❌ This download link has expired or was already used.", status=404)
+    bucket, prefix = download["bucket_name"], download.get("prefix", "")
+    try:
+        keys = download["keys"] or s3_zip.keys_under_prefix(bucket, prefix)
+    except ValueError as e:
+        return Response(f"❌ {e}", status=413)
+    if not keys:
+        return Response("⚠️ Nothing to download.", status=404)
 
+    name = (prefix.rstrip("/").rsplit("/", 1)[-1] or bucket) if not download["keys"] else bucket
+    return Response(
+        s3_zip.stream_zip(bucket, keys, strip_prefix=prefix),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}.zip"'},
+    )
 
 
 if __name__ == "__main__":
+    # Load the model into Ollama before the first question arrives.
+    if os.getenv("OLLAMA_WARMUP", "true").lower() == "true":
+        crew_handler.start_warm_up()
     print("🚀 Flask bot is running on http://localhost:3978")
     app.run(host="0.0.0.0", port=3978, debug=True)
@@ -0,0 +1,162 @@
+import ipaddress
+import math
+from collections import defaultdict
+
+# Buddy-style CIDR allocator for subnet planning.
+# Free space is kept as aligned power-of-two blocks per prefix length. Requests are served
+# largest first with best fit (smallest free block that fits, lowest address first), splitting
+# blocks into buddies as needed. Because every block size divides the larger ones, largest-first
+# placement is optimal: a set of requests fits whenever it fits at all, including into the holes
+# left between the existing subnets of a VPC.
+
+AWS_RESERVED_ADDRESSES = 5  # network, VPC router, DNS, future use, broadcast
+MIN_SUBNET_PREFIX = 28
+MAX_SUBNET_PREFIX = 16
+
+
+def prefix_for_hosts(hosts):
+    """Smallest subnet prefix length that fits `hosts` usable addresses in AWS."""
+    needed = int(hosts) + AWS_RESERVED_ADDRESSES
+    prefix = 32 - math.ceil(math.log2(needed))
+    if prefix < MAX_SUBNET_PREFIX:
+        raise ValueError(f"{hosts} hosts do not fit in a single subnet (largest is /{MAX_SUBNET_PREFIX}).")
+    return min(prefix, MIN_SUBNET_PREFIX)
+
+
+class BuddyAllocator:
+    def __init__(self, free_blocks=()):
+        self._free = defaultdict(list)  # prefixlen -> sorted network addresses (ints)
+        for block in ipaddress.collapse_addresses(ipaddress.ip_network(b) for b in free_blocks):
+            self._free[block.prefixlen].append(int(block.network_address))
+        for addresses in self._free.values():
+            addresses.sort()
+
+    @classmethod
+    def for_space(cls, cidr_blocks, used=()):
+        """Allocator over `cidr_blocks` minus the `used` networks (e.g. a VPC's existing subnets)."""
+        free = [ipaddress.ip_network(c) for c in cidr_blocks]
+        for taken in sorted((ipaddress.ip_network(u) for u in used), key=lambda n: n.prefixlen):
+            remaining = []
+            for block in free:
+                if block.subnet_of(taken):
+                    continue
+                if taken.subnet_of(block):
+                    remaining.extend(block.address_exclude(taken))
+                else:
+                    remaining.append(block)
+            free = remaining
+        return cls(free)
+
+    def free_addresses(self):
+        return sum(len(addrs) * 2 ** (32 - prefix) for prefix, addrs in self._free.items())
+
+    def allocate(self, prefixlen):
+        # Best fit: the longest free prefix (smallest block) that can still hold the request.
+        for prefix in range(prefixlen, -1, -1):
+            if self._free.get(prefix):
+                address = self._free[prefix].pop(0)
+                break
+        else:
+            return None
+        # Split down to the requested size, returning the upper buddies to the free lists.
+        while prefix < prefixlen:
+            prefix += 1
+            buddy = address + 2 ** (32 - prefix)
+            addresses = self._free[prefix]
+            addresses.insert(_bisect(addresses, buddy), buddy)
+        return ipaddress.IPv4Network((address, prefixlen))
+
+    def release(self, network):
+        network = ipaddress.ip_network(network)
+        address, prefix = int(network.network_address), network.prefixlen
+        # Merge with the free buddy as long as it exists.
+        while prefix > 0:
+            size = 2 ** (32 - prefix)
+            buddy = address ^ size
+            addresses = self._free[prefix]
+            idx = _bisect(addresses, buddy)
+            if idx < len(addresses) and addresses[idx] == buddy:
+                addresses.pop(idx)
+                address = min(address, buddy)
+                prefix -= 1
+            else:
+                break
+        addresses = self._free[prefix]
+        addresses.insert(_bisect(addresses, address), address)
+
+
+def _bisect(addresses, value):
+    lo, hi = 0, len(addresses)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if addresses[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _assign_zones(requests, azs):
+    """Spread each subnet type (public/private) evenly over the AZs; explicit 'az' values are kept."""
+    if not azs:
+        return {}
+    load = defaultdict(lambda: defaultdict(int))
+    zones = {}
+    for idx, req in enumerate(requests):
+        if req.get('az'):
+            zones[idx] = req['az']
+            load[req.get('type', 'private')][req['az']] += 1
+    for idx, req in enumerate(requests):
+        if idx in zones:
+            continue
+        tier = load[req.get('type', 'private')]
+        zone = min(azs, key=lambda z: (tier[z], azs.index(z)))
+        tier[zone] += 1
+        zones[idx] = zone
+    return zones
+
+
+def plan_subnets(cidr_blocks, subnet_requests, used=(), azs=None):
+    """
+    Plan subnets for `subnet_requests` (dicts with 'hosts', 'type' and optional 'az') inside
+    `cidr_blocks`, avoiding the `used` networks. Returns one dict per request, in request order,
+    with 'network', 'type', 'id' (request index), 'hosts' and 'az'.
+    """
+    if isinstance(cidr_blocks, str):
+        cidr_blocks = [cidr_blocks]
+    allocator = BuddyAllocator.for_space(cidr_blocks, used)
+    prefixes = [prefix_for_hosts(req['hosts']) for req in subnet_requests]
+    requested = sum(2 ** (32 - p) for p in prefixes)
+    if requested > allocator.free_addresses():
+        raise ValueError("Not enough space in VPC for requested subnets.")
+
+    zones = _assign_zones(subnet_requests, list(azs or []))
+    allocated = []
+    for idx in sorted(range(len(subnet_requests)), key=lambda i: (prefixes[i], i)):
+        network = allocator.allocate(prefixes[idx])
+        if network is None:
+            raise ValueError("Not enough space in VPC for requested subnets.")
+        req = subnet_requests[idx]
+        allocated.append({'network': network, 'type': req.get('type', 'private'), 'id': idx,
+                          'hosts': req['hosts'], 'az': zones.get(idx)})
+    return sorted(allocated, key=lambda a: a['id'])
+
+
+def availability_zones(ec2):
+    response = ec2.describe_availability_zones(Filters=[
+        {"Name": "state", "Values": ["available"]},
+        {"Name": "zone-type", "Values": ["availability-zone"]},
+    ])
+    return sorted(z['ZoneName'] for z in response['AvailabilityZones'])
+
+
+def plan_subnets_in_vpc(ec2, vpc_id, subnet_requests, azs=None):
+    """Plan new subnets into the free space (holes included) of an existing VPC."""
+    vpc = ec2.describe_vpcs(VpcIds=[vpc_id])['Vpcs'][0]
+    cidrs = [a['CidrBlock'] for a in vpc.get('CidrBlockAssociationSet', [])
+             if a.get('CidrBlockState', {}).get('State') == 'associated'] or [vpc['CidrBlock']]
+    used = [s['CidrBlock'] for s in ec2.describe_subnets(
+        Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])['Subnets']]
+    if azs is None:
+        azs = availability_zones(ec2)
+    return plan_subnets(cidrs, subnet_requests, used=used, azs=azs)
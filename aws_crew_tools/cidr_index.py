@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import bisect
+import logging
+import ipaddress
+import threading
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from aws_crew_tools import metrics
+from aws_crew_tools.regions import enabled_regions
+
+# Account-wide CIDR planning index.
+# Reserved IPv4 ranges from every source (VPC primary and secondary CIDRs in all enabled regions,
+# peered VPCs, on-prem ranges from a config file) are kept per source and merged into one sorted
+# list of disjoint intervals, so "does X conflict" is a binary search and "next free /N" walks gaps.
+
+logger = logging.getLogger(__name__)
+
+RESERVED_CIDRS_FILE = os.getenv("CIDR_RESERVED_FILE", os.path.join("config", "reserved_cidrs.json"))
+INDEX_TTL = int(os.getenv("CIDR_INDEX_TTL", "900"))
+INDEX_CONCURRENCY = int(os.getenv("CIDR_INDEX_CONCURRENCY", "8"))
+
+
+def _interval(cidr):
+    net = ipaddress.ip_network(cidr, strict=False)
+    return int(net.network_address), int(net.broadcast_address)
+
+
+class CidrIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}   # source -> [(cidr, start, end)]
+        self._starts = []    # merged, disjoint, sorted intervals
+        self._ends = []
+
+    def __len__(self):
+        return len(self._starts)
+
+    def set_source(self, source, cidrs):
+        """Replace every range of one source (e.g. a region refresh) and rebuild the merged view."""
+        entries = []
+        for cidr in cidrs:
+            try:
+                entries.append((str(cidr), *_interval(cidr)))
+            except ValueError:
+                logger.warning(f"[CidrIndex] Ignoring invalid CIDR {cidr!r} from {source}")
+        with self._lock:
+            self._sources[source] = entries
+            self._rebuild()
+
+    def add(self, cidr, source="local"):
+        """Incrementally reserve one range, merging it into the sorted interval list."""
+        start, end = _interval(cidr)
+        with self._lock:
+            self._sources.setdefault(source, []).append((str(cidr), start, end))
+            i = bisect.bisect_right(self._starts, start)
+            # Merge with the left neighbour and every following interval it touches.
+            if i > 0 and self._ends[i - 1] >= start - 1:
+                i -= 1
+                start = self._starts[i]
+                end = max(end, self._ends[i])
+            j = i
+            while j < len(self._starts) and self._starts[j] <= end + 1:
+                end = max(end, self._ends[j])
+                j += 1
+            self._starts[i:j] = [start]
+            self._ends[i:j] = [end]
+
+    def _rebuild(self):
+        intervals = sorted((s, e) for entries in self._sources.values() for _, s, e in entries)
+        starts, ends = [], []
+        for s, e in intervals:
+            if ends and s <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], e)
+            else:
+                starts.append(s)
+                ends.append(e)
+        self._starts, self._ends = starts, ends
+
+    def conflicts(self, cidr):
+        start, end = _interval(cidr)
+        with self._lock:
+            i = bisect.bisect_right(self._starts, end) - 1
+            return i >= 0 and self._ends[i] >= start
+
+    def explain(self, cidr):
+        """(source, cidr) pairs overlapping `cidr`; slower than conflicts(), meant for messages."""
+        start, end = _interval(cidr)
+        with self._lock:
+            return [(source, c) for source, entries in self._sources.items()
+                    for c, s, e in entries if s <= end and e >= start]
+
+    def next_free(self, prefixlen, within="10.0.0.0/8"):
+        """Lowest aligned /prefixlen block inside `within` that conflicts with nothing."""
+        space_start, space_end = _interval(within)
+        size = 2 ** (32 - prefixlen)
+        candidate = -(-space_start // size) * size
+        with self._lock:
+            while candidate + size - 1 <= space_end:
+                i = bisect.bisect_right(self._starts, candidate + size - 1) - 1
+                if i < 0 or self._ends[i] < candidate:
+                    return str(ipaddress.IPv4Network((candidate, prefixlen)))
+                # Jump past the blocking interval to the next aligned candidate.
+                candidate = -(-(self._ends[i] + 1) // size) * size
+        return None
+
+
+def _region_ranges(ec2):
+    vpc_cidrs, peer_cidrs = [], []
+    for page in ec2.get_paginator("describe_vpcs").paginate():
+        for vpc in page["Vpcs"]:
+            blocks = [a["CidrBlock"] for a in vpc.get("CidrBlockAssociationSet", [])
+                      if a.get("CidrBlockState", {}).get("State") in ("associated", "associating")]
+            vpc_cidrs.extend(blocks or [vpc["CidrBlock"]])
+    for page in ec2.get_paginator("describe_vpc_peering_connections").paginate(
+            Filters=[{"Name": "status-code", "Values": ["active", "provisioning", "pending-acceptance"]}]):
+        for pcx in page["VpcPeeringConnections"]:
+            for side in ("AccepterVpcInfo", "RequesterVpcInfo"):
+                info = pcx.get(side, {})
+                blocks = [b["CidrBlock"] for b in info.get("CidrBlockSet", [])]
+                peer_cidrs.extend(blocks or ([info["CidrBlock"]] if info.get("CidrBlock") else []))
+    return vpc_cidrs, peer_cidrs
+
+
+def load_reserved_ranges(path=RESERVED_CIDRS_FILE):
+    """On-prem / reserved ranges: a JSON list (or {"ranges": [...]}) or one CIDR per line with # comments."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+        return data.get("ranges", []) if isinstance(data, dict) else list(data)
+    except ValueError:
+        return [line.split("#", 1)[0].strip() for line in content.splitlines() if line.split("#", 1)[0].strip()]
+
+
+_index = None
+_built_at = 0.0
+_build_lock = threading.Lock()
+
+
+def refresh_region(region, index=None):
+    index = index or get_account_index()
+    with metrics.timer("cidr_index.refresh_region"):
+        vpc_cidrs, peer_cidrs = _region_ranges(boto3.client("ec2", region_name=region))
+    index.set_source(f"vpc:{region}", vpc_cidrs)
+    index.set_source(f"peering:{region}", peer_cidrs)
+    return index
+
+
+def build_account_index(regions=None):
+    index = CidrIndex()
+    regions = regions or enabled_regions()
+    clients = {region: boto3.client("ec2", region_name=region) for region in regions}
+    with metrics.timer("cidr_index.build"), ThreadPoolExecutor(max_workers=INDEX_CONCURRENCY) as pool:
+        futures = {region: pool.submit(_region_ranges, client) for region, client in clients.items()}
+        for region, future in futures.items():
+            try:
+                vpc_cidrs, peer_cidrs = future.result()
+            except Exception as e:
+                logger.warning(f"[CidrIndex] Skipping region {region}: {e}")
+                continue
+            index.set_source(f"vpc:{region}", vpc_cidrs)
+            index.set_source(f"peering:{region}", peer_cidrs)
+    index.set_source("reserved", load_reserved_ranges())
+    return index
+
+
+def get_account_index(max_age=INDEX_TTL):
+    """Cached account-wide index, rebuilt when older than `max_age` seconds."""
+    global _index, _built_at
+    with _build_lock:
+        if _index is None or time.monotonic() - _built_at > max_age:
+            _index = build_account_index()
+            _built_at = time.monotonic()
+            metrics.incr("cidr_index.builds")
+        return _index
+
+
+def cached_account_index():
+    """The cached index if one was built, without triggering a build."""
+    return _index
+
+
+def note_vpc_created(cidr, region):
+    """Keep a cached index current after this bot creates a VPC."""
+    if _index is not None:
+        _index.add(cidr, source=f"vpc:{region}")
+
+
+def refresh_cached_region(region):
+    """Re-read one region into a cached index, after VPCs there were deleted or changed out of band."""
+    if _index is None:
+        return None
+    try:
+        return refresh_region(region, _index)
+    except Exception as e:
+        logger.warning(f"[CidrIndex] Could not refresh region {region}: {e}")
+        return _index
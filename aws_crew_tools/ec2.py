@@ -10,6 +10,10 @@ import boto3
 import botocore.exceptions
 from typing import Type, Optional
 from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aws_crew_tools import metrics, idempotency, regions
 
 
 logger = logging.getLogger(__name__)
@@ -44,66 +48,117 @@ def estimate_instance_cost(instance_type, region="us-east-1"):
     except Exception as e:
         return f"Cost Estimation Failed: {e}"
 
-def create_instance(name, ami_id, instance_type, key_name, security_group_id,
-                    subnet_id, ebs_size=8, iam_role=None, public_ip=True,
-                    termination_protection=False, bootstrap_script_name="None",
-                    region_name=_region, **kwargs):
-    ec2_client = boto3.client('ec2', region_name=region_name)
-    ssm_client = boto3.client('ssm', region_name=region_name)
-    iam_client = boto3.client("iam", region_name=region_name)
+# Preflight cache: stable lookups reused across launches until their TTL expires.
+DEFAULT_AMI_PARAMETER = '/aws/service/ami-amazon-linux-latest/al2023-ami-kernel-default-x86_64'
+_CACHE_TTLS = {
+    "ami": int(os.getenv("EC2_AMI_CACHE_TTL", "3600")),
+    "instance_profile": int(os.getenv("EC2_PROFILE_CACHE_TTL", "900")),
+    "subnet_vpc": int(os.getenv("EC2_SUBNET_CACHE_TTL", "3600")),
+}
+_PREFLIGHT_WORKERS = int(os.getenv("EC2_PREFLIGHT_WORKERS", "6"))
+_preflight_cache = {}
+_preflight_lock = threading.Lock()
 
-    existing_key = False
-    pem_content = None
-    key_file = None
 
-    # ✅ Move all_tags to the top so it’s always defined
-    all_tags = [{"Key": "Name", "Value": name}] if name else []
-    all_tags += [{"Key": k, "Value": v} for k, v in kwargs.get("custom_tags", {}).items()]
+def _cached(kind, key, loader):
+    now = time.monotonic()
+    with _preflight_lock:
+        hit = _preflight_cache.get((kind, key))
+        if hit and hit[1] > now:
+            metrics.incr(f"ec2.cache.{kind}.hit")
+            return hit[0]
+    metrics.incr(f"ec2.cache.{kind}.miss")
+    value = loader()
+    with _preflight_lock:
+        _preflight_cache[(kind, key)] = (value, now + _CACHE_TTLS[kind])
+    return value
+
+
+def clear_preflight_cache():
+    with _preflight_lock:
+        _preflight_cache.clear()
 
-    if not ami_id or ami_id.strip().lower() == 'default':
+
+def _timed(stage, timings, fn, *args):
+    with metrics.timer(f"ec2.{stage}", timings):
+        return fn(*args)
+
+
+def _resolve_default_ami(ssm_client, region_name):
+    def load():
         try:
-            parameter = ssm_client.get_parameter(
-                Name='/aws/service/ami-amazon-linux-latest/al2023-ami-kernel-default-x86_64'
-            )
-            ami_id = parameter['Parameter']['Value']
+            parameter = ssm_client.get_parameter(Name=DEFAULT_AMI_PARAMETER)
+            return parameter['Parameter']['Value']
         except botocore.exceptions.ClientError as e:
             raise RuntimeError(f"Unable to get latest Amazon Linux 2023 AMI: {e}")
+    return _cached("ami", (region_name, DEFAULT_AMI_PARAMETER), load)
 
-    if not key_name:
-        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-        key_name = f"cloudbuddy-key-{timestamp}"
 
+def _ensure_key_pair(ec2_client, key_name, name):
+    """Returns (existing_key, pem_content, key_file); creates the key pair when it does not exist yet."""
     try:
         ec2_client.describe_key_pairs(KeyNames=[key_name])
-        existing_key = True
+        return True, None, None
     except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'InvalidKeyPair.NotFound':
-            key_pair = ec2_client.create_key_pair(KeyName=key_name)
-            pem_content = key_pair['KeyMaterial']
-            os.makedirs("static", exist_ok=True)
-            key_file = os.path.join("static", f"{key_name}.pem")
-            with os.fdopen(os.open(key_file, os.O_WRONLY | os.O_CREAT, 0o400), 'w') as f:
-                f.write(pem_content)
         if not name:
             raise Exception("Missing instance name. Possibly auto-run from invalid fallback.")
-        else:
+        if e.response['Error']['Code'] != 'InvalidKeyPair.NotFound':
             raise RuntimeError(f"Key pair error: {e}")
-
+    key_pair = ec2_client.create_key_pair(KeyName=key_name)
+    pem_content = key_pair['KeyMaterial']
+    os.makedirs("static", exist_ok=True)
+    key_file = os.path.join("static", f"{key_name}.pem")
+    with os.fdopen(os.open(key_file, os.O_WRONLY | os.O_CREAT, 0o400), 'w') as f:
+        f.write(pem_content)
+    return False, pem_content, key_file
+
+
+def _subnet_vpc_id(ec2_client, subnet_id, region_name):
+    return _cached(
+        "subnet_vpc", (region_name, subnet_id),
+        lambda: ec2_client.describe_subnets(SubnetIds=[subnet_id])['Subnets'][0]['VpcId']
+    )
+
+
+def _create_default_security_group(ec2_client, subnet_id, region_name, client_token=None):
+    security_group_id = None
+    create_params = {
+        "Description": "Auto-created by CloudBuddy",
+        "GroupName": f"cloudbuddy-sg-{datetime.utcnow().strftime('%H%M%S')}",
+        "VpcId": _subnet_vpc_id(ec2_client, subnet_id, region_name),
+    }
+    if client_token:
+        # A previous attempt may already have created the group; find it by its token tag.
+        existing = ec2_client.describe_security_groups(
+            Filters=idempotency.token_filters(client_token, "security-group")
+        )["SecurityGroups"]
+        if existing:
+            security_group_id = existing[0]["GroupId"]
+        create_params["TagSpecifications"] = [{
+            "ResourceType": "security-group",
+            "Tags": idempotency.token_tags(client_token, "security-group")
+        }]
     if not security_group_id:
-        sg = ec2_client.create_security_group(
-            Description="Auto-created by CloudBuddy",
-            GroupName=f"cloudbuddy-sg-{datetime.utcnow().strftime('%H%M%S')}",
-            VpcId=ec2_client.describe_subnets(SubnetIds=[subnet_id])['Subnets'][0]['VpcId']
-        )
+        sg = ec2_client.create_security_group(**create_params)
         security_group_id = sg['GroupId']
-        ec2_client.authorize_security_group_ingress(
+        if client_token:
+            idempotency.record(client_token, SecurityGroupId=security_group_id)
+    try:
+        idempotency.with_retries(
+            ec2_client.authorize_security_group_ingress,
             GroupId=security_group_id,
             IpPermissions=[
                 {"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]},
                 {"IpProtocol": "tcp", "FromPort": 80, "ToPort": 80, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]}
             ]
         )
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidPermission.Duplicate':
+            raise
+    return security_group_id
 
+
+def _check_subnet_routing(ec2_client, subnet_id):
     # Private subnet detection logic
     try:
         route_table_response = ec2_client.describe_route_tables(
@@ -119,45 +174,12 @@ def create_instance(name, ami_id, instance_type, key_name, security_group_id,
     except Exception:
         pass  # Route table logic isn't critical
 
-    instance_params = {
-        "ImageId": ami_id,
-        "InstanceType": instance_type,
-        "KeyName": key_name,
-        "MinCount": 1,
-        "MaxCount": 1,
-        "UserData": BOOTSTRAP_SCRIPTS.get(bootstrap_script_name, ""),
-        "NetworkInterfaces": [{
-            "AssociatePublicIpAddress": public_ip,
-            "DeviceIndex": 0,
-            "SubnetId": subnet_id,
-            "Groups": [security_group_id]
-        }],
-        "BlockDeviceMappings": [{
-            "DeviceName": "/dev/xvda",
-            "Ebs": {
-                "VolumeSize": ebs_size,
-                "VolumeType": "gp2",
-                "DeleteOnTermination": True
-            }
-        }],
-        "TagSpecifications": [{
-            "ResourceType": "instance",
-            "Tags": all_tags
-        }]
-    }
 
-    if kwargs.get("use_spot"):
-        instance_params["InstanceMarketOptions"] = {
-            "MarketType": "spot",
-            "SpotOptions": {
-                "SpotInstanceType": "one-time",
-                "InstanceInterruptionBehavior": "terminate"
-            }
-        }
+def _ensure_instance_profile(iam_client, iam_role):
+    role_name = iam_role.split('/')[-1] if ':' in iam_role else iam_role
 
-    if iam_role:
+    def load():
         try:
-            role_name = iam_role.split('/')[-1] if ':' in iam_role else iam_role
             try:
                 iam_client.get_instance_profile(InstanceProfileName=role_name)
             except iam_client.exceptions.NoSuchEntityException:
@@ -170,47 +192,205 @@ def create_instance(name, ami_id, instance_type, key_name, security_group_id,
                 RoleName=role_name,
                 PolicyArn="arn:aws:iam::aws:policy/AmazonSSMManagedInstanceCore"
             )
-            instance_params["IamInstanceProfile"] = {"Name": role_name}
         except botocore.exceptions.ClientError as e:
             raise ValueError(f"IAM Role/Profile '{iam_role}' is invalid or does not exist: {e}")
+        return role_name
+    return _cached("instance_profile", role_name, load)
+
+
+def _attach_elastic_ip(ec2_client, instance_id, client_token=None):
+    allocation_id = None
+    allocate_params = {"Domain": "vpc"}
+    if client_token:
+        existing = ec2_client.describe_addresses(
+            Filters=idempotency.token_filters(client_token, "elastic-ip")
+        )["Addresses"]
+        if existing:
+            allocation_id = existing[0]["AllocationId"]
+        allocate_params["TagSpecifications"] = [{
+            "ResourceType": "elastic-ip",
+            "Tags": idempotency.token_tags(client_token, "elastic-ip")
+        }]
+    if not allocation_id:
+        allocation_id = ec2_client.allocate_address(**allocate_params)['AllocationId']
+        if client_token:
+            idempotency.record(client_token, AllocationId=allocation_id)
+    idempotency.with_retries(
+        ec2_client.associate_address,
+        InstanceId=instance_id,
+        AllocationId=allocation_id
+    )
+    return allocation_id
 
-    # ✅ Launch instance now
-    try:
-        response = ec2_client.run_instances(**instance_params)
-        instance_id = response['Instances'][0]['InstanceId']
-
-        # ✅ Apply termination protection if requested
-        if termination_protection:
-            ec2_client.modify_instance_attribute(
-                InstanceId=instance_id,
-                DisableApiTermination={'Value': True}
-            )
 
-        # ✅ Allocate and attach Elastic IP (now that we have instance_id)
-        if kwargs.get("elastic_ip"):
-            if not public_ip:
-                raise ValueError("Elastic IP requires public_ip=True")
-            allocation = ec2_client.allocate_address(Domain='vpc')
-            ec2_client.associate_address(
-                InstanceId=instance_id,
-                AllocationId=allocation['AllocationId']
-            )
+def _enable_termination_protection(ec2_client, instance_id):
+    ec2_client.modify_instance_attribute(
+        InstanceId=instance_id,
+        DisableApiTermination={'Value': True}
+    )
+
+
+def create_instance(name, ami_id, instance_type, key_name, security_group_id,
+                    subnet_id, ebs_size=8, iam_role=None, public_ip=True,
+                    termination_protection=False, bootstrap_script_name="None",
+                    region_name=_region, client_token=None, **kwargs):
+    """
+    Launch an EC2 instance through a preflight -> launch -> postflight pipeline.
+    Independent preflight lookups (AMI, key pair, security group, routing check, instance profile)
+    and postflight steps (termination protection, Elastic IP, pricing) run concurrently;
+    per-stage latencies are returned under "Timings" and recorded in metrics.
+    With a client_token every mutating call is idempotent: a retry reuses the resources of the
+    first attempt and a completed request returns its original result.
+    """
+    if client_token:
+        previous = idempotency.completed_result(client_token)
+        if previous:
+            return dict(previous, Replayed=True)
+
+    ec2_client = boto3.client('ec2', region_name=region_name)
+    ssm_client = boto3.client('ssm', region_name=region_name)
+    iam_client = boto3.client("iam", region_name=region_name)
+
+    if kwargs.get("elastic_ip") and not public_ip:
+        raise ValueError("Elastic IP requires public_ip=True")
 
-        cost_est = estimate_instance_cost(instance_type)
-        return {
-            "Name": name,
-            "InstanceId": instance_id,
+    # ✅ Move all_tags to the top so it’s always defined
+    all_tags = [{"Key": "Name", "Value": name}] if name else []
+    all_tags += [{"Key": k, "Value": v} for k, v in kwargs.get("custom_tags", {}).items()]
+
+    if not key_name and client_token:
+        key_name = f"cloudbuddy-key-{client_token[:16]}"
+    elif not key_name:
+        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        key_name = f"cloudbuddy-key-{timestamp}"
+
+    timings = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=_PREFLIGHT_WORKERS) as pool:
+        # Pricing only depends on the instance type, so it overlaps with the whole launch.
+        cost_future = pool.submit(_timed, "postflight.pricing", timings, estimate_instance_cost, instance_type)
+
+        ami_future = None
+        if not ami_id or ami_id.strip().lower() == 'default':
+            ami_future = pool.submit(_timed, "preflight.ami", timings, _resolve_default_ami, ssm_client, region_name)
+        key_future = pool.submit(_timed, "preflight.key_pair", timings, _ensure_key_pair, ec2_client, key_name, name)
+        sg_future = None
+        if not security_group_id:
+            sg_future = pool.submit(_timed, "preflight.security_group", timings,
+                                    _create_default_security_group, ec2_client, subnet_id, region_name,
+                                    client_token)
+        pool.submit(_timed, "preflight.route_check", timings, _check_subnet_routing, ec2_client, subnet_id)
+        profile_future = None
+        if iam_role:
+            profile_future = pool.submit(_timed, "preflight.instance_profile", timings,
+                                         _ensure_instance_profile, iam_client, iam_role)
+
+        if ami_future:
+            ami_id = ami_future.result()
+        existing_key, pem_content, key_file = key_future.result()
+        if client_token:
+            if key_file:
+                idempotency.record(client_token, KeyPair=key_name, PEMFilePath=key_file)
+            else:
+                # The key pair may have been generated by an earlier attempt of this request.
+                journaled = idempotency.lookup(client_token) or {}
+                if journaled.get("PEMFilePath"):
+                    existing_key, key_file = False, journaled["PEMFilePath"]
+        if sg_future:
+            security_group_id = sg_future.result()
+
+        instance_params = {
+            "ImageId": ami_id,
             "InstanceType": instance_type,
-            "SubnetId": subnet_id,
-            "SecurityGroupId": security_group_id,
-            "KeyPair": key_name,
-            "PEMFilePath": key_file,
-            "PEMContent": pem_content,
-            "ExistingKey": existing_key,
-            "EstimatedCost": cost_est
+            "KeyName": key_name,
+            "MinCount": 1,
+            "MaxCount": 1,
+            "UserData": BOOTSTRAP_SCRIPTS.get(bootstrap_script_name, ""),
+            "NetworkInterfaces": [{
+                "AssociatePublicIpAddress": public_ip,
+                "DeviceIndex": 0,
+                "SubnetId": subnet_id,
+                "Groups": [security_group_id]
+            }],
+            "BlockDeviceMappings": [{
+                "DeviceName": "/dev/xvda",
+                "Ebs": {
+                    "VolumeSize": ebs_size,
+                    "VolumeType": "gp2",
+                    "DeleteOnTermination": True
+                }
+            }],
+            "TagSpecifications": [{
+                "ResourceType": "instance",
+                "Tags": all_tags
+            }]
         }
-    except botocore.exceptions.ClientError as e:
-        raise RuntimeError(f"Failed to create EC2 instance: {e}")
+
+        if kwargs.get("use_spot"):
+            instance_params["InstanceMarketOptions"] = {
+                "MarketType": "spot",
+                "SpotOptions": {
+                    "SpotInstanceType": "one-time",
+                    "InstanceInterruptionBehavior": "terminate"
+                }
+            }
+
+        if profile_future:
+            instance_params["IamInstanceProfile"] = {"Name": profile_future.result()}
+        if client_token:
+            instance_params["ClientToken"] = client_token
+        timings["ec2.preflight.total"] = round(time.perf_counter() - started, 4)
+        metrics.observe("ec2.preflight.total", timings["ec2.preflight.total"])
+
+        # ✅ Launch instance now
+        try:
+            with metrics.timer("ec2.launch.run_instances", timings):
+                if client_token:
+                    # The ClientToken makes run_instances safe to retry aggressively.
+                    response = idempotency.with_retries(ec2_client.run_instances, **instance_params)
+                else:
+                    response = ec2_client.run_instances(**instance_params)
+            instance_id = response['Instances'][0]['InstanceId']
+            if client_token:
+                idempotency.record(client_token, InstanceId=instance_id)
+            timings["ec2.launch.to_instance_id"] = round(time.perf_counter() - started, 4)
+            metrics.observe("ec2.launch.to_instance_id", timings["ec2.launch.to_instance_id"])
+
+            postflight = []
+            # ✅ Apply termination protection if requested
+            if termination_protection:
+                postflight.append(pool.submit(_timed, "postflight.termination_protection", timings,
+                                              _enable_termination_protection, ec2_client, instance_id))
+            # ✅ Allocate and attach Elastic IP (now that we have instance_id)
+            if kwargs.get("elastic_ip"):
+                postflight.append(pool.submit(_timed, "postflight.elastic_ip", timings,
+                                              _attach_elastic_ip, ec2_client, instance_id, client_token))
+            for future in postflight:
+                future.result()
+            cost_est = cost_future.result()
+        except botocore.exceptions.ClientError as e:
+            raise RuntimeError(f"Failed to create EC2 instance: {e}")
+
+    timings["ec2.launch.total"] = round(time.perf_counter() - started, 4)
+    metrics.observe("ec2.launch.total", timings["ec2.launch.total"])
+    logger.info(f"[EC2] Launched {instance_id} with stage timings: {timings}")
+    result = {
+        "Name": name,
+        "InstanceId": instance_id,
+        "InstanceType": instance_type,
+        "SubnetId": subnet_id,
+        "SecurityGroupId": security_group_id,
+        "KeyPair": key_name,
+        "PEMFilePath": key_file,
+        "PEMContent": pem_content,
+        "ExistingKey": existing_key,
+        "EstimatedCost": cost_est,
+        "Timings": timings
+    }
+    if client_token:
+        # Never journal the private key material; the PEM stays in static/.
+        idempotency.complete(client_token, dict(result, PEMContent=None))
+    return result
 
 
 
@@ -271,8 +451,8 @@ class StartEC2Tool(BaseTool):
         raise NotImplementedError("StartEC2Tool does not support async")
 
 
-def list_instances(region_name=_region):
-    ec2_client = boto3.client("ec2", region_name=region_name)
+def list_instances(region_name=_region, client=None):
+    ec2_client = client or boto3.client("ec2", region_name=region_name)
     try:
         response = ec2_client.describe_instances()
         instances_info = []
@@ -329,9 +509,11 @@ class CreateEC2Tool(BaseTool):
 
 class ListEC2Tool(BaseTool):
     name: str = "list_ec2_instances"
-    description: str = "List all EC2 instances."
+    description: str = "List all EC2 instances. Set all_regions=True to query every enabled region."
 
-    def _run(self):
+    def _run(self, all_regions: bool = False):
+        if all_regions:
+            return regions.collect_text(list_instances, empty="No instances found.")
         return list_instances()
 
     async def _arun(self, *args, **kwargs):
@@ -351,14 +533,14 @@ class TerminateEC2Tool(BaseTool):
 
     async def _arun(self, *args, **kwargs):
         raise NotImplementedError("TerminateEC2Tool does not support async")
-def list_security_groups(region_name=_region):
-    ec2 = boto3.client("ec2", region_name=region_name)
+def list_security_groups(region_name=_region, client=None):
+    ec2 = client or boto3.client("ec2", region_name=region_name)
     groups = ec2.describe_security_groups()["SecurityGroups"]
     return [{"title": f"{g['GroupName']} ({g['GroupId']})", "value": g["GroupId"]} for g in groups]
 
-def list_subnets(region_name=_region):
+def list_subnets(region_name=_region, client=None):
     
-    ec2 = boto3.client("ec2", region_name=region_name)
+    ec2 = client or boto3.client("ec2", region_name=region_name)
     subnets = ec2.describe_subnets()["Subnets"]
     return [{"title": f"{s['SubnetId']} ({s['AvailabilityZone']})", "value": s["SubnetId"]} for s in subnets]
 
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import botocore.exceptions
+from aws_crew_tools import metrics
+
+# Idempotency support for mutating AWS calls.
+# A deterministic client token is derived from the card submission; created resource ids are
+# appended to a local journal (token -> fields) so retries and resubmissions never duplicate
+# resources and completed requests can be answered from the journal.
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.getenv("CLOUDBUDDY_JOURNAL", os.path.join("state", "journal.jsonl"))
+TOKEN_TAG = "cloudbuddy:client-token"
+ROLE_TAG = "cloudbuddy:role"
+
+RETRY_ATTEMPTS = int(os.getenv("AWS_RETRY_ATTEMPTS", "6"))
+RETRY_BASE_DELAY = float(os.getenv("AWS_RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("AWS_RETRY_MAX_DELAY", "5"))
+
+TRANSIENT_ERROR_CODES = {
+    "Throttling", "ThrottlingException", "RequestLimitExceeded", "RequestThrottled",
+    "TooManyRequestsException", "ServiceUnavailable", "Unavailable",
+    "InternalError", "InternalFailure", "RequestTimeout", "RequestTimeoutException",
+}
+TRANSIENT_EXCEPTIONS = (
+    botocore.exceptions.EndpointConnectionError,
+    botocore.exceptions.ConnectionClosedError,
+    botocore.exceptions.ReadTimeoutError,
+    botocore.exceptions.ConnectTimeoutError,
+)
+
+_lock = threading.Lock()
+_entries = None
+_inflight = set()
+
+
+def client_token(*parts):
+    """Deterministic 64-char token (the EC2 ClientToken limit) from the given submission parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def sub_token(token, step):
+    """Token for one mutating call inside a larger request (e.g. the NAT gateway of a VPC build)."""
+    return client_token(token, step)
+
+
+def token_tags(token, role):
+    return [{"Key": TOKEN_TAG, "Value": token}, {"Key": ROLE_TAG, "Value": role}]
+
+
+def token_filters(token, role):
+    return [
+        {"Name": f"tag:{TOKEN_TAG}", "Values": [token]},
+        {"Name": f"tag:{ROLE_TAG}", "Values": [role]},
+    ]
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        _entries = {}
+        if os.path.exists(JOURNAL_PATH):
+            with open(JOURNAL_PATH, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    _entries.setdefault(rec["token"], {}).update(rec["fields"])
+    return _entries
+
+
+def lookup(token):
+    with _lock:
+        entry = _load().get(token)
+        return dict(entry) if entry else None
+
+
+def record(token, **fields):
+    with _lock:
+        _load().setdefault(token, {}).update(fields)
+        os.makedirs(os.path.dirname(JOURNAL_PATH) or ".", exist_ok=True)
+        with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"token": token, "ts": time.time(), "fields": fields}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def complete(token, result):
+    record(token, status="complete", result=result)
+
+
+def completed_result(token):
+    entry = lookup(token)
+    if entry and entry.get("status") == "complete":
+        metrics.incr("idempotency.replayed")
+        return entry.get("result")
+    return None
+
+
+def begin(token):
+    """Mark a token as in flight; returns False if the same request is already being processed."""
+    with _lock:
+        if token in _inflight:
+            metrics.incr("idempotency.duplicate_inflight")
+            return False
+        _inflight.add(token)
+        return True
+
+
+def finish(token):
+    with _lock:
+        _inflight.discard(token)
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return True
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in TRANSIENT_ERROR_CODES or status >= 500
+    return False
+
+
+def with_retries(fn, *args, **kwargs):
+    """
+    Call fn with fast exponential backoff (full jitter) on transient errors.
+    Only use for calls made idempotent by a client token, a token tag lookup or a natural key.
+    """
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS or not is_transient(e):
+                raise
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            metrics.incr("idempotency.retries")
+            logger.warning(f"[Retry] {getattr(fn, '__name__', fn)} attempt {attempt} failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
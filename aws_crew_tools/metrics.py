@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# In-process counters, gauges and timings shared by the bot and the AWS tools.
+# Exposed as JSON by the /metrics route in app.py.
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_timings = {}
+
+_TIMING_WINDOW = 500  # samples kept per timing for percentiles
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    with _lock:
+        stats = _timings.get(name)
+        if stats is None:
+            stats = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0,
+                                      "samples": deque(maxlen=_TIMING_WINDOW)}
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["samples"].append(seconds)
+
+
+@contextmanager
+def timer(name, sink=None):
+    """Time a block and record it under `name`; optionally also store the duration in `sink[name]`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed)
+        if sink is not None:
+            sink[name] = round(elapsed, 4)
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def snapshot():
+    with _lock:
+        timings = {}
+        for name, stats in _timings.items():
+            samples = list(stats["samples"])
+            timings[name] = {
+                "count": stats["count"],
+                "avg": round(stats["total"] / stats["count"], 4),
+                "p50": round(_percentile(samples, 50), 4),
+                "p95": round(_percentile(samples, 95), 4),
+                "max": round(stats["max"], 4),
+            }
+        return {"counters": dict(_counters), "gauges": dict(_gauges), "timings": timings}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from aws_crew_tools import metrics
+
+# Multi-region fan-out: run one read-only query per enabled region concurrently, under a global
+# concurrency cap, and yield each region's result as soon as it finishes. A region that exceeds
+# its timeout is reported as timed out instead of holding back the others.
+
+logger = logging.getLogger(__name__)
+
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+FANOUT_REGION_TIMEOUT = float(os.getenv("FANOUT_REGION_TIMEOUT", "10"))
+REGIONS_TTL = int(os.getenv("REGIONS_TTL", "3600"))
+
+_regions_cache = (None, 0.0)
+_regions_lock = threading.Lock()
+
+
+def enabled_regions(region_name=None):
+    """Regions enabled for the account (cached)."""
+    global _regions_cache
+    with _regions_lock:
+        regions, fetched_at = _regions_cache
+        if regions is None or time.monotonic() - fetched_at > REGIONS_TTL:
+            ec2 = boto3.client("ec2", region_name=region_name or os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+            regions = sorted(r["RegionName"] for r in ec2.describe_regions(AllRegions=False)["Regions"])
+            _regions_cache = (regions, time.monotonic())
+        return list(regions)
+
+
+def regional_client(service, region, timeout=FANOUT_REGION_TIMEOUT):
+    # A dedicated session per call: boto3's default session is not safe to share across threads.
+    config = Config(connect_timeout=min(5, timeout), read_timeout=timeout, retries={"max_attempts": 2})
+    return boto3.session.Session().client(service, region_name=region, config=config)
+
+
+def fan_out(fn, service="ec2", regions=None, max_concurrency=FANOUT_CONCURRENCY, region_timeout=FANOUT_REGION_TIMEOUT):
+    """
+    Call fn(region, client) for every region and yield (region, result, error) as regions finish.
+    error is None on success, the raised exception otherwise, or a TimeoutError once a region
+    has been running for longer than region_timeout.
+    """
+    regions = regions or enabled_regions()
+    started_at = {}
+
+    def run(region):
+        started_at[region] = time.monotonic()
+        with metrics.timer(f"fanout.{service}.region"):
+            return fn(region, regional_client(service, region, region_timeout))
+
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    futures = {pool.submit(run, region): region for region in regions}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                region = futures[future]
+                try:
+                    yield region, future.result(), None
+                except Exception as e:
+                    metrics.incr("fanout.region_errors")
+                    yield region, None, e
+            now = time.monotonic()
+            for future in list(pending):
+                region = futures[future]
+                if region in started_at and now - started_at[region] > region_timeout:
+                    pending.discard(future)
+                    future.cancel()
+                    metrics.incr("fanout.region_timeouts")
+                    yield region, None, TimeoutError(f"{region} did not answer within {region_timeout:.0f}s")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def collect_text(fn, service="ec2", empty="No results found."):
+    """Run a fan-out and merge per-region text results into one block (for tools and the agent)."""
+    sections = []
+    for region, result, error in sorted(fan_out(fn, service), key=lambda item: item[0]):
+        if error:
+            sections.append(f"**{region}:** ⚠️ {error}")
+        elif result and result != empty:
+            sections.append(f"**{region}:**\n{result}")
+    return "\n\n".join(sections) if sections else empty
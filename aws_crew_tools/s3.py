@@ -1,3 +1,4 @@
+import os
 import boto3
 import logging
 from botocore.exceptions import ClientError
@@ -5,10 +6,14 @@ from datetime import datetime, timedelta
 from crewai.tools import BaseTool
 from typing import Optional
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, BotoCoreError
+from aws_crew_tools import s3_transfer, s3_teardown
 
 logger = logging.getLogger(__name__)
 
+# Largest object a browser may upload with a presigned POST (a single POST is capped at 5 GB by S3).
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "5120")) * 1024 * 1024)
+
 def create_s3_bucket(bucket_name, region, versioning=False, encryption="none", block_public_access=True, tags=None):
     try:
         s3_client = boto3.client("s3", region_name=region)
@@ -100,21 +105,26 @@ def list_s3_buckets():
 
 
 def upload_file_to_s3(bucket_name, file_bytes, file_name, prefix="", acl="private", storage_class="STANDARD"):
+    """
+    file_bytes may be bytes or a readable stream; large bodies go up as a parallel,
+    checksummed multipart upload (see s3_transfer).
+    """
     try:
-        s3_client = boto3.client("s3")
         s3_key = f"{prefix}{file_name}" if prefix else file_name
 
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_bytes,
-            ACL=acl,
-            StorageClass=storage_class
+        result = s3_transfer.upload(
+            bucket_name, s3_key, file_bytes,
+            extra_args={"ACL": acl, "StorageClass": storage_class}
         )
 
-        return True, f"✅ File `{file_name}` uploaded to `{bucket_name}/{s3_key}` with ACL `{acl}` and storage class `{storage_class}`."
+        if result["skipped"]:
+            return True, f"♻️ File `{file_name}` is already present at `{bucket_name}/{s3_key}` (same SHA-256), so the upload was skipped."
 
-    except ClientError as e:
+        return True, (f"✅ File `{file_name}` uploaded to `{bucket_name}/{s3_key}` with ACL `{acl}` and storage class `{storage_class}` "
+                      f"({result['bytes']} bytes, {result['parts']} part(s), SHA-256 verified).")
+
+    # BotoCoreError: connection and read timeouts; ValueError: a stream that needs more than MAX_PARTS parts.
+    except (ClientError, BotoCoreError, s3_transfer.ChecksumMismatch, ValueError) as e:
         logger.error(e)
         return False, f"❌ Error uploading file: {e}"
 
@@ -134,6 +144,43 @@ def generate_presigned_download_url(bucket_name, object_key, expires_in=3600):
         return False, f"❌ Error generating download URL: {e}"
 
 
+def generate_presigned_upload_post(bucket_name, file_name, prefix="", acl="private", storage_class="STANDARD",
+                                   max_size=None, expires_in=900):
+    """
+    Presigned POST so a browser can upload straight to S3. The policy pins the key prefix,
+    ACL and storage class and caps the object size; S3 rejects anything else.
+    """
+    try:
+        s3_client = boto3.client("s3")
+        s3_key = f"{prefix}{file_name}" if prefix else file_name
+        max_size = max_size or UPLOAD_MAX_BYTES
+        fields = {"acl": acl, "x-amz-storage-class": storage_class}
+        conditions = [
+            ["starts-with", "$key", prefix or ""],
+            {"acl": acl},
+            {"x-amz-storage-class": storage_class},
+            ["content-length-range", 1, max_size],
+        ]
+        post = s3_client.generate_presigned_post(
+            Bucket=bucket_name, Key=s3_key, Fields=fields, Conditions=conditions, ExpiresIn=expires_in
+        )
+        return True, {"url": post["url"], "fields": post["fields"], "key": s3_key, "max_size": max_size}
+
+    except ClientError as e:
+        logger.error(e)
+        return False, f"❌ Error generating upload policy: {e}"
+
+
+def get_s3_object_info(bucket_name, object_key):
+    """(True, head_object response) if the object exists."""
+    try:
+        s3_client = boto3.client("s3")
+        return True, s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    except ClientError as e:
+        logger.error(e)
+        return False, f"❌ Object `{object_key}` not found in `{bucket_name}`: {e}"
+
+
 class CreateBucketTool(BaseTool):
     name: str = "CreateS3Bucket"
     description: str = "Creates a new S3 bucket with optional versioning and encryption."
@@ -190,26 +237,22 @@ class ListS3BucketsTool(BaseTool):
     
 class TerminateBucketTool(BaseTool):
     name: str = "TerminateS3Bucket"
-    description: str = "Deletes an S3 bucket and all its contents."
+    description: str = ("Deletes an S3 bucket and all its contents, including object versions and delete markers. "
+                        "Optional 'strategy': 'auto' (default), 'delete' or 'lifecycle' (let S3 expire objects in huge buckets). "
+                        "'lifecycle' also needs 'confirm_lifecycle': true, which may only be set after the user "
+                        "explicitly agreed to it in this conversation.")
 
     def _run(self, **kwargs) -> str:
         bucket_name = kwargs.get("bucket_name")
+        strategy = kwargs.get("strategy", "auto")
         if not bucket_name:
             return "❌ Please provide the 'bucket_name' to delete."
+        if strategy not in ("auto", "delete", "lifecycle"):
+            return "❌ 'strategy' must be one of: auto, delete, lifecycle."
 
-        s3 = boto3.resource("s3")
-        bucket = s3.Bucket(bucket_name)
-
-        try:
-            # Check if the bucket exists
-            bucket.load()
+        def progress(deleted, failed):
+            logger.info(f"[TerminateS3Bucket] {bucket_name}: {deleted} deleted, {failed} failed")
 
-            # Empty the bucket (delete all objects)
-            bucket.objects.all().delete()
-
-            # Delete the bucket itself
-            bucket.delete()
-
-            return f"✅ Bucket `{bucket_name}` and all its contents have been deleted."
-        except ClientError as e:
-            return f"❌ Failed to delete bucket `{bucket_name}`: {e}"
\ No newline at end of file
+        confirmed = str(kwargs.get("confirm_lifecycle", False)).lower() == "true"
+        success, message = s3_teardown.terminate_bucket(bucket_name, strategy, progress, confirm_lifecycle=confirmed)
+        return message
@@ -0,0 +1,400 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from urllib.parse import unquote_plus
+import boto3
+import numpy as np
+from numpy.dtypes import StringDType
+from aws_crew_tools import metrics
+
+# Bucket statistics from S3 Inventory reports instead of listing objects.
+# The newest manifest of the bucket's inventory configuration is located, its data files
+# (gzip CSV or Parquet) are streamed in row batches, and each batch is folded into per-prefix,
+# per-storage-class and age-bucket totals with numpy, a whole batch at a time. Memory stays
+# bounded by the batch size and the number of distinct prefixes kept; Parquet files, which are
+# read from the footer, are spooled to a temporary file rather than into memory. Results are
+# cached on disk so repeat questions are instant.
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = int(os.getenv("INVENTORY_BATCH_ROWS", "50000"))
+PREFIX_DEPTH = int(os.getenv("INVENTORY_PREFIX_DEPTH", "1"))
+MAX_PREFIXES = int(os.getenv("INVENTORY_MAX_PREFIXES", "10000"))
+CACHE_DIR = os.getenv("INVENTORY_CACHE_DIR", os.path.join("state", "inventory"))
+CACHE_TTL = int(os.getenv("INVENTORY_CACHE_TTL", str(6 * 3600)))
+SPOOL_CHUNK = 8 * 1024 * 1024
+
+AGE_BUCKETS = [(7, "< 7 days"), (30, "7–30 days"), (90, "30–90 days"), (365, "90–365 days"), (None, "> 1 year")]
+OTHER_PREFIX = "(other prefixes)"
+
+
+class InventoryNotConfigured(Exception):
+    pass
+
+
+# --- Opening report files -------------------------------------------------------------------
+
+class S3Opener:
+    """Reads inventory files from the destination bucket."""
+
+    def __init__(self, bucket, client=None):
+        self.bucket = bucket
+        self.client = client or boto3.client("s3")
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def list_dirs(self, prefix):
+        paginator = self.client.get_paginator("list_objects_v2")
+        dirs = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            dirs.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+        return dirs
+
+
+class LocalOpener:
+    """Reads the same layout from a local directory (report copies, fixtures)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), "rb")
+
+    def list_dirs(self, prefix):
+        path = os.path.join(self.root, prefix)
+        if not os.path.isdir(path):
+            return []
+        return [f"{prefix}{name}/" for name in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, name))]
+
+
+def _bucket_from_arn(arn):
+    return arn.split(":::", 1)[-1]
+
+
+def inventory_destination(bucket_name, client=None):
+    """(destination bucket, manifest folder prefix) of the bucket's first enabled inventory configuration."""
+    client = client or boto3.client("s3")
+    configs = client.list_bucket_inventory_configurations(Bucket=bucket_name).get("InventoryConfigurationList", [])
+    enabled = [c for c in configs if c.get("IsEnabled")]
+    if not enabled:
+        raise InventoryNotConfigured(f"Bucket `{bucket_name}` has no enabled S3 Inventory configuration.")
+    config = enabled[0]
+    destination = config["Destination"]["S3BucketDestination"]
+    prefix = destination.get("Prefix", "")
+    prefix = f"{prefix.rstrip('/')}/" if prefix else ""
+    return _bucket_from_arn(destination["Bucket"]), f"{prefix}{bucket_name}/{config['Id']}/"
+
+
+def latest_manifest_key(opener, config_prefix):
+    # Report folders are named by delivery time (YYYY-MM-DDTHH-MMZ), so the newest sorts last.
+    dated = [d for d in opener.list_dirs(config_prefix) if d.rstrip("/").rsplit("/", 1)[-1][:4].isdigit()]
+    if not dated:
+        raise InventoryNotConfigured(f"No inventory report delivered under `{config_prefix}` yet.")
+    return f"{max(dated)}manifest.json"
+
+
+def load_manifest(opener, manifest_key):
+    with opener.open(manifest_key) as f:
+        return json.loads(f.read())
+
+
+# --- Streaming rows -------------------------------------------------------------------------
+
+def _csv_batches(stream, columns):
+    # CSV reports have no header; the column order comes from the manifest's fileSchema.
+    text = io.TextIOWrapper(gzip.GzipFile(fileobj=stream), encoding="utf-8", newline="")
+    batch = {name: [] for name in columns}
+    count = 0
+    for row in csv.reader(text):
+        for name, value in zip(columns, row):
+            batch[name].append(value)
+        count += 1
+        if count == BATCH_ROWS:
+            yield batch
+            batch = {name: [] for name in columns}
+            count = 0
+    if count:
+        yield batch
+
+
+def _parquet_batches(stream, columns):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet inventory reports need the optional 'pyarrow' package.")
+    seekable = getattr(stream, "seekable", None)
+    spool = None
+    if not (seekable and seekable()):
+        # The reader needs random access (footer first); keep the copy on disk, not in memory.
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, spool, SPOOL_CHUNK)
+        spool.seek(0)
+    try:
+        parquet = pq.ParquetFile(spool or stream)
+        wanted = [c for c in columns if c in parquet.schema_arrow.names]
+        for record_batch in parquet.iter_batches(batch_size=BATCH_ROWS, columns=wanted):
+            yield {name: record_batch.column(name).to_numpy(zero_copy_only=False) for name in wanted}
+    finally:
+        if spool:
+            spool.close()
+
+
+# Manifest schema names -> the Parquet column names used by S3 Inventory.
+_PARQUET_COLUMNS = {"Key": "key", "Size": "size", "LastModifiedDate": "last_modified_date",
+                    "StorageClass": "storage_class", "IsLatest": "is_latest", "IsDeleteMarker": "is_delete_marker"}
+
+
+def file_batches(opener, manifest):
+    file_format = manifest.get("fileFormat", "CSV").upper()
+    schema = [c.strip() for c in manifest.get("fileSchema", "").split(",")]
+    for entry in manifest.get("files", []):
+        with opener.open(entry["key"]) as stream:
+            if file_format == "CSV":
+                yield from _csv_batches(stream, schema)
+            elif file_format == "PARQUET":
+                wanted = [_PARQUET_COLUMNS[c] for c in schema if c in _PARQUET_COLUMNS]
+                for batch in _parquet_batches(stream, wanted):
+                    yield {name: batch.get(col, []) for name, col in _PARQUET_COLUMNS.items() if col in batch}
+            else:
+                raise RuntimeError(f"Unsupported inventory format {file_format}; use CSV or Parquet.")
+
+
+# --- Aggregation ----------------------------------------------------------------------------
+
+_STRING = StringDType()
+_SLASH = np.array("/", dtype=_STRING)
+_AGE_LIMITS = np.array([days * 86400 for days, _ in AGE_BUCKETS if days], dtype=np.float64)
+
+
+def _missing(values):
+    # Elementwise comparisons on an object array.
+    return (values == None) | (values == "")
+
+
+def _strings(values, n, default):
+    if values is None or not len(values):
+        return np.full(n, default, dtype=_STRING)
+    values = np.array(values, dtype=object)
+    values[_missing(values)] = default
+    return values.astype(_STRING)
+
+
+def _ints(values, n):
+    if values is None or not len(values):
+        return np.zeros(n, dtype=np.int64)
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.nan_to_num(values).astype(np.int64)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    values = values.astype(object)
+    values[_missing(values)] = 0
+    return values.astype(np.int64)
+
+
+def _bools(values):
+    values = np.asarray(values)
+    if values.dtype == bool:
+        return values
+    values = values.astype(object)
+    return (values == True) | (values == "true") | (values == "TRUE") | (values == "True")
+
+
+def _epoch_seconds(values, n):
+    """Unix seconds as float64, NaN where the date is missing."""
+    if values is None or not len(values):
+        return np.full(n, np.nan)
+    values = np.asarray(values)
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64) / 1000  # Parquet millis
+    if values.dtype.kind != "M":
+        # CSV: 2024-01-02T03:04:05.000Z; the first 19 characters are enough, "" becomes NaT.
+        values = _strings(values, n, "").astype("U19").astype("datetime64[s]")
+    missing = np.isnat(values)
+    seconds = values.astype("datetime64[s]").astype(np.int64).astype(np.float64)
+    seconds[missing] = np.nan
+    return seconds
+
+
+def _totals(labels, sizes):
+    """Distinct labels of a batch with their object counts and byte sums."""
+    unique, inverse = np.unique(labels, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    sums = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(sums, inverse, sizes)
+    return zip(unique.tolist(), counts.tolist(), sums.tolist())
+
+
+class InventoryStats:
+    def __init__(self, now=None, prefix_depth=PREFIX_DEPTH, max_prefixes=MAX_PREFIXES, url_encoded_keys=False):
+        self.now = now or time.time()
+        self.prefix_depth = prefix_depth
+        self.max_prefixes = max_prefixes
+        # CSV reports URL-encode keys; Parquet reports do not.
+        self.url_encoded_keys = url_encoded_keys
+        self.objects = 0
+        self.bytes = 0
+        self.prefixes = {}         # prefix -> [count, bytes]
+        self.storage_classes = {}  # class -> [count, bytes]
+        self.ages = {label: [0, 0] for _, label in AGE_BUCKETS}
+
+    def _prefixes(self, keys):
+        # The first prefix_depth path segments with their slashes; shorter keys are "(root)".
+        prefixes = np.zeros(len(keys), dtype=_STRING)
+        complete = np.ones(len(keys), dtype=bool)
+        rest = keys
+        for _ in range(self.prefix_depth):
+            head, sep, rest = np.strings.partition(rest, _SLASH)
+            complete &= sep == _SLASH
+            prefixes = np.strings.add(prefixes, np.strings.add(head, sep))
+        return np.where(complete, prefixes, "(root)")
+
+    def add_batch(self, batch):
+        n = len(batch.get("Key", []))
+        if not n:
+            return
+        # Versioned reports list every version; only count what a listing would show.
+        keep = np.ones(n, dtype=bool)
+        if batch.get("IsLatest") is not None and len(batch["IsLatest"]):
+            keep &= _bools(batch["IsLatest"])
+        if batch.get("IsDeleteMarker") is not None and len(batch["IsDeleteMarker"]):
+            keep &= ~_bools(batch["IsDeleteMarker"])
+        sizes = _ints(batch.get("Size"), n)[keep]
+        self.objects += len(sizes)
+        self.bytes += int(sizes.sum())
+
+        for prefix, count, size in _totals(self._prefixes(_strings(batch["Key"], n, "")[keep]), sizes):
+            if self.url_encoded_keys and prefix != "(root)":
+                prefix = unquote_plus(prefix)
+            if prefix not in self.prefixes and len(self.prefixes) >= self.max_prefixes:
+                prefix = OTHER_PREFIX
+            totals = self.prefixes.setdefault(prefix, [0, 0])
+            totals[0] += count
+            totals[1] += size
+
+        for storage_class, count, size in _totals(_strings(batch.get("StorageClass"), n, "STANDARD")[keep], sizes):
+            totals = self.storage_classes.setdefault(storage_class, [0, 0])
+            totals[0] += count
+            totals[1] += size
+
+        seconds = _epoch_seconds(batch.get("LastModifiedDate"), n)[keep]
+        dated = ~np.isnan(seconds)
+        buckets = np.searchsorted(_AGE_LIMITS, self.now - seconds[dated], side="right")
+        for index, count, size in _totals(buckets, sizes[dated]):
+            totals = self.ages[AGE_BUCKETS[index][1]]
+            totals[0] += count
+            totals[1] += size
+
+    def to_dict(self, top=20):
+        ranked = sorted(self.prefixes.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "objects": self.objects,
+            "bytes": self.bytes,
+            "prefixes": [{"prefix": p, "objects": c, "bytes": b} for p, (c, b) in ranked[:top]],
+            "prefix_count": len(self.prefixes),
+            "storage_classes": {k: {"objects": c, "bytes": b} for k, (c, b) in sorted(self.storage_classes.items())},
+            "ages": {label: {"objects": c, "bytes": b} for label, (c, b) in self.ages.items()},
+        }
+
+
+def compute_stats(opener, manifest, now=None):
+    stats = InventoryStats(now=now, url_encoded_keys=manifest.get("fileFormat", "CSV").upper() == "CSV")
+    rows = 0
+    with metrics.timer("s3.inventory.ingest"):
+        for batch in file_batches(opener, manifest):
+            stats.add_batch(batch)
+            rows += len(batch.get("Key", []))
+    metrics.incr("s3.inventory.rows", rows)
+    result = stats.to_dict()
+    result["report_rows"] = rows
+    return result
+
+
+# --- Cache ----------------------------------------------------------------------------------
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_path(bucket_name):
+    return os.path.join(CACHE_DIR, f"{bucket_name}.json")
+
+
+def _cached(bucket_name, max_age):
+    with _cache_lock:
+        entry = _cache.get(bucket_name)
+        if entry is None and os.path.exists(_cache_path(bucket_name)):
+            try:
+                with open(_cache_path(bucket_name), encoding="utf-8") as f:
+                    entry = _cache[bucket_name] = json.load(f)
+            except ValueError:
+                entry = None
+        if entry and time.time() - entry.get("computed_at", 0) <= max_age:
+            return entry
+        return None
+
+
+def _store(bucket_name, stats):
+    with _cache_lock:
+        _cache[bucket_name] = stats
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{_cache_path(bucket_name)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+        os.replace(tmp, _cache_path(bucket_name))
+
+
+def get_bucket_stats(bucket_name, max_age=CACHE_TTL, opener=None, config_prefix=None):
+    """
+    Stats for a bucket from its latest inventory report, cached for `max_age` seconds.
+    Pass opener/config_prefix (e.g. a LocalOpener over a report copy) to skip the S3 lookup.
+    """
+    cached = _cached(bucket_name, max_age)
+    if cached:
+        metrics.incr("s3.inventory.cache_hits")
+        return cached
+
+    if opener is None:
+        destination, config_prefix = inventory_destination(bucket_name)
+        opener = S3Opener(destination)
+    manifest_key = latest_manifest_key(opener, config_prefix or "")
+    manifest = load_manifest(opener, manifest_key)
+    stats = compute_stats(opener, manifest)
+    stats.update({
+        "bucket": bucket_name,
+        "report": manifest_key.rsplit("/", 2)[-2],
+        "format": manifest.get("fileFormat", "CSV"),
+        "computed_at": time.time(),
+    })
+    _store(bucket_name, stats)
+    return stats
+
+
+def _human(num_bytes):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+def format_stats(stats, top=10):
+    lines = [
+        f"📊 **Bucket `{stats['bucket']}`** (inventory report {stats['report']})",
+        f"🗂️ **Objects:** {stats['objects']:,}   💾 **Size:** {_human(stats['bytes'])}",
+        "",
+        "**Largest prefixes:**",
+    ]
+    lines += [f"- `{p['prefix']}` — {_human(p['bytes'])} ({p['objects']:,} objects)" for p in stats["prefixes"][:top]]
+    lines += ["", "**Storage classes:**"]
+    lines += [f"- {name}: {_human(v['bytes'])} ({v['objects']:,})" for name, v in stats["storage_classes"].items()]
+    lines += ["", "**Age:**"]
+    lines += [f"- {label}: {_human(v['bytes'])} ({v['objects']:,})" for label, v in stats["ages"].items() if v["objects"]]
+    return "\n".join(lines)
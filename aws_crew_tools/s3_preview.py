@@ -0,0 +1,156 @@
+import os
+import csv
+import json
+import zlib
+import codecs
+import logging
+import boto3
+from botocore.exceptions import ClientError
+from aws_crew_tools import metrics
+
+# Object previews without downloading the object.
+# A ranged GET fetches only the first S3_PREVIEW_KB, decoding (and gunzipping) chunk by chunk
+# and stopping as soon as enough lines are in. CSV becomes a table, JSON Lines a list of
+# records, everything else plain text. With S3_PREVIEW_SELECT=true, CSV/JSON objects are
+# previewed with S3 Select first (falls back to the ranged GET where Select is unavailable).
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_BYTES = int(float(os.getenv("S3_PREVIEW_KB", "64")) * 1024)
+PREVIEW_ROWS = int(os.getenv("S3_PREVIEW_ROWS", "20"))
+USE_SELECT = os.getenv("S3_PREVIEW_SELECT", "false").lower() == "true"
+CHUNK = 8192
+
+_CSV_EXT = (".csv", ".tsv")
+_JSONL_EXT = (".jsonl", ".ndjson")
+_JSON_EXT = (".json",)
+
+
+def _kind(key):
+    name = key.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(_CSV_EXT):
+        return "csv"
+    if name.endswith(_JSONL_EXT):
+        return "jsonl"
+    if name.endswith(_JSON_EXT):
+        return "json"
+    return "text"
+
+
+def _read_lines(body, gzipped, max_lines):
+    """Decode a ranged body incrementally; returns (lines, body fully read, unterminated tail)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    pending, lines = "", []
+    exhausted = True
+    for chunk in body.iter_chunks(CHUNK):
+        if inflater:
+            try:
+                chunk = inflater.decompress(chunk)
+            except zlib.error:
+                break  # the range cut the stream mid-block
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        lines.extend(line.rstrip("\r") for line in complete)
+        if len(lines) > max_lines:
+            exhausted = False
+            break
+    body.close()
+    return lines, exhausted, pending
+
+
+def ranged_preview(bucket_name, object_key, max_bytes=PREVIEW_BYTES, max_rows=PREVIEW_ROWS, client=None):
+    client = client or boto3.client("s3")
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=object_key, Range=f"bytes=0-{max_bytes - 1}")
+    except ClientError as e:
+        # S3 answers any range of an empty object with 416 InvalidRange; the whole (empty) object is fine.
+        if e.response["Error"]["Code"] != "InvalidRange":
+            raise
+        response = client.get_object(Bucket=bucket_name, Key=object_key)
+    total = int(response.get("ContentRange", "/0").rsplit("/", 1)[-1] or 0) or response.get("ContentLength", 0)
+    gzipped = object_key.lower().endswith(".gz") or response.get("ContentEncoding") == "gzip"
+    lines, exhausted, tail = _read_lines(response["Body"], gzipped, max_rows + 1)
+    whole_object = exhausted and response.get("ContentLength", 0) >= total
+    if whole_object and tail:
+        lines.append(tail)  # the last line is only complete if the range covered the object
+    truncated = not whole_object or len(lines) > max_rows + 1
+    metrics.incr("s3.preview.bytes", response.get("ContentLength", 0))
+
+    preview = {"size": total, "content_type": response.get("ContentType"), "via": "range", "truncated": truncated}
+    kind = _kind(object_key)
+    if kind == "csv":
+        delimiter = "\t" if ".tsv" in object_key.lower()[-7:] else ","
+        rows = list(csv.reader(lines[:max_rows + 1], delimiter=delimiter))
+        preview.update(kind="table", columns=rows[0] if rows else [], rows=rows[1:])
+    elif kind in ("jsonl", "json"):
+        records = []
+        for line in lines[:max_rows]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records = None
+                break
+        if records and all(isinstance(r, dict) for r in records):
+            columns = list(dict.fromkeys(k for r in records for k in r))
+            preview.update(kind="table", columns=columns,
+                           rows=[[_cell(r.get(c)) for c in columns] for r in records])
+        else:
+            preview.update(kind="text", text="\n".join(lines[:max_rows]))
+    else:
+        preview.update(kind="text", text="\n".join(lines[:max_rows]))
+    return preview
+
+
+def _cell(value):
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def select_preview(bucket_name, object_key, max_rows=PREVIEW_ROWS, client=None):
+    """First rows via S3 Select (CSV with header, or JSON Lines)."""
+    client = client or boto3.client("s3")
+    kind = _kind(object_key)
+    if kind == "csv":
+        input_serialization = {"CSV": {"FileHeaderInfo": "USE"}}
+    elif kind == "jsonl":
+        input_serialization = {"JSON": {"Type": "LINES"}}
+    else:
+        input_serialization = {"JSON": {"Type": "DOCUMENT"}}
+    if object_key.lower().endswith(".gz"):
+        input_serialization["CompressionType"] = "GZIP"
+
+    response = client.select_object_content(
+        Bucket=bucket_name, Key=object_key, ExpressionType="SQL",
+        Expression=f"SELECT * FROM S3Object s LIMIT {int(max_rows)}",
+        InputSerialization=input_serialization, OutputSerialization={"JSON": {"RecordDelimiter": "\n"}},
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending, records = "", []
+    for event in response["Payload"]:
+        if "Records" in event:
+            pending += decoder.decode(event["Records"]["Payload"])
+            *complete, pending = pending.split("\n")
+            records.extend(json.loads(line) for line in complete if line.strip())
+        elif "Stats" in event:
+            metrics.incr("s3.preview.bytes", event["Stats"]["Details"].get("BytesScanned", 0))
+    columns = list(dict.fromkeys(k for r in records for k in r))
+    return {"kind": "table", "columns": columns, "rows": [[_cell(r.get(c)) for c in columns] for r in records],
+            "via": "select", "truncated": len(records) >= max_rows}
+
+
+def preview_object(bucket_name, object_key, max_bytes=PREVIEW_BYTES, max_rows=PREVIEW_ROWS, use_select=USE_SELECT):
+    """Returns (success, preview dict | error message) like the other S3 helpers."""
+    try:
+        client = boto3.client("s3")
+        with metrics.timer("s3.preview"):
+            if use_select and _kind(object_key) != "text":
+                try:
+                    return True, select_preview(bucket_name, object_key, max_rows, client)
+                except ClientError as e:
+                    logger.info(f"[S3Preview] S3 Select unavailable for {object_key} ({e}); using a ranged GET")
+            return True, ranged_preview(bucket_name, object_key, max_bytes, max_rows, client)
+    except ClientError as e:
+        logger.error(e)
+        return False, f"❌ Error previewing `{object_key}`: {e}"
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from aws_crew_tools import metrics
+
+# Bucket teardown.
+# Every object version and delete marker is listed page by page and removed with delete_objects
+# batches of 1,000 keys, several batches in flight at once, then incomplete multipart uploads are
+# aborted and the bucket is deleted. Throttled requests are retried by botocore (adaptive mode).
+# For buckets too large to empty from here, a lifecycle rule can let S3 expire everything instead;
+# that only happens when the caller explicitly confirms it, since it changes the bucket's lifecycle
+# configuration and cannot be stopped halfway. The bucket can be deleted once it is empty.
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH = 1000  # delete_objects limit
+TEARDOWN_CONCURRENCY = int(os.getenv("S3_TEARDOWN_CONCURRENCY", "8"))
+LIFECYCLE_THRESHOLD = int(os.getenv("S3_TEARDOWN_LIFECYCLE_THRESHOLD", "5000000"))
+LIFECYCLE_RULE_ID = "cloudbuddy-teardown"
+
+
+def _client(bucket_name):
+    region = boto3.client("s3").get_bucket_location(Bucket=bucket_name)["LocationConstraint"] or "us-east-1"
+    # The only retry layer for teardown calls; delete_objects of the same versions is safe to repeat.
+    config = Config(max_pool_connections=TEARDOWN_CONCURRENCY + 2, retries={"mode": "adaptive", "max_attempts": 10})
+    return boto3.client("s3", region_name=region, config=config), region
+
+
+def estimated_object_count(bucket_name, region):
+    """Object count (all versions) from the daily CloudWatch storage metric; None if not published yet."""
+    cloudwatch = boto3.client("cloudwatch", region_name=region)
+    now = datetime.now(timezone.utc)
+    response = cloudwatch.get_metric_statistics(
+        Namespace="AWS/S3", MetricName="NumberOfObjects",
+        Dimensions=[{"Name": "BucketName", "Value": bucket_name}, {"Name": "StorageType", "Value": "AllStorageTypes"}],
+        StartTime=now - timedelta(days=3), EndTime=now, Period=86400, Statistics=["Average"],
+    )
+    points = sorted(response.get("Datapoints", []), key=lambda p: p["Timestamp"])
+    return int(points[-1]["Average"]) if points else None
+
+
+def _version_batches(client, bucket_name):
+    batch = []
+    for page in client.get_paginator("list_object_versions").paginate(Bucket=bucket_name):
+        for item in page.get("Versions", []) + page.get("DeleteMarkers", []):
+            batch.append({"Key": item["Key"], "VersionId": item["VersionId"]})
+            if len(batch) == DELETE_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _delete_batch(client, bucket_name, batch):
+    response = client.delete_objects(Bucket=bucket_name, Delete={"Objects": batch, "Quiet": True})
+    return len(batch), response.get("Errors", [])
+
+
+def empty_bucket(bucket_name, client=None, progress=None, concurrency=TEARDOWN_CONCURRENCY):
+    """
+    Delete every version and delete marker, then abort incomplete multipart uploads.
+    progress(deleted, failed) is called after each batch. Returns (deleted, errors).
+    """
+    client = client or _client(bucket_name)[0]
+    deleted, errors = 0, []
+
+    def collect(done):
+        nonlocal deleted
+        for future in done:
+            count, failed = future.result()
+            deleted += count - len(failed)
+            errors.extend(failed)
+            metrics.incr("s3.teardown.deleted", count - len(failed))
+        if progress:
+            progress(deleted, len(errors))
+
+    with metrics.timer("s3.teardown.empty"), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        for batch in _version_batches(client, bucket_name):
+            # Keep listing ahead of the deletes, but never more than 2x concurrency batches in memory.
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(pool.submit(_delete_batch, client, bucket_name, batch))
+        collect(in_flight)
+
+    for page in client.get_paginator("list_multipart_uploads").paginate(Bucket=bucket_name):
+        for upload in page.get("Uploads", []):
+            client.abort_multipart_upload(Bucket=bucket_name, Key=upload["Key"], UploadId=upload["UploadId"])
+            metrics.incr("s3.teardown.aborted_uploads")
+
+    if errors:
+        metrics.incr("s3.teardown.errors", len(errors))
+    return deleted, errors
+
+
+def _existing_rules(client, bucket_name):
+    try:
+        rules = client.get_bucket_lifecycle_configuration(Bucket=bucket_name).get("Rules", [])
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+            raise
+        return []
+    return [r for r in rules if not r.get("ID", "").startswith(LIFECYCLE_RULE_ID)]
+
+
+def schedule_expiration(bucket_name, client=None):
+    """
+    Lifecycle rules that make S3 expire all current and noncurrent versions, delete markers and uploads.
+    put_bucket_lifecycle_configuration replaces the whole configuration, so the bucket's other rules are kept.
+    """
+    client = client or _client(bucket_name)[0]
+    client.put_bucket_lifecycle_configuration(
+        Bucket=bucket_name,
+        LifecycleConfiguration={"Rules": _existing_rules(client, bucket_name) + [
+            {
+                "ID": LIFECYCLE_RULE_ID, "Status": "Enabled", "Filter": {"Prefix": ""},
+                "Expiration": {"Days": 1},
+                "NoncurrentVersionExpiration": {"NoncurrentDays": 1},
+                "AbortIncompleteMultipartUpload": {"DaysAfterInitiation": 1},
+            },
+            {
+                "ID": f"{LIFECYCLE_RULE_ID}-markers", "Status": "Enabled", "Filter": {"Prefix": ""},
+                "Expiration": {"ExpiredObjectDeleteMarker": True},
+            },
+        ]},
+    )
+    metrics.incr("s3.teardown.lifecycle_scheduled")
+
+
+def terminate_bucket(bucket_name, strategy="auto", progress=None, confirm_lifecycle=False):
+    """
+    Empty and delete a bucket. strategy: "delete" (batch deletes), "lifecycle" (let S3 expire the
+    objects; needs confirm_lifecycle=True) or "auto" (batch deletes, but stops and suggests the
+    lifecycle strategy when CloudWatch reports more than S3_TEARDOWN_LIFECYCLE_THRESHOLD objects).
+    Returns (success, message) like the other S3 helpers.
+    """
+    try:
+        client, region = _client(bucket_name)
+        if strategy == "auto":
+            try:
+                count = estimated_object_count(bucket_name, region)
+            except ClientError as e:
+                logger.warning(f"[S3Teardown] No object count for {bucket_name}: {e}")
+                count = None
+            logger.info(f"[S3Teardown] {bucket_name}: ~{count} objects")
+            if count and count > LIFECYCLE_THRESHOLD:
+                return False, (f"⚠️ Bucket `{bucket_name}` holds about {count:,} objects, too many to delete one batch "
+                               f"at a time. Nothing was deleted. If you agree, I can add a lifecycle rule that lets S3 "
+                               f"expire everything within 1–2 days (strategy 'lifecycle', confirmed); or ask for "
+                               f"strategy 'delete' to delete them from here anyway.")
+            strategy = "delete"
+
+        if strategy == "lifecycle":
+            if not confirm_lifecycle:
+                return False, (f"⚠️ Expiring `{bucket_name}` with a lifecycle rule removes every object and version "
+                               f"and cannot be stopped once S3 starts. Please confirm explicitly to go ahead.")
+            schedule_expiration(bucket_name, client)
+            return True, (f"⏳ Bucket `{bucket_name}` is too large to empty quickly, so a lifecycle rule now expires "
+                          f"all objects, versions and delete markers (usually within 1–2 days). "
+                          f"Delete the bucket again once it is empty.")
+
+        started = time.perf_counter()
+        deleted, errors = empty_bucket(bucket_name, client, progress)
+        if errors:
+            sample = ", ".join(f"{e['Key']} ({e.get('Code')})" for e in errors[:5])
+            return False, f"❌ Emptied `{bucket_name}` partially: {len(errors)} object(s) could not be deleted, e.g. {sample}"
+        client.delete_bucket(Bucket=bucket_name)
+        return True, (f"✅ Bucket `{bucket_name}` and all its contents have been deleted "
+                      f"({deleted} object versions in {time.perf_counter() - started:.1f}s).")
+
+    except ClientError as e:
+        logger.error(e)
+        return False, f"❌ Failed to delete bucket `{bucket_name}`: {e}"
@@ -0,0 +1,327 @@
+import io
+import os
+import time
+import base64
+import hashlib
+import logging
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from aws_crew_tools import idempotency, metrics
+
+# Upload engine for S3.
+# Bodies up to the multipart threshold go up in one put_object; larger ones are split into parts
+# uploaded in parallel. Every request carries a SHA-256 checksum that S3 verifies on receipt, and
+# the checksum S3 reports for the finished object is compared with the one computed locally.
+# The body is read sequentially with a bounded number of parts in memory, so streams of unknown
+# size (the Flask upload stream) work as well as bytes.
+# Seekable bodies are hashed first and compared with the existing object (one HEAD); identical
+# content in the requested storage class is not sent again, only the requested ACL is applied.
+# The full-object SHA-256 is stored as x-amz-meta-sha256 for that.
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MIN_PART_SIZE = 5 * MB       # S3 minimum for every part but the last
+MAX_PARTS = 10000
+
+PART_SIZE = int(float(os.getenv("S3_PART_SIZE_MB", "16")) * MB)
+MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+MULTIPART_THRESHOLD = int(float(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * MB)
+DEDUPE = os.getenv("S3_DEDUPE", "true").lower() == "true"
+HASH_CHUNK = 8 * MB
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class SizeMismatch(ValueError):
+    pass
+
+
+def s3_client(region_name=None):
+    # Enough pooled connections for every part worker.
+    config = Config(max_pool_connections=MAX_CONCURRENCY + 2, retries={"mode": "standard"})
+    return boto3.client("s3", region_name=region_name, config=config)
+
+
+def sha256_b64(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def composite_checksum(part_checksums):
+    """The checksum S3 reports for a multipart object: sha256 over the part digests, plus '-<parts>'."""
+    digests = b"".join(base64.b64decode(c) for c in part_checksums)
+    return f"{sha256_b64(digests)}-{len(part_checksums)}"
+
+
+def _as_stream(body):
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return io.BytesIO(body)
+    return body
+
+
+def _read_exact(stream, size):
+    # Streams may return short reads; keep reading until `size` bytes or EOF.
+    chunks, remaining = [], size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except AttributeError:
+        # e.g. SpooledTemporaryFile before Python 3.11
+        try:
+            stream.tell()
+            return hasattr(stream, "seek")
+        except Exception:
+            return False
+
+
+def _hash_stream(stream):
+    """Full-object SHA-256 and size of the rest of a seekable stream; leaves the position unchanged."""
+    start = stream.tell()
+    digest, size = hashlib.sha256(), 0
+    while True:
+        chunk = stream.read(HASH_CHUNK)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(start)
+    return digest, size
+
+
+def _existing_object(client, bucket, key):
+    try:
+        return client.head_object(Bucket=bucket, Key=key, ChecksumMode="ENABLED")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound", "403", "AccessDenied"):
+            return None
+        raise
+
+
+def _same_content(head, size, digest, storage_class=None):
+    if not head or head.get("ContentLength") != size:
+        return False
+    # HEAD leaves StorageClass out for STANDARD; another class means the object must be rewritten.
+    if head.get("StorageClass", "STANDARD") != (storage_class or "STANDARD"):
+        return False
+    if head.get("Metadata", {}).get("sha256") == digest.hexdigest():
+        return True
+    # Single-part uploads carry a full-object checksum; multipart ones end in "-<parts>".
+    return head.get("ChecksumSHA256") == base64.b64encode(digest.digest()).decode()
+
+
+def _part_size_for(size_hint, part_size):
+    part_size = max(part_size, MIN_PART_SIZE)
+    if size_hint:
+        # Grow the part size so the object stays within the 10,000 part limit.
+        while size_hint / part_size > MAX_PARTS:
+            part_size *= 2
+    return part_size
+
+
+def _verify(expected, response, key):
+    reported = response.get("ChecksumSHA256")
+    if reported and reported != expected:
+        raise ChecksumMismatch(f"Checksum mismatch for {key}: expected {expected}, S3 reported {reported}")
+
+
+def _put_single(client, bucket, key, data, extra_args):
+    checksum = sha256_b64(data)
+    response = idempotency.with_retries(
+        client.put_object, Bucket=bucket, Key=key, Body=data,
+        ChecksumAlgorithm="SHA256", ChecksumSHA256=checksum, **extra_args
+    )
+    _verify(checksum, response, key)
+    return {"parts": 1, "checksum": checksum, "multipart": False}
+
+
+def _upload_part(client, bucket, key, upload_id, part_number, data):
+    checksum = sha256_b64(data)
+    with metrics.timer("s3.transfer.part"):
+        # Re-uploading a part number replaces it, so a retried part is safe.
+        response = idempotency.with_retries(
+            client.upload_part, Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+            Body=data, ChecksumAlgorithm="SHA256", ChecksumSHA256=checksum
+        )
+    return {"PartNumber": part_number, "ETag": response["ETag"], "ChecksumSHA256": checksum}
+
+
+def _put_multipart(client, bucket, key, stream, first_chunk, part_size, concurrency, extra_args):
+    upload_id = client.create_multipart_upload(
+        Bucket=bucket, Key=key, ChecksumAlgorithm="SHA256", **extra_args
+    )["UploadId"]
+    parts = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = set()
+            part_number = total = 0
+            pending = first_chunk
+            while True:
+                data = pending[:part_size]
+                pending = pending[part_size:]
+                if len(data) < part_size:
+                    data += _read_exact(stream, part_size - len(data))
+                if not data:
+                    break
+                part_number += 1
+                total += len(data)
+                if part_number > MAX_PARTS:
+                    raise ValueError(f"Upload exceeds {MAX_PARTS} parts; raise S3_PART_SIZE_MB.")
+                # Bound memory: at most ~2x concurrency parts read ahead.
+                if len(in_flight) >= concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    parts.extend(f.result() for f in done)
+                in_flight.add(pool.submit(_upload_part, client, bucket, key, upload_id, part_number, data))
+            parts.extend(f.result() for f in in_flight)
+
+        parts.sort(key=lambda p: p["PartNumber"])
+        response = client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+        expected = composite_checksum([p["ChecksumSHA256"] for p in parts])
+        _verify(expected, response, key)
+        return {"parts": len(parts), "checksum": expected, "bytes": total, "multipart": True}
+    except Exception:
+        metrics.incr("s3.transfer.aborted")
+        logger.warning(f"[S3Transfer] Aborting multipart upload {upload_id} for {bucket}/{key}")
+        try:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as e:
+            logger.error(f"[S3Transfer] Could not abort {upload_id}: {e}")
+        raise
+
+
+def upload(bucket, key, body, extra_args=None, size_hint=None, client=None,
+           part_size=PART_SIZE, concurrency=MAX_CONCURRENCY, threshold=MULTIPART_THRESHOLD, dedupe=DEDUPE):
+    """
+    Upload `body` (bytes or a readable file-like object) to s3://bucket/key.
+    Returns {'bytes', 'parts', 'checksum', 'seconds', 'mb_per_s', 'skipped'}; raises on failure.
+    'skipped' is True when the object already holds identical content in the requested storage class.
+    """
+    client = client or s3_client()
+    extra_args = dict(extra_args or {})
+    stream = _as_stream(body)
+    if size_hint is None and isinstance(body, (bytes, bytearray, memoryview)):
+        size_hint = len(body)
+    threshold = max(threshold, MIN_PART_SIZE)
+
+    started = time.perf_counter()
+    if dedupe and _seekable(stream):
+        with metrics.timer("s3.dedup.hash"):
+            digest, size_hint = _hash_stream(stream)
+        extra_args["Metadata"] = {**extra_args.get("Metadata", {}), "sha256": digest.hexdigest()}
+        if _same_content(_existing_object(client, bucket, key), size_hint, digest, extra_args.get("StorageClass")):
+            if extra_args.get("ACL"):
+                # HEAD does not report the ACL; setting it is one small request instead of the body.
+                client.put_object_acl(Bucket=bucket, Key=key, ACL=extra_args["ACL"])
+            metrics.incr("s3.dedup.hits")
+            metrics.incr("s3.dedup.bytes_saved", size_hint)
+            logger.info(f"[S3Transfer] {bucket}/{key} already holds this content ({size_hint} bytes); skipped")
+            return {"bytes": size_hint, "parts": 0, "checksum": base64.b64encode(digest.digest()).decode(),
+                    "multipart": False, "skipped": True, "seconds": round(time.perf_counter() - started, 3),
+                    "mb_per_s": None}
+        metrics.incr("s3.dedup.misses")
+
+    part_size = _part_size_for(size_hint, part_size)
+    # Read one byte past the threshold to decide between single and multipart without knowing the size.
+    head = _read_exact(stream, threshold + 1)
+    if len(head) <= threshold:
+        result = _put_single(client, bucket, key, head, extra_args)
+        result["bytes"] = len(head)
+    else:
+        result = _put_multipart(client, bucket, key, stream, head, part_size, concurrency, extra_args)
+    elapsed = time.perf_counter() - started
+
+    size = result["bytes"]
+    result.update({
+        "skipped": False,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size / MB / elapsed, 2) if elapsed else None,
+    })
+    metrics.incr("s3.transfer.bytes", size)
+    metrics.incr("s3.transfer.multipart" if result["multipart"] else "s3.transfer.single")
+    metrics.observe("s3.transfer.upload", elapsed)
+    logger.info(f"[S3Transfer] {bucket}/{key}: {size} bytes in {result['parts']} part(s), "
+                f"{result['seconds']}s ({result['mb_per_s']} MB/s)")
+    return result
+
+
+# Browser multipart uploads: the bot creates the upload and presigns part URLs, the browser PUTs
+# the parts itself. S3's own part listing is the source of truth when resuming.
+
+BROWSER_PART_SIZE = int(float(os.getenv("S3_BROWSER_PART_SIZE_MB", "8")) * MB)
+PART_URL_BATCH = int(os.getenv("S3_PART_URL_BATCH", "20"))
+PART_URL_TTL = int(os.getenv("S3_PART_URL_TTL", "3600"))
+
+
+def browser_part_size(size):
+    return _part_size_for(size, BROWSER_PART_SIZE)
+
+
+def create_browser_upload(bucket, key, acl="private", storage_class="STANDARD", client=None):
+    client = client or s3_client()
+    response = client.create_multipart_upload(Bucket=bucket, Key=key, ACL=acl, StorageClass=storage_class)
+    metrics.incr("s3.browser_multipart.created")
+    return response["UploadId"]
+
+
+def presign_parts(bucket, key, upload_id, part_numbers, expires_in=PART_URL_TTL, client=None):
+    """Presigned PUT URLs for up to PART_URL_BATCH part numbers."""
+    client = client or s3_client()
+    return {
+        n: client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": bucket, "Key": key, "UploadId": upload_id, "PartNumber": n},
+            ExpiresIn=expires_in,
+        )
+        for n in sorted(set(int(n) for n in part_numbers))[:PART_URL_BATCH]
+    }
+
+
+def list_uploaded_parts(bucket, key, upload_id, client=None):
+    client = client or s3_client()
+    parts = []
+    for page in client.get_paginator("list_parts").paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+        parts.extend({"PartNumber": p["PartNumber"], "ETag": p["ETag"], "Size": p["Size"]}
+                     for p in page.get("Parts", []))
+    return parts
+
+
+def complete_browser_upload(bucket, key, upload_id, part_count, expected_size=None, client=None):
+    """
+    Complete with the parts S3 actually holds; raises ValueError if any part is still missing,
+    SizeMismatch (before completing) if the parts don't add up to expected_size.
+    """
+    client = client or s3_client()
+    parts = [p for p in list_uploaded_parts(bucket, key, upload_id, client) if p["PartNumber"] <= part_count]
+    missing = sorted(set(range(1, part_count + 1)) - {p["PartNumber"] for p in parts})
+    if missing:
+        raise ValueError(f"Parts still missing: {missing[:20]}")
+    uploaded = sum(p["Size"] for p in parts)
+    if expected_size is not None and uploaded != expected_size:
+        raise SizeMismatch(f"The parts hold {uploaded} bytes but the file was declared as {expected_size} bytes")
+    client.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id,
+        MultipartUpload={"Parts": [{"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in parts]},
+    )
+    metrics.incr("s3.browser_multipart.completed")
+    metrics.incr("s3.browser_multipart.bytes", uploaded)
+    return uploaded
+
+
+def abort_browser_upload(bucket, key, upload_id, client=None):
+    client = client or s3_client()
+    client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    metrics.incr("s3.browser_multipart.aborted")
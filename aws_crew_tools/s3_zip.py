@@ -0,0 +1,165 @@
+import os
+import time
+import zipfile
+import logging
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.config import Config
+from aws_crew_tools import metrics
+
+# ZIP archives of several S3 objects, streamed while they are built.
+# zipfile writes into a non-seekable sink (so it emits data descriptors instead of seeking back),
+# and every write is handed to the HTTP response right away. Objects are fetched by a small pool
+# with a bounded read-ahead window: small objects are read whole in the background, large ones
+# are copied chunk by chunk, so memory stays around ZIP_PREFETCH x ZIP_SMALL_OBJECT_MB.
+# A large object that fails part way has already been partly sent: its entry is closed with what
+# arrived and it is listed in _errors.txt as truncated. When the client goes away, the open bodies
+# still in the window are closed so their pooled connections are released.
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+PREFETCH = int(os.getenv("ZIP_PREFETCH", "8"))
+SMALL_OBJECT = int(float(os.getenv("ZIP_SMALL_OBJECT_MB", "8")) * MB)
+CHUNK = int(float(os.getenv("ZIP_CHUNK_KB", "256")) * 1024)
+COMPRESSION = zipfile.ZIP_DEFLATED if os.getenv("ZIP_COMPRESSION", "stored") == "deflate" else zipfile.ZIP_STORED
+MAX_KEYS = int(os.getenv("ZIP_MAX_KEYS", "20000"))
+
+
+class _StreamSink:
+    """Write-only, non-seekable file object that collects what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def keys_under_prefix(bucket_name, prefix, client=None, limit=MAX_KEYS):
+    client = client or boto3.client("s3")
+    keys = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix):
+        keys.extend(o["Key"] for o in page.get("Contents", []) if not o["Key"].endswith("/"))
+        if len(keys) >= limit:
+            raise ValueError(f"More than {limit} objects under `{prefix}`; narrow the prefix.")
+    return keys
+
+
+def _open(client, bucket_name, key):
+    # Small objects are read whole by the worker; large ones are handed back as an open stream.
+    response = client.get_object(Bucket=bucket_name, Key=key)
+    size = response["ContentLength"]
+    modified = response.get("LastModified")
+    if size <= SMALL_OBJECT:
+        return key, size, modified, response["Body"].read(), None
+    return key, size, modified, None, response["Body"]
+
+
+def _close_body(future):
+    if not future.cancelled() and future.exception() is None:
+        body = future.result()[4]
+        if body is not None:
+            body.close()
+
+
+def _close_pending(window):
+    for _, future in window:
+        if not future.cancel():
+            future.add_done_callback(_close_body)
+    window.clear()
+
+
+def _arcname(key, strip_prefix):
+    name = key[len(strip_prefix):] if strip_prefix and key.startswith(strip_prefix) else key
+    return name.lstrip("/") or key
+
+
+def stream_zip(bucket_name, keys, strip_prefix="", client=None, prefetch=PREFETCH):
+    """Yield the bytes of a ZIP archive containing `keys`; failures are listed in _errors.txt."""
+    client = client or boto3.client("s3", config=Config(max_pool_connections=prefetch + 2))
+    sink = _StreamSink()
+    errors, total = [], 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=prefetch) as pool, \
+            zipfile.ZipFile(sink, mode="w", compression=COMPRESSION, allowZip64=True) as archive:
+        pending_keys = iter(keys)
+        window = deque()
+
+        def refill():
+            while len(window) < prefetch:
+                key = next(pending_keys, None)
+                if key is None:
+                    return
+                window.append((key, pool.submit(_open, client, bucket_name, key)))
+
+        try:
+            refill()
+            while window:
+                key, future = window.popleft()
+                refill()
+                try:
+                    key, size, modified, data, body = future.result()
+                except Exception as e:
+                    logger.warning(f"[S3Zip] Skipping {key}: {e}")
+                    errors.append(f"{key}: {e}")
+                    continue
+
+                info = zipfile.ZipInfo(_arcname(key, strip_prefix),
+                                       date_time=(modified or datetime.now()).timetuple()[:6])
+                info.compress_type = COMPRESSION
+                with archive.open(info, mode="w", force_zip64=size > 0xFFFFFFFF) as entry:
+                    if data is not None:
+                        entry.write(data)
+                    else:
+                        copied = 0
+                        try:
+                            for chunk in body.iter_chunks(CHUNK):
+                                entry.write(chunk)
+                                copied += len(chunk)
+                                out = sink.drain()
+                                if out:
+                                    yield out
+                        except Exception as e:
+                            logger.warning(f"[S3Zip] {key} failed after {copied} of {size} bytes: {e}")
+                            errors.append(f"{key}: truncated after {copied} of {size} bytes: {e}")
+                            size = copied
+                        finally:
+                            body.close()
+                total += size
+                out = sink.drain()
+                if out:
+                    yield out
+        finally:
+            _close_pending(window)
+
+        if errors:
+            archive.writestr("_errors.txt", "These objects are missing or incomplete:\n" + "\n".join(errors))
+    yield sink.drain()
+
+    elapsed = time.perf_counter() - started
+    metrics.incr("s3.zip.archives")
+    metrics.incr("s3.zip.bytes", total)
+    metrics.observe("s3.zip.stream", elapsed)
+    logger.info(f"[S3Zip] {len(keys)} objects, {total} bytes from {bucket_name} in {elapsed:.1f}s "
+                f"({total / MB / elapsed if elapsed else 0:.1f} MB/s), {len(errors)} error(s)")
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+import boto3
+from aws_crew_tools import metrics
+
+# Memoization of read-only agent tools.
+# While the agent reasons it often lists the same resources several times. Results of read-only
+# tools are kept for TOOL_CACHE_TTL seconds per conversation (set with use_conversation(); the
+# context is carried into the LLM worker threads). Any mutating tool call drops every cached
+# result for the same account and region, in all conversations, since the change is visible to
+# all of them; code that changes resources without the tools calls invalidate_region(). Results
+# that span regions (all_regions=True, or tools listed as account-wide such as the S3 bucket
+# list) are kept under the account's GLOBAL scope, which every mutation also drops.
+# Hits and misses are counted per tool.
+# Mutating tools also refuse to run once the turn's deadline (use_deadline()) has passed: the
+# user already got an answer, so an agent still running in the background must not change anything.
+
+logger = logging.getLogger(__name__)
+
+TTL = float(os.getenv("TOOL_CACHE_TTL", "30"))
+ENABLED = os.getenv("TOOL_CACHE", "true").lower() == "true"
+GLOBAL = "*"  # region of results that span every region
+
+conversation = contextvars.ContextVar("tool_cache_conversation", default=None)
+deadline = contextvars.ContextVar("tool_cache_deadline", default=None)  # time.monotonic() value
+
+_lock = threading.Lock()
+_entries = {}  # (account, region or GLOBAL) -> {(conversation, tool, args): (expires, result)}
+_counts = {}   # tool -> [hits, lookups]
+_account_id = None
+
+
+def use_conversation(conversation_id):
+    """Scope memoized results to a conversation; returns a token for conversation.reset()."""
+    return conversation.set(conversation_id)
+
+
+def use_deadline(turn_deadline):
+    """Refuse mutating calls after turn_deadline (time.monotonic()); returns a token for deadline.reset()."""
+    return deadline.set(turn_deadline)
+
+
+def _scope(kwargs, account_wide=False):
+    # Tools use the default session, so results belong to its account and to the region the call
+    # names (region_name / region) or else the session's region; GLOBAL when they span regions.
+    global _account_id
+    if _account_id is None:
+        try:
+            _account_id = boto3.client("sts").get_caller_identity()["Account"]
+        except Exception as e:
+            logger.warning(f"[ToolCache] Could not resolve the AWS account: {e}")
+            _account_id = "unknown"
+    if account_wide or kwargs.get("all_regions"):
+        return _account_id, GLOBAL
+    region = kwargs.get("region_name") or kwargs.get("region")
+    return _account_id, region or boto3.session.Session().region_name or "us-east-1"
+
+
+def _count(tool_name, hit):
+    with _lock:
+        counts = _counts.setdefault(tool_name, [0, 0])
+        counts[0] += 1 if hit else 0
+        counts[1] += 1
+        rate = counts[0] / counts[1]
+    metrics.incr(f"tool_cache.{'hit' if hit else 'miss'}.{tool_name}")
+    metrics.set_gauge(f"tool_cache.hit_rate.{tool_name}", round(rate, 4))
+
+
+def invalidate(account, region):
+    # A change in any region also stales every result that spans regions.
+    with _lock:
+        dropped = len(_entries.pop((account, region), {})) + len(_entries.pop((account, GLOBAL), {}))
+    metrics.incr("tool_cache.invalidations")
+    if dropped:
+        logger.info(f"[ToolCache] Dropped {dropped} cached result(s) for {account}/{region}")
+
+
+def invalidate_region(region=None):
+    """For changes made outside the wrapped tools (card flows, direct commands): the same as a mutating tool call."""
+    invalidate(*_scope({"region_name": region}))
+
+
+def memoized(tool_name, run, ttl=TTL, account_wide=False):
+    """Wrap a read-only tool's run function; account_wide when its results span every region."""
+    def cached_run(*args, **kwargs):
+        conversation_id = conversation.get()
+        if not ENABLED or conversation_id is None:
+            return run(*args, **kwargs)
+        scope = _scope(kwargs, account_wide)
+        key = (conversation_id, tool_name, json.dumps([args, kwargs], sort_keys=True, default=str))
+        now = time.monotonic()
+        with _lock:
+            hit = _entries.get(scope, {}).get(key)
+        if hit and hit[0] > now:
+            _count(tool_name, True)
+            return hit[1]
+        _count(tool_name, False)
+        result = run(*args, **kwargs)
+        with _lock:
+            _entries.setdefault(scope, {})[key] = (time.monotonic() + ttl, result)
+        return result
+    return cached_run
+
+
+def invalidating(tool_name, run):
+    """Wrap a mutating tool's run function: cached results of its account and region are dropped."""
+    def mutating_run(*args, **kwargs):
+        turn_deadline = deadline.get()
+        if turn_deadline is not None and time.monotonic() > turn_deadline:
+            metrics.incr(f"tool_cache.refused_after_deadline.{tool_name}")
+            logger.warning(f"[ToolCache] Refused {tool_name}: the turn's deadline has passed")
+            return (f"❌ {tool_name} was not run: the time for this request is up and the user has already "
+                    f"been answered. Do not retry; stop and give your final answer.")
+        scope = _scope(kwargs)
+        try:
+            return run(*args, **kwargs)
+        finally:
+            # Even a failed call may have changed something; never serve results from before it.
+            invalidate(*scope)
+    return mutating_run
+
+
+def install(tools, read_only_names, ttl=TTL, account_wide_names=()):
+    """Wrap the _run of every tool instance: memoized when read-only, invalidating otherwise."""
+    for tool in tools:
+        run = tool._run
+        if tool.name in read_only_names:
+            wrapped = memoized(tool.name, run, ttl, account_wide=tool.name in account_wide_names)
+        else:
+            wrapped = invalidating(tool.name, run)
+        # Tools are pydantic models; set the instance attribute directly so it shadows the method.
+        object.__setattr__(tool, "_run", wrapped)
+    return tools
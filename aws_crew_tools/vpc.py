@@ -1,12 +1,15 @@
 import os
 import boto3
-import ipaddress
 import logging
 from botocore.exceptions import ClientError
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type, List
-import math
+import time
+import threading
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from aws_crew_tools import idempotency, metrics, cidr_allocator, cidr_index, regions
 
 logger = logging.getLogger(__name__)
 _region = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
@@ -14,16 +17,24 @@ _region = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
 def get_ec2_client(region_name):
     return boto3.client("ec2", region_name=region_name)
 
-def get_available_cidr(existing_vpcs):
+def get_available_cidr(existing_vpcs=None, prefixlen=16):
     """
     Suggest a non-conflicting 10.x.0.0/16 CIDR.
+    With existing_vpcs (describe_vpcs entries) only those are considered; otherwise the cached
+    account-wide index (all regions, peered VPCs, secondary CIDRs, on-prem ranges) is used.
     """
-    used_blocks = [ipaddress.IPv4Network(vpc['CidrBlock']) for vpc in existing_vpcs]
-    for i in range(1, 255):
-        new_block = ipaddress.IPv4Network(f'10.{i}.0.0/16')
-        if all(not new_block.overlaps(block) for block in used_blocks):
-            return str(new_block)
-    raise ValueError("No available CIDR block found in 10.0.0.0/8")
+    if existing_vpcs is None:
+        index = cidr_index.get_account_index()
+    else:
+        index = cidr_index.CidrIndex()
+        index.set_source("vpcs", [
+            a['CidrBlock'] for vpc in existing_vpcs
+            for a in vpc.get('CidrBlockAssociationSet', [{'CidrBlock': vpc['CidrBlock']}])
+        ])
+    block = index.next_free(prefixlen, within="10.0.0.0/8")
+    if block is None:
+        raise ValueError("No available CIDR block found in 10.0.0.0/8")
+    return block
 
 def estimate_vpc_cost(nat_enabled=False):
     igw_price = 0.00  # IGW is free
@@ -31,139 +42,465 @@ def estimate_vpc_cost(nat_enabled=False):
     total = igw_price + nat_price
     return f"Estimated monthly cost: ${total:.2f} (IGW + NAT)"
 
-def create_vpc_advanced(vpc_name, cidr_block, region, enable_dns_support=False, enable_dns_hostnames=False, enable_igw=False, enable_nat=False, subnet_requests=None, custom_tags=None, route_table_mode="1"):
+VPC_API_CONCURRENCY = int(os.getenv("VPC_API_CONCURRENCY", "8"))
+# Adaptive retry mode adds client-side rate limiting on top of retries, keeping the
+# concurrent subnet/association calls inside the EC2 API request-rate buckets.
+_EC2_CONFIG = Config(retries={"mode": "adaptive", "max_attempts": 10})
+
+
+class _ProvisioningEngine:
+    """
+    Runs VPC build steps on a bounded thread pool and reports, per phase,
+    the wall-clock time and the number of EC2 API calls issued.
+    With a client token every completed step is checkpointed in the journal, so a retry
+    skips straight past the steps that already succeeded.
+    """
+
+    def __init__(self, ec2, client_token=None):
+        self.ec2 = ec2
+        self.client_token = client_token
+        self.checkpoints = (idempotency.lookup(client_token) or {}) if client_token else {}
+        self.resumed_steps = 0
+        self.pool = ThreadPoolExecutor(max_workers=VPC_API_CONCURRENCY)
+        self.phases = {}
+        self.api_calls = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        ec2.meta.events.register("before-call.ec2", self._count_call)
+
+    def _count_call(self, **kwargs):
+        phase = getattr(self._local, "phase", "other")
+        with self._lock:
+            self.api_calls += 1
+            stats = self.phases.setdefault(phase, {"seconds": 0.0, "api_calls": 0})
+            stats["api_calls"] += 1
+
+    def _run_in_phase(self, phase, fn, *args, **kwargs):
+        # Restored afterwards: calls the caller makes next belong to its own phase, not this one.
+        previous = getattr(self._local, "phase", "other")
+        self._local.phase = phase
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.phase = previous
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self.phases.setdefault(phase, {"seconds": 0.0, "api_calls": 0})
+                stats.setdefault("_spans", []).append((start, start + elapsed))
+
+    def submit(self, phase, fn, *args, **kwargs):
+        return self.pool.submit(self._run_in_phase, phase, fn, *args, **kwargs)
+
+    def run(self, phase, fn, *args, **kwargs):
+        return self._run_in_phase(phase, fn, *args, **kwargs)
+
+    def step(self, phase, name, fn, *args, **kwargs):
+        """Run a checkpointed step; its (JSON-serialisable) result is replayed on retries."""
+        key = f"step:{name}"
+        if self.checkpoints.get(key) is not None:
+            with self._lock:
+                self.resumed_steps += 1
+            return self.checkpoints[key]
+        result = self._run_in_phase(phase, fn, *args, **kwargs)
+        if self.client_token:
+            idempotency.record(self.client_token, **{key: result})
+        return result
+
+    def submit_step(self, phase, name, fn, *args, **kwargs):
+        return self.pool.submit(self.step, phase, name, fn, *args, **kwargs)
+
+    def report(self):
+        # A phase's wall-clock time spans its first start to its last finish (steps overlap).
+        report = {}
+        for phase, stats in self.phases.items():
+            spans = stats.get("_spans", [])
+            seconds = max(e for _, e in spans) - min(s for s, _ in spans) if spans else 0.0
+            report[phase] = {"seconds": round(seconds, 3), "api_calls": stats["api_calls"]}
+            metrics.observe(f"vpc.phase.{phase}", seconds)
+        metrics.incr("vpc.api_calls", self.api_calls)
+        return report
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def _ensure_route_table(ec2, vpc_id, client_token, role, existing_tables):
+    if role in existing_tables:
+        return existing_tables[role]
+    rt = ec2.create_route_table(VpcId=vpc_id, **_token_tag_spec("route-table", client_token, role))
+    return rt['RouteTable']['RouteTableId']
+
+def _ensure_route(ec2, route_table_id, **target):
+    try:
+        ec2.create_route(RouteTableId=route_table_id, DestinationCidrBlock='0.0.0.0/0', **target)
+    except ClientError as e:
+        # Already created by an earlier attempt
+        if e.response['Error']['Code'] != 'RouteAlreadyExists':
+            raise
+    return True
+
+def _associate(ec2, subnet_id, route_table_id):
+    try:
+        ec2.associate_route_table(SubnetId=subnet_id, RouteTableId=route_table_id)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'Resource.AlreadyAssociated':
+            raise
+    return True
+
+def _set_vpc_attribute(ec2, vpc_id, attribute):
+    ec2.modify_vpc_attribute(VpcId=vpc_id, **{attribute: {'Value': True}})
+    return True
+
+def _plan_subnets(ec2, cidr_block, subnet_requests):
+    azs = cidr_allocator.availability_zones(ec2)
+    plan = cidr_allocator.plan_subnets(cidr_block, subnet_requests, azs=azs)
+    return [dict(a, network=str(a['network'])) for a in plan]
+
+def _find_tagged(ec2, describe, result_key, client_token, role, filters=()):
+    """Resource created by an earlier attempt of the same request, looked up by its token tags."""
+    if not client_token:
+        return None
+    items = getattr(ec2, describe)(Filters=idempotency.token_filters(client_token, role) + list(filters))[result_key]
+    return items[0] if items else None
+
+def _token_tag_spec(resource_type, client_token, role, tags=()):
+    tags = list(tags)
+    if client_token:
+        tags += idempotency.token_tags(client_token, role)
+    return {"TagSpecifications": [{"ResourceType": resource_type, "Tags": tags}]} if tags else {}
+
+def _create_vpc_step(ec2, cidr_block, vpc_tags, client_token):
+    existing_vpc = _find_tagged(ec2, "describe_vpcs", "Vpcs", client_token, "vpc")
+    if existing_vpc:
+        return existing_vpc['VpcId'], True
+    vpc = ec2.create_vpc(CidrBlock=cidr_block, **_token_tag_spec("vpc", client_token, "vpc", vpc_tags))
+    vpc_id = vpc['Vpc']['VpcId']
+    if client_token:
+        idempotency.record(client_token, vpc_id=vpc_id)
+    return vpc_id, False
+
+def _igw_step(ec2, vpc_id, client_token, resuming):
+    existing_igw = _find_tagged(ec2, "describe_internet_gateways", "InternetGateways", client_token, "igw") if resuming else None
+    if existing_igw:
+        igw_id = existing_igw['InternetGatewayId']
+    else:
+        igw = ec2.create_internet_gateway(**_token_tag_spec("internet-gateway", client_token, "igw"))
+        igw_id = igw['InternetGateway']['InternetGatewayId']
+        if client_token:
+            idempotency.record(client_token, igw_id=igw_id)
+    if not existing_igw or not existing_igw.get('Attachments'):
+        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+    return igw_id
+
+def _subnet_step(ec2, vpc_id, vpc_name, alloc, existing_subnets):
+    net_cidr = str(alloc['network'])
+    if net_cidr in existing_subnets:
+        return existing_subnets[net_cidr]
+    params = {"VpcId": vpc_id, "CidrBlock": net_cidr,
+              "TagSpecifications": [{"ResourceType": "subnet",
+                                     "Tags": [{'Key': 'Name', 'Value': f"{vpc_name}-{net_cidr}"}]}]}
+    if alloc.get('az'):
+        params["AvailabilityZone"] = alloc['az']
+    return ec2.create_subnet(**params)['Subnet']['SubnetId']
+
+def _nat_client_token(client_token):
+    # A rollback starts a new generation of the build: EC2 rejects a reused ClientToken for a NAT
+    # gateway in another subnet (IdempotentParameterMismatch), so each generation gets its own.
+    generation = (idempotency.lookup(client_token) or {}).get("generation", 0)
+    return idempotency.sub_token(client_token, f"nat:{generation}" if generation else "nat")
+
+def _nat_step(ec2, public_subnet_future, client_token, resuming):
+    # Runs in the background so the NAT waiter overlaps with route tables and associations.
+    existing_eip = _find_tagged(ec2, "describe_addresses", "Addresses", client_token, "nat-eip") if resuming else None
+    if existing_eip:
+        allocation_id = existing_eip['AllocationId']
+    else:
+        eip = ec2.allocate_address(Domain='vpc', **_token_tag_spec("elastic-ip", client_token, "nat-eip"))
+        allocation_id = eip['AllocationId']
+        if client_token:
+            idempotency.record(client_token, nat_allocation_id=allocation_id)
+    nat_params = {"SubnetId": public_subnet_future.result(), "AllocationId": allocation_id}
+    if client_token:
+        nat_params["ClientToken"] = _nat_client_token(client_token)
+        nat = idempotency.with_retries(ec2.create_nat_gateway, **nat_params)
+    else:
+        nat = ec2.create_nat_gateway(**nat_params)
+    nat_id = nat['NatGateway']['NatGatewayId']
+    if client_token:
+        idempotency.record(client_token, nat_id=nat_id)
+    # Wait for NAT to become available (error handling omitted for brevity)
+    waiter = ec2.get_waiter('nat_gateway_available')
+    waiter.wait(NatGatewayIds=[nat_id])
+    return nat_id
+
+def create_vpc_advanced(vpc_name, cidr_block, region, enable_dns_support=False, enable_dns_hostnames=False, enable_igw=False, enable_nat=False, subnet_requests=None, custom_tags=None, route_table_mode="1", client_token=None):
     """
     Create a VPC with dynamic subnets and optional IGW/NAT.
     subnet_requests: list of dicts with 'hosts' and 'type' ('public' or 'private').
+    client_token: makes the build retry-safe; resources from an earlier attempt are reused
+    (found by token tags, CIDR or ClientToken) and a completed build returns its original summary.
+
+    Tags are set inline with TagSpecifications; subnets, route tables and associations are
+    created concurrently (VPC_API_CONCURRENCY) and the NAT Gateway wait overlaps with them.
+    The summary reports API calls and wall-clock seconds per phase.
+    Subnets are planned up front by the buddy allocator and spread across Availability Zones.
     """
     if subnet_requests is None:
         subnet_requests = []
     if custom_tags is None:
         custom_tags = {}
+    if client_token:
+        previous = idempotency.completed_result(client_token)
+        if previous:
+            return dict(previous, replayed=True)
 
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = boto3.client('ec2', region_name=region, config=_EC2_CONFIG)
+    engine = _ProvisioningEngine(ec2, client_token)
+    started = time.perf_counter()
+    cidr_conflicts = []
+    if not cidr_block:
+        cidr_block = engine.step("plan", "cidr", get_available_cidr)
+    elif cidr_index.cached_account_index() is not None:
+        # Only warn: overlaps matter for peering/VPN routing, not for creating the VPC itself.
+        cidr_conflicts = cidr_index.cached_account_index().explain(cidr_block)
+        if cidr_conflicts:
+            # The overlap may be a VPC deleted outside the bot since the index was built.
+            cidr_conflicts = cidr_index.refresh_cached_region(region).explain(cidr_block)
+        if cidr_conflicts:
+            logger.warning(f"[VPC] {cidr_block} overlaps existing ranges: {cidr_conflicts}")
+    allocated = []
+    if subnet_requests:
+        allocated = engine.step("plan", "subnet_plan", _plan_subnets, ec2, cidr_block, subnet_requests)
+    want_igw = enable_igw or enable_nat
+    want_nat = enable_nat and any(a['type'] == 'public' for a in allocated) and any(a['type'] != 'public' for a in allocated)
 
-    vpc = ec2.create_vpc(CidrBlock=cidr_block)
-    vpc_id = vpc['Vpc']['VpcId']
+    nat_pool = None
+    try:
+        vpc_tags = [{'Key': 'Name', 'Value': vpc_name}]
+        vpc_tags += [{'Key': k, 'Value': v} for k, v in custom_tags.items()]
+        vpc_id, found = engine.step("vpc", "vpc", _create_vpc_step, ec2, cidr_block, vpc_tags, client_token)
+        resuming = found or engine.resumed_steps > 0
+        cidr_index.note_vpc_created(cidr_block, region)
 
-    # Enable DNS support/hostnames if requested
-    if enable_dns_support:
-        ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={'Value': True})
-    if enable_dns_hostnames:
-        ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
-
-    # Tag the VPC
-    tags = [{'Key': 'Name', 'Value': vpc_name}]
-    tags += [{'Key': k, 'Value': v} for k, v in custom_tags.items()]
-    ec2.create_tags(Resources=[vpc_id], Tags=tags)
-
-    # Create and attach Internet Gateway if requested (IGW required for NAT as well)
-    igw_id = None
-    if enable_igw or enable_nat:
-        igw = ec2.create_internet_gateway()
-        igw_id = igw['InternetGateway']['InternetGatewayId']
-        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+        # Child resources can only exist if the VPC came from an earlier attempt.
+        existing_subnets, existing_tables = {}, {}
+        if resuming:
+            for s in ec2.describe_subnets(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])['Subnets']:
+                existing_subnets[s['CidrBlock']] = s['SubnetId']
+            for rt in ec2.describe_route_tables(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])['RouteTables']:
+                role = next((t['Value'] for t in rt.get('Tags', []) if t['Key'] == idempotency.ROLE_TAG), None)
+                if role:
+                    existing_tables[role] = rt['RouteTableId']
+
+        # Enable DNS support/hostnames if requested
+        attribute_futures = []
+        if enable_dns_support:
+            attribute_futures.append(engine.submit_step("vpc_attributes", "dns_support", _set_vpc_attribute,
+                                                        ec2, vpc_id, "EnableDnsSupport"))
+        if enable_dns_hostnames:
+            attribute_futures.append(engine.submit_step("vpc_attributes", "dns_hostnames", _set_vpc_attribute,
+                                                        ec2, vpc_id, "EnableDnsHostnames"))
+
+        # Create and attach Internet Gateway if requested (IGW required for NAT as well)
+        igw_future = engine.submit_step("igw", "igw", _igw_step, ec2, vpc_id, client_token, resuming) if want_igw else None
+
+        # Public subnets first so the NAT Gateway can start as early as possible.
+        ordered = sorted(allocated, key=lambda a: a['type'] != 'public')
+        subnet_futures = {a['id']: engine.submit_step("subnets", f"subnet:{a['network']}", _subnet_step,
+                                                      ec2, vpc_id, vpc_name, a, existing_subnets)
+                          for a in ordered}
+
+        nat_future = None
+        if want_nat:
+            first_public = next(a for a in ordered if a['type'] == 'public')
+            nat_pool = ThreadPoolExecutor(max_workers=1)
+            nat_future = nat_pool.submit(engine.step, "nat", "nat", _nat_step, ec2, subnet_futures[first_public['id']],
+                                         client_token, resuming)
+
+        # Create route tables
+        public_allocs = [a for a in allocated if a['type'] == 'public']
+        private_allocs = [a for a in allocated if a['type'] != 'public']
+        public_rt_future = None
+        private_rt_futures = {}
+        if public_allocs:
+            public_rt_future = engine.submit_step("route_tables", "rt:rt-public", _ensure_route_table,
+                                                  ec2, vpc_id, client_token, "rt-public", existing_tables)
+        if private_allocs:
+            if route_table_mode == "separate":
+                # Create separate route table per private subnet
+                for a in private_allocs:
+                    role = f"rt-private-{a['network']}"
+                    private_rt_futures[a['id']] = engine.submit_step("route_tables", f"rt:{role}", _ensure_route_table,
+                                                                     ec2, vpc_id, client_token, role, existing_tables)
+            else:
+                # Use one shared route table
+                shared = engine.submit_step("route_tables", "rt:rt-private", _ensure_route_table,
+                                            ec2, vpc_id, client_token, "rt-private", existing_tables)
+                private_rt_futures = {a['id']: shared for a in private_allocs}
+
+        igw_id = igw_future.result() if igw_future else None
+        subnet_ids = {sid: f.result() for sid, f in subnet_futures.items()}
+        public_rt_id = public_rt_future.result() if public_rt_future else None
+        private_rt_ids = {sid: f.result() for sid, f in private_rt_futures.items()}
+
+        follow_up = list(attribute_futures)
+        if public_rt_id and igw_id:
+            follow_up.append(engine.submit_step("routes", f"route:{public_rt_id}", _ensure_route,
+                                                ec2, public_rt_id, GatewayId=igw_id))
+        for a in public_allocs:
+            follow_up.append(engine.submit_step("associations", f"assoc:{a['network']}", _associate,
+                                                ec2, subnet_ids[a['id']], public_rt_id))
+        for a in private_allocs:
+            follow_up.append(engine.submit_step("associations", f"assoc:{a['network']}", _associate,
+                                                ec2, subnet_ids[a['id']], private_rt_ids[a['id']]))
+        for f in follow_up:
+            f.result()
+
+        # 🔧 NAT Gateway (only once) and routing for all private subnets, once it is available
+        nat_id = None
+        if nat_future:
+            nat_id = nat_future.result()
+            route_futures = [engine.submit_step("routes", f"route:{rt_id}", _ensure_route, ec2, rt_id, NatGatewayId=nat_id)
+                             for rt_id in set(private_rt_ids.values())]
+            for f in route_futures:
+                f.result()
+    finally:
+        # Also on failure: the NAT step keeps its checkpoint, so resume/rollback can see it.
+        if nat_pool:
+            nat_pool.shutdown(wait=True)
+        engine.shutdown()
 
-    allocated = []
-    if subnet_requests:
-        net = ipaddress.ip_network(cidr_block)
-        # Sort subnets by host count descending for allocation
-        sorted_subs = sorted(subnet_requests, key=lambda x: x['hosts'], reverse=True)
-        current_addr = net.network_address
-        for idx, sub in enumerate(sorted_subs):
-            hosts = sub['hosts']
-            needed = hosts + 2  # include network/broadcast
-            new_prefix = 32 - math.ceil(math.log2(needed))
-            if current_addr > net.broadcast_address:
-                raise ValueError("Not enough space in VPC for requested subnets.")
-            # Align candidate network at or after current_addr
-            candidate = ipaddress.IPv4Network(f"{current_addr}/{new_prefix}", strict=False)
-            if candidate.network_address < current_addr:
-                step = 2 ** (32 - new_prefix)
-                base_int = int(current_addr)
-                multiple = (base_int // step) * step
-                if multiple < base_int:
-                    multiple += step
-                candidate = ipaddress.IPv4Network((multiple, new_prefix))
-            while candidate.network_address < current_addr:
-                candidate = ipaddress.IPv4Network((int(candidate.network_address) + 2**(32-new_prefix), new_prefix))
-            if candidate.broadcast_address > net.broadcast_address:
-                raise ValueError("Not enough space in VPC for requested subnets.")
-            # Append allocated subnet with its type
-            allocated.append({'network': candidate, 'type': sub['type'], 'id': idx})
-            current_addr = candidate.broadcast_address + 1
-        # Sort back by original request order if needed
-        allocated = sorted(allocated, key=lambda x: x['id'])
-
-        # Create subnets in AWS
-    public_subnets = []
-    private_subnets = []
-    for alloc in allocated:
-        net_cidr = str(alloc['network'])
-        subnet = ec2.create_subnet(VpcId=vpc_id, CidrBlock=net_cidr)
-        subnet_id = subnet['Subnet']['SubnetId']
-        # Tag each subnet
-        ec2.create_tags(Resources=[subnet_id], Tags=[{'Key': 'Name', 'Value': f"{vpc_name}-{net_cidr}"}])
-        if alloc['type'] == 'public':
-            public_subnets.append(subnet_id)
-        else:
-            private_subnets.append(subnet_id)
-
-    # Create route tables
-    public_rt_id = None
-    private_rt_ids = []
-    if public_subnets:
-        # Public route table for IGW
-        rt_pub = ec2.create_route_table(VpcId=vpc_id)
-        public_rt_id = rt_pub['RouteTable']['RouteTableId']
-        if igw_id:
-            ec2.create_route(RouteTableId=public_rt_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
-        for sub_id in public_subnets:
-            ec2.associate_route_table(SubnetId=sub_id, RouteTableId=public_rt_id)
-
-    if private_subnets:
-        if route_table_mode == "separate":
-        # Create separate route table per private subnet
-            for sub_id in private_subnets:
-                rt = ec2.create_route_table(VpcId=vpc_id)
-                rt_id = rt['RouteTable']['RouteTableId']
-                ec2.associate_route_table(SubnetId=sub_id, RouteTableId=rt_id)
-                private_rt_ids.append(rt_id)
-        else:
-        # Use one shared route table
-            rt_priv = ec2.create_route_table(VpcId=vpc_id)
-            private_rt_id = rt_priv['RouteTable']['RouteTableId']
-            private_rt_ids.append(private_rt_id)
-            for sub_id in private_subnets:
-                ec2.associate_route_table(SubnetId=sub_id, RouteTableId=private_rt_id)
-
-        # NAT route will be added after NAT creation
-
-    # 🔧 NAT Gateway creation (only once) and routing for all private subnets:
-    nat_id = None
-    if enable_nat and private_subnets and public_subnets:
-        eip = ec2.allocate_address(Domain='vpc')
-        nat = ec2.create_nat_gateway(SubnetId=public_subnets[0], AllocationId=eip['AllocationId'])
-        nat_id = nat['NatGateway']['NatGatewayId']
-        # Wait for NAT to become available (error handling omitted for brevity)
-        waiter = ec2.get_waiter('nat_gateway_available')
-        waiter.wait(NatGatewayIds=[nat_id])
-        for rt_id in private_rt_ids:
-            ec2.create_route(RouteTableId=rt_id, DestinationCidrBlock='0.0.0.0/0', NatGatewayId=nat_id)
     # Summary of creation
     summary = {
         'vpc_id': vpc_id,
         'cidr': cidr_block,
         'igw_id': igw_id,
         'subnet_count': len(allocated),
-        'nat_gateway': nat_id if nat_id else None
+        'nat_gateway': nat_id if nat_id else None,
+        'subnets': [{'id': subnet_ids[a['id']], 'cidr': str(a['network']), 'type': a['type'], 'az': a['az']}
+                    for a in allocated],
+        'api_calls': engine.api_calls,
+        'phases': engine.report(),
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'cidr_conflicts': [f"{c} ({source})" for source, c in cidr_conflicts],
+        'resumed_steps': engine.resumed_steps
     }
+    logger.info(f"[VPC] Built {vpc_id} in {summary['elapsed_seconds']}s with {summary['api_calls']} API calls: {summary['phases']}")
+    if client_token:
+        idempotency.complete(client_token, summary)
+    return summary
+
+def _ignore_missing(fn, **kwargs):
     try:
-        return summary   
+        fn(**kwargs)
     except ClientError as e:
-        return f"❌ AWS error: {e.response['Error']['Message']}"
-    except Exception as e:
-        return f"❌ Unexpected error: {e}"
+        if not e.response['Error']['Code'].endswith(('NotFound', '.Malformed')):
+            raise
+
+def rollback_vpc_build(client_token, region):
+    """
+    Delete every resource a partial (or finished) build created, layer by layer with the
+    deletions inside each layer running concurrently: NAT gateway -> associations ->
+    subnets, route tables, IGW, NAT EIP -> VPC.
+    """
+    entry = idempotency.lookup(client_token) or {}
+    ec2 = boto3.client('ec2', region_name=region, config=_EC2_CONFIG)
+    vpc_id = entry.get('vpc_id') or (entry.get('step:vpc') or [None])[0]
+    if not vpc_id:
+        found = _find_tagged(ec2, "describe_vpcs", "Vpcs", client_token, "vpc")
+        vpc_id = found['VpcId'] if found else None
+    deleted = []
+
+    def run_layer(calls):
+        with ThreadPoolExecutor(max_workers=VPC_API_CONCURRENCY) as pool:
+            futures = [(label, pool.submit(fn, **kwargs)) for label, fn, kwargs in calls]
+            for label, future in futures:
+                future.result()
+                deleted.append(label)
+
+    nat_id = entry.get('nat_id') or entry.get('step:nat')
+    allocation_id = entry.get('nat_allocation_id')
+    if not allocation_id:
+        eip = _find_tagged(ec2, "describe_addresses", "Addresses", client_token, "nat-eip")
+        allocation_id = eip['AllocationId'] if eip else None
+
+    if vpc_id:
+        vpc_filter = [{"Name": "vpc-id", "Values": [vpc_id]}]
+        nat_ids = {n['NatGatewayId'] for n in ec2.describe_nat_gateways(Filters=vpc_filter)['NatGateways']
+                   if n['State'] not in ('deleted', 'deleting')}
+        if nat_id:
+            nat_ids.add(nat_id)
+        route_tables = [rt for rt in ec2.describe_route_tables(Filters=vpc_filter)['RouteTables']
+                        if not any(a.get('Main') for a in rt.get('Associations', []))]
+        run_layer(
+            [(f"nat {n}", _ignore_missing, {"fn": ec2.delete_nat_gateway, "NatGatewayId": n}) for n in nat_ids] +
+            [(f"association {a['RouteTableAssociationId']}", _ignore_missing,
+              {"fn": ec2.disassociate_route_table, "AssociationId": a['RouteTableAssociationId']})
+             for rt in route_tables for a in rt.get('Associations', []) if a.get('SubnetId')]
+        )
+        if nat_ids:
+            # The NAT must be gone before its subnet, EIP and the IGW can be released.
+            ec2.get_waiter('nat_gateway_deleted').wait(NatGatewayIds=list(nat_ids))
+
+        igws = ec2.describe_internet_gateways(Filters=[{"Name": "attachment.vpc-id", "Values": [vpc_id]}])['InternetGateways']
+        subnets = ec2.describe_subnets(Filters=vpc_filter)['Subnets']
+
+        def delete_igw(igw_id):
+            _ignore_missing(ec2.detach_internet_gateway, InternetGatewayId=igw_id, VpcId=vpc_id)
+            _ignore_missing(ec2.delete_internet_gateway, InternetGatewayId=igw_id)
+
+        run_layer(
+            [(f"subnet {s['SubnetId']}", _ignore_missing, {"fn": ec2.delete_subnet, "SubnetId": s['SubnetId']}) for s in subnets] +
+            [(f"route table {rt['RouteTableId']}", _ignore_missing,
+              {"fn": ec2.delete_route_table, "RouteTableId": rt['RouteTableId']}) for rt in route_tables] +
+            [(f"igw {g['InternetGatewayId']}", delete_igw, {"igw_id": g['InternetGatewayId']}) for g in igws] +
+            ([(f"eip {allocation_id}", _ignore_missing, {"fn": ec2.release_address, "AllocationId": allocation_id})]
+             if allocation_id else [])
+        )
+        run_layer([(f"vpc {vpc_id}", _ignore_missing, {"fn": ec2.delete_vpc, "VpcId": vpc_id})])
+        cidr_index.refresh_cached_region(region)
+    elif allocation_id:
+        run_layer([(f"eip {allocation_id}", _ignore_missing, {"fn": ec2.release_address, "AllocationId": allocation_id})])
+
+    # Forget the checkpoints so a later resume with the same token starts from scratch, as a new generation.
+    cleared = {key: None for key in entry if key.startswith("step:")}
+    idempotency.record(client_token, status="rolled_back", result=None, vpc_id=None, igw_id=None,
+                       nat_id=None, nat_allocation_id=None, generation=entry.get("generation", 0) + 1, **cleared)
+    metrics.incr("vpc.rollbacks")
+    logger.info(f"[VPC] Rolled back build {client_token[:12]}: {deleted}")
+    return deleted
+
+def _table_routing_to(route_tables, target_key, target_prefix):
+    """Route table whose default route goes to an internet (igw-) or NAT (nat-) gateway."""
+    for rt in route_tables:
+        if any(r.get('DestinationCidrBlock') == '0.0.0.0/0' and (r.get(target_key) or '').startswith(target_prefix)
+               for r in rt.get('Routes', [])):
+            return rt['RouteTableId']
+    return None
+
+def add_subnets_to_vpc(vpc_id, subnet_requests, region, vpc_name=None):
+    """
+    Add subnets to an existing VPC. They are planned into its free address space, holes
+    between existing subnets included, and spread across Availability Zones. Public subnets
+    join the VPC's route table to its internet gateway, private ones its NAT route table;
+    without one they stay on the main route table.
+    """
+    ec2 = boto3.client('ec2', region_name=region, config=_EC2_CONFIG)
+    plan = cidr_allocator.plan_subnets_in_vpc(ec2, vpc_id, subnet_requests)
+    route_tables = ec2.describe_route_tables(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])['RouteTables']
+    targets = {'public': _table_routing_to(route_tables, 'GatewayId', 'igw-'),
+               'private': _table_routing_to(route_tables, 'NatGatewayId', 'nat-')}
+    with ThreadPoolExecutor(max_workers=VPC_API_CONCURRENCY) as pool:
+        subnet_ids = list(pool.map(lambda alloc: _subnet_step(ec2, vpc_id, vpc_name or vpc_id, alloc, {}), plan))
+        associations = [pool.submit(_associate, ec2, subnet_id, targets[alloc['type']])
+                        for subnet_id, alloc in zip(subnet_ids, plan) if targets.get(alloc['type'])]
+        for future in associations:
+            future.result()
+    metrics.incr("vpc.subnets_added", len(plan))
+    logger.info(f"[VPC] Added {len(plan)} subnets to {vpc_id}")
+    return [{'subnet_id': subnet_id, 'cidr': str(alloc['network']), 'type': alloc['type'], 'az': alloc['az'],
+             'route_table_id': targets.get(alloc['type'])} for subnet_id, alloc in zip(subnet_ids, plan)]
 
 # CrewAI Models
 
@@ -191,26 +528,51 @@ class CreateVPCTool(BaseTool):
     async def _arun(self, *args, **kwargs):
         raise NotImplementedError("CreateVPCTool does not support async")
 
+class AddSubnetsInput(BaseModel):
+    vpc_id: str = Field(..., description="VPC to add the subnets to (vpc-...)")
+    subnet_requests: List[dict] = Field(..., description="Subnets to add, e.g. [{'hosts': 50, 'type': 'public'}]")
+    region_name: str = Field("us-east-1", description="AWS region")
+
+class AddSubnetsTool(BaseTool):
+    name: str = "add_subnets_to_vpc"
+    description: str = "Add subnets to an existing VPC, placed in its free address space (gaps between existing subnets included)"
+    args_schema: Type[BaseModel] = AddSubnetsInput
+
+    def _run(self, vpc_id, subnet_requests, region_name=_region):
+        try:
+            added = add_subnets_to_vpc(vpc_id, subnet_requests, region_name)
+        except (ClientError, ValueError) as e:
+            return f"❌ Could not add subnets to {vpc_id}: {e}"
+        return "\n".join(f"- {s['subnet_id']} ({s['cidr']}, {s['type']}, {s['az'] or 'any AZ'})" for s in added)
+
+    async def _arun(self, *args, **kwargs):
+        raise NotImplementedError("AddSubnetsTool does not support async")
+
+def list_vpcs(region_name=_region, client=None):
+    ec2 = client or get_ec2_client(region_name)
+    try:
+        response = ec2.describe_vpcs()
+        vpcs = response.get("Vpcs", [])
+        if not vpcs:
+            return "No VPCs found."
+        result = ""
+        for v in vpcs:
+            vid = v.get("VpcId")
+            cidr = v.get("CidrBlock")
+            name = next((t["Value"] for t in v.get("Tags", []) if t.get("Key") == "Name"), "")
+            result += f"- {vid} ({cidr}){' – ' + name if name else ''}\n"
+        return result
+    except ClientError as e:
+        return f"Error listing VPCs: {e.response['Error']['Message']}"
+
 class ListVPCsTool(BaseTool):
     name: str = "list_vpcs"
-    description: str = "List all VPCs and their CIDR blocks"
+    description: str = "List all VPCs and their CIDR blocks. Set all_regions=True to query every enabled region."
 
-    def _run(self):
-        ec2 = get_ec2_client(_region)
-        try:
-            response = ec2.describe_vpcs()
-            vpcs = response.get("Vpcs", [])
-            if not vpcs:
-                return "No VPCs found."
-            result = ""
-            for v in vpcs:
-                vid = v.get("VpcId")
-                cidr = v.get("CidrBlock")
-                name = next((t["Value"] for t in v.get("Tags", []) if t.get("Key") == "Name"), "")
-                result += f"- {vid} ({cidr}){' – ' + name if name else ''}\n"
-            return result
-        except ClientError as e:
-            return f"Error listing VPCs: {e.response['Error']['Message']}"
+    def _run(self, all_regions: bool = False):
+        if all_regions:
+            return regions.collect_text(list_vpcs, empty="No VPCs found.")
+        return list_vpcs()
 
     async def _arun(self, *args, **kwargs):
         raise NotImplementedError("ListVPCsTool does not support async")
@@ -0,0 +1,61 @@
+# bench/bench_intent_router.py
+# Accuracy and latency of the compiled intent router (bot/intent_router.py) on a labelled corpus
+# (bench/intent_corpus.tsv: message<TAB>expected intent, "llm" when no rule should match).
+# Prints every misrouted message, the accuracy, and per-message routing latency percentiles.
+#
+#   python bench/bench_intent_router.py [--corpus bench/intent_corpus.tsv] [--rounds 200]
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot import intent_router
+
+FALLBACK = "llm"
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [line.rstrip("\n").split("\t") for line in f if line.strip() and not line.startswith("#")]
+    return [(message, expected) for message, expected in rows]
+
+
+def predict(router, message):
+    intent = router.matches(message.lower())
+    return intent[0].name if intent else FALLBACK
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent router accuracy and latency")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "intent_corpus.tsv"))
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    router = intent_router.router
+    corpus = load_corpus(args.corpus)
+    wrong = [(m, e, predict(router, m)) for m, e in corpus if predict(router, m) != e]
+    for message, expected, got in wrong:
+        print(f"  MISROUTED {message!r}: expected {expected}, got {got}")
+    print(f"accuracy: {len(corpus) - len(wrong)}/{len(corpus)} ({(len(corpus) - len(wrong)) / len(corpus):.1%}), "
+          f"{len(router.rules)} rules")
+
+    samples = []
+    for _ in range(args.rounds):
+        for message, _ in corpus:
+            started = time.perf_counter_ns()
+            router.matches(message.lower())
+            samples.append((time.perf_counter_ns() - started) / 1000)
+    samples.sort()
+    pct = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    print(f"latency per message (µs): mean {statistics.mean(samples):.1f}, p50 {pct(0.50):.1f}, "
+          f"p99 {pct(0.99):.1f}, max {samples[-1]:.1f}  ({len(samples)} routings)")
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
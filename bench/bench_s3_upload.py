@@ -0,0 +1,145 @@
+# bench/bench_s3_upload.py
+# Benchmark for s3_transfer.upload: the same body sent as one put_object and as a parallel
+# multipart upload, from 1 MB to 10 GB. No AWS account is needed: sizes up to --moto-max-mb run
+# against moto; larger ones would not fit in moto's memory, so their generated body is streamed
+# to a stand-in S3 client that checksums each request the way S3 does and then drops the bytes.
+# Every S3 request is slowed down by a fixed latency plus its body size over a per-connection
+# bandwidth, which is what parallel parts win back on a real link. Prints time and MB/s per mode
+# and size. A single put_object is capped at 5 GB by S3 (and is sent from memory), so larger
+# sizes are multipart only.
+#
+#   pip install "moto[s3]"
+#   python bench/bench_s3_upload.py [--sizes-mb 1 16 128 1024 10240] [--moto-max-mb 128]
+#                                   [--latency-ms 40] [--mbps-per-connection 200]
+#                                   [--part-size-mb 8] [--concurrency 8]
+
+import io
+import os
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import boto3
+from moto import mock_aws
+from aws_crew_tools import s3_transfer
+
+MB = s3_transfer.MB
+BUCKET = "bench-upload"
+MAX_PUT_OBJECT = 5 * 1024 * MB
+
+
+def _delay(latency, bytes_per_second, body):
+    size = body.getbuffer().nbytes if hasattr(body, "getbuffer") else len(body or b"")
+    time.sleep(latency + size / bytes_per_second)
+
+
+def _add_link(latency, bytes_per_second):
+    # Every client made from the default session inherits this handler.
+    def delay(params, **kwargs):
+        # botocore has wrapped bytes bodies in a BytesIO by the time this runs.
+        _delay(latency, bytes_per_second, params.get("body"))
+
+    boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register("before-call.s3", delay)
+
+
+class _GeneratedBody(io.RawIOBase):
+    """`size` bytes of a repeated random block, produced as they are read."""
+
+    def __init__(self, size, block=os.urandom(MB)):
+        self.remaining = size
+        self.block = block
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining, len(self.block) - self.offset)
+        buffer[:n] = self.block[self.offset:self.offset + n]
+        self.offset = (self.offset + n) % len(self.block)
+        self.remaining -= n
+        return n
+
+
+class _DiscardingS3:
+    """Just enough of an S3 client for s3_transfer.upload; checksums each body and drops it."""
+
+    def __init__(self, latency, bytes_per_second):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.parts = {}
+
+    def put_object(self, Body, **kwargs):
+        _delay(self.latency, self.bytes_per_second, Body)
+        return {"ETag": uuid.uuid4().hex, "ChecksumSHA256": s3_transfer.sha256_b64(Body)}
+
+    def create_multipart_upload(self, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.parts[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, UploadId, PartNumber, Body, **kwargs):
+        _delay(self.latency, self.bytes_per_second, Body)
+        self.parts[UploadId][PartNumber] = s3_transfer.sha256_b64(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def complete_multipart_upload(self, UploadId, MultipartUpload, **kwargs):
+        received = self.parts.pop(UploadId)
+        checksums = [received[p["PartNumber"]] for p in MultipartUpload["Parts"]]
+        return {"ChecksumSHA256": s3_transfer.composite_checksum(checksums)}
+
+    def abort_multipart_upload(self, UploadId, **kwargs):
+        self.parts.pop(UploadId, None)
+
+
+def run(client, size, multipart, part_size, concurrency, generated):
+    body = io.BufferedReader(_GeneratedBody(size), buffer_size=MB) if generated else os.urandom(size)
+    threshold = part_size if multipart else size
+    return s3_transfer.upload(BUCKET, f"bench-{size}", body, client=client, size_hint=size, part_size=part_size,
+                              concurrency=concurrency, threshold=threshold, dedupe=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-part vs multipart upload throughput")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 16, 128, 1024, 10240])
+    parser.add_argument("--moto-max-mb", type=int, default=128,
+                        help="larger sizes use the discarding stand-in client instead of moto")
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--mbps-per-connection", type=float, default=200, help="megabits/s per connection")
+    parser.add_argument("--part-size-mb", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=s3_transfer.MAX_CONCURRENCY)
+    args = parser.parse_args()
+    part_size = args.part_size_mb * MB
+    latency, bytes_per_second = args.latency_ms / 1000, args.mbps_per_connection * 1e6 / 8
+
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        # warm-up: moto's first-request setup is not part of the numbers
+        run(s3_transfer.s3_client(), MB, False, part_size, 1, False)
+        _add_link(latency, bytes_per_second)
+        moto_client = s3_transfer.s3_client()
+        discarding = _DiscardingS3(latency, bytes_per_second)
+
+        print(f"{'size':>8}  {'backend':<10} {'mode':<22} {'parts':>5} {'seconds':>8} {'MB/s':>8}")
+        for size_mb in args.sizes_mb:
+            size = size_mb * MB
+            generated = size_mb > args.moto_max_mb
+            client, backend = (discarding, "stand-in") if generated else (moto_client, "moto")
+            for label, multipart in (("single put_object", False), (f"multipart x{args.concurrency}", True)):
+                if not multipart and size > MAX_PUT_OBJECT:
+                    print(f"{size_mb:>6}MB  {backend:<10} {label:<22} {'-':>5} {'n/a (S3 caps PUT at 5 GB)':>17}")
+                    continue
+                result = run(client, size, multipart, part_size, args.concurrency, generated)
+                print(f"{size_mb:>6}MB  {backend:<10} {label:<22} {result['parts']:>5} {result['seconds']:>8.2f} "
+                      f"{result['mb_per_s']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench/bench_s3_zip.py
+# Benchmark for s3_zip.stream_zip: 10,000 small objects vs a few huge ones.
+# Objects come from a stand-in for the S3 client that generates their bytes on the fly, with a
+# fixed latency per get_object and a per-connection bandwidth, so no AWS account is needed and
+# the memory figures belong to the archive streamer alone (moto would keep every object in memory).
+# Each scenario runs twice: once for time and throughput, once under tracemalloc for peak memory.
+#
+#   python bench/bench_s3_zip.py [--small-count 10000] [--small-kb 16] [--huge-count 3] [--huge-mb 512]
+#                                [--latency-ms 20] [--mbps-per-connection 400] [--prefetch 8]
+
+import io
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botocore.response import StreamingBody
+from aws_crew_tools import s3_zip
+
+MB = s3_zip.MB
+
+
+class _GeneratedObject(io.RawIOBase):
+    def __init__(self, size, bytes_per_second):
+        self.remaining = size
+        self.bytes_per_second = bytes_per_second
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining)
+        buffer[:n] = bytes(n)
+        self.remaining -= n
+        time.sleep(n / self.bytes_per_second)
+        return n
+
+
+class _GeneratedS3:
+    """Just enough of an S3 client for stream_zip: get_object of generated objects."""
+
+    def __init__(self, sizes, latency, bytes_per_second):
+        self.sizes = sizes
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        size = self.sizes[Key]
+        raw = io.BufferedReader(_GeneratedObject(size, self.bytes_per_second), buffer_size=s3_zip.CHUNK)
+        return {"ContentLength": size, "LastModified": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                "Body": StreamingBody(raw, size)}
+
+
+def _consume(client, keys, prefetch):
+    archive = 0
+    for chunk in s3_zip.stream_zip("bench", keys, client=client, prefetch=prefetch):
+        archive += len(chunk)
+    return archive
+
+
+def run(label, sizes, args):
+    client = _GeneratedS3(sizes, args.latency_ms / 1000, args.mbps_per_connection * 1e6 / 8)
+    keys = list(sizes)
+
+    started = time.perf_counter()
+    archive = _consume(client, keys, args.prefetch)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    _consume(client, keys, args.prefetch)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    data = sum(sizes.values())
+    print(f"{label:<28} {len(keys):>7} {data / MB:>10.1f} {archive / MB:>10.1f} {elapsed:>8.2f} "
+          f"{data / MB / elapsed:>8.1f} {peak / MB:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZIP streaming: many small objects vs a few huge ones")
+    parser.add_argument("--small-count", type=int, default=10000)
+    parser.add_argument("--small-kb", type=int, default=16)
+    parser.add_argument("--huge-count", type=int, default=3)
+    parser.add_argument("--huge-mb", type=int, default=512)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--mbps-per-connection", type=float, default=400, help="megabits/s per connection")
+    parser.add_argument("--prefetch", type=int, default=s3_zip.PREFETCH)
+    args = parser.parse_args()
+
+    print(f"prefetch={args.prefetch}, small object limit {s3_zip.SMALL_OBJECT // MB} MB, chunk {s3_zip.CHUNK // 1024} KB")
+    print(f"{'scenario':<28} {'objects':>7} {'data MB':>10} {'zip MB':>10} {'seconds':>8} {'MB/s':>8} {'peak MB':>10}")
+    run(f"{args.small_count} x {args.small_kb} KB",
+        {f"small/{i:05d}.bin": args.small_kb * 1024 for i in range(args.small_count)}, args)
+    run(f"{args.huge_count} x {args.huge_mb} MB",
+        {f"huge/{i}.bin": args.huge_mb * MB for i in range(args.huge_count)}, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench/bench_tool_scoping.py
+# Prompt size and LLM latency of the fallback agent with and without intent-scoped tool groups
+# (crew_handler.tool_scope / AGENT_TOOL_SCOPING). The workload is every message of
+# bench/intent_corpus.tsv that no intent rule handles ("llm"), i.e. what reaches the agent.
+#
+# By default no model is needed: the agent runs against a recording LLM that captures the exact
+# prompt CrewAI builds and answers at once, and the prompt-evaluation time is estimated from
+# --prompt-tokens-per-second (llama3 8B on our CPU-only Ollama host does roughly 60).
+# With --live the first agent step of every request goes to the configured Ollama model
+# (OLLAMA_MODEL / OLLAMA_URL) and is timed; its reply is then discarded, so no tool ever runs.
+#
+#   python bench/bench_tool_scoping.py [--corpus bench/intent_corpus.tsv] [--live]
+#                                      [--prompt-tokens-per-second 60] [--verbose]
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from typing import Any
+from crewai import Agent, Task, Crew
+from crewai.llms.base_llm import BaseLLM
+import crew_handler
+
+FALLBACK = "llm"
+FINAL_ANSWER = "Thought: I can answer now.\nFinal Answer: ok"
+
+
+class _MeasuringLLM(BaseLLM):
+    """Records each prompt; with `inner` set, also sends it there and times the reply."""
+
+    inner: Any = None
+    prompts: list = []
+    latencies: list = []
+    prompt_tokens: list = []
+
+    def supports_function_calling(self):
+        # Tools described in the prompt text, the same for both LLMs.
+        return False
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        messages = [{"role": "user", "content": messages}] if isinstance(messages, str) else messages
+        self.prompts.append(sum(len(m.get("content") or "") for m in messages))
+        if self.inner is not None:
+            before = self.inner.get_token_usage_summary().prompt_tokens
+            started = time.perf_counter()
+            self.inner.call(messages)
+            self.latencies.append(time.perf_counter() - started)
+            self.prompt_tokens.append(self.inner.get_token_usage_summary().prompt_tokens - before)
+        # Finish the task without acting on the model's reply.
+        return FINAL_ANSWER
+
+
+def load_messages(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [line.rstrip("\n").split("\t") for line in f if line.strip() and not line.startswith("#")]
+    return [message for message, expected in rows if expected == FALLBACK]
+
+
+def measure(message, scope, llm):
+    tools = [tool for group in scope for tool in crew_handler.TOOL_GROUPS[group]]
+    agent = Agent(role=crew_handler.AGENT_ROLE, goal=crew_handler.AGENT_GOAL,
+                  backstory=crew_handler.AGENT_BACKSTORY, llm=llm, tools=tools,
+                  max_iter=crew_handler.AGENT_MAX_ITER, verbose=False)
+    task = Task(description=message, agent=agent, tools=agent.tools,
+                expected_output="A concise result or answer for the user's request.")
+    calls = len(llm.prompts)
+    Crew(agents=[agent], tasks=[task]).kickoff()
+    return llm.prompts[calls], (llm.latencies[calls] if llm.inner is not None else None), \
+        (llm.prompt_tokens[calls] if llm.inner is not None else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fallback agent prompt size and latency, scoped vs all tools")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "intent_corpus.tsv"))
+    parser.add_argument("--live", action="store_true", help="time the first agent step on the Ollama model")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=60,
+                        help="prompt evaluation rate for the estimate without --live")
+    parser.add_argument("--verbose", action="store_true", help="print every message")
+    args = parser.parse_args()
+
+    messages = load_messages(args.corpus)
+    everything = tuple(sorted(crew_handler.TOOL_GROUPS))
+    modes = {"all tools": lambda message: everything, "scoped": crew_handler.tool_scope}
+    llm = _MeasuringLLM(model="measuring", inner=crew_handler.aws_llm if args.live else None)
+
+    source = f"live ({crew_handler.OLLAMA_MODEL})" if args.live else \
+        f"estimated at {args.prompt_tokens_per_second:.0f} prompt tokens/s"
+    print(f"{len(messages)} fallback messages, latency {source}")
+    print(f"{'mode':<10} {'mean tok':>9} {'p50 tok':>8} {'max tok':>8} {'mean s':>8} {'p50 s':>7} {'max s':>7}")
+    means = {}
+    for mode, scope_of in modes.items():
+        tokens, seconds = [], []
+        for message in messages:
+            scope = scope_of(message)
+            chars, latency, prompt_tokens = measure(message, scope, llm)
+            # Same ~4 characters per token estimate as crew_handler._schema_tokens.
+            tokens.append(prompt_tokens if prompt_tokens else chars // 4)
+            seconds.append(latency if latency is not None else tokens[-1] / args.prompt_tokens_per_second)
+            if args.verbose:
+                print(f"  {mode:<10} {'+'.join(scope):<16} {tokens[-1]:>6} tok {seconds[-1]:>6.2f}s  {message}")
+        means[mode] = statistics.mean(tokens)
+        print(f"{mode:<10} {means[mode]:>9.0f} {statistics.median(tokens):>8.0f} {max(tokens):>8} "
+              f"{statistics.mean(seconds):>8.2f} {statistics.median(seconds):>7.2f} {max(seconds):>7.2f}")
+    print(f"scoping cuts the mean prompt by {1 - means['scoped'] / means['all tools']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# bench/bench_vpc_provisioning.py
+# Benchmark for create_vpc_advanced: a VPC with 32 subnets (16 public, 16 private), IGW and NAT.
+# Runs against moto (no AWS account needed) with a fixed latency added to every EC2 call, once
+# with VPC_API_CONCURRENCY=1 (sequential) and once with the configured concurrency, and prints
+# the wall-clock time and API calls per phase.
+#
+#   pip install "moto[ec2]"
+#   python bench/bench_vpc_provisioning.py [--subnets 32] [--latency-ms 80] [--concurrency 8]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import boto3
+from moto import mock_aws
+from aws_crew_tools import vpc
+
+
+def _add_latency(seconds):
+    # Every client made from the default session inherits this handler.
+    boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register("before-call.ec2", lambda **kwargs: time.sleep(seconds))
+
+
+def run(subnets, concurrency):
+    vpc.VPC_API_CONCURRENCY = concurrency
+    requests = [{"hosts": 200, "type": "public" if i % 2 == 0 else "private"} for i in range(subnets)]
+    return vpc.create_vpc_advanced(
+        "bench-vpc", "10.20.0.0/16", "us-east-1",
+        enable_dns_support=True, enable_dns_hostnames=True, enable_igw=True, enable_nat=True,
+        subnet_requests=requests, route_table_mode="1",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subnets", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--concurrency", type=int, default=vpc.VPC_API_CONCURRENCY)
+    args = parser.parse_args()
+
+    with mock_aws():
+        run(2, 1)  # warm-up: moto's first-request setup is not part of the numbers
+
+    for label, concurrency in (("sequential", 1), (f"concurrency={args.concurrency}", args.concurrency)):
+        with mock_aws():
+            _add_latency(args.latency_ms / 1000)
+            summary = run(args.subnets, concurrency)
+        print(f"\n{label}: {summary['elapsed_seconds']:.2f}s, {summary['api_calls']} API calls, "
+              f"{summary['subnet_count']} subnets")
+        for phase, stats in summary["phases"].items():
+            print(f"  {phase:<14} {stats['seconds']:>7.2f}s  {stats['api_calls']:>4} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,34 @@ import time
 import json
 version_tag = str(int(time.time()))
 
+def _inputs(elements):
+    for element in elements:
+        if element.get("type", "").startswith("Input."):
+            yield element
+        for child in ("items", "columns"):
+            yield from _inputs(element.get(child, []))
+
+def prefill_inputs(card, values):
+    """
+    Pre-fill card inputs in place from {input id: value}; None values are skipped.
+    A ChoiceSet value that is not one of its choices goes to the "<id>_Manual" input when the
+    card has one (and "manual" is selected), otherwise it is added as a choice.
+    """
+    inputs = {element["id"]: element for element in _inputs(card.get("body", [])) if "id" in element}
+    for input_id, value in values.items():
+        element = inputs.get(input_id)
+        if value is None or element is None:
+            continue
+        if element["type"] == "Input.ChoiceSet" and value not in {c["value"] for c in element["choices"]}:
+            manual = inputs.get(f"{input_id}_Manual")
+            if manual is not None and any(c["value"] == "manual" for c in element["choices"]):
+                manual["value"] = value
+                value = "manual"
+            else:
+                element["choices"].insert(0, {"title": value, "value": value})
+        element["value"] = value
+    return card
+
 def ec2_launch_card():
     
     # 🔄 Format dropdowns from plain strings to {title, value}
@@ -190,6 +218,26 @@ def vpc_full_creation_card():
         ]
     }
 
+def vpc_build_failed_card(error, data, client_token, region):
+    # Resume re-submits the original form with the same token, so finished steps are skipped.
+    resume_data = {k: v for k, v in data.items() if k != "msteams"}
+    resume_data.update({"action": "create_vpc", "client_token": client_token})
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.4",
+        "body": [
+            {"type": "TextBlock", "text": "❌ VPC Build Failed", "weight": "Bolder", "size": "Large", "color": "Attention"},
+            {"type": "TextBlock", "text": str(error), "wrap": True},
+            {"type": "TextBlock", "text": "Completed steps are saved. Resume to continue where it stopped, or roll back to delete everything this build created.", "wrap": True}
+        ],
+        "actions": [
+            {"type": "Action.Submit", "title": "🔁 Resume", "data": resume_data},
+            {"type": "Action.Submit", "title": "🧹 Roll back",
+             "data": {"action": "rollback_vpc", "client_token": client_token, "region": region}}
+        ]
+    }
+
 def s3_create_bucket_card():
     return {
         "type": "AdaptiveCard",
@@ -429,10 +477,110 @@ def s3_select_object_card(bucket_name, object_list):
                     "action": "generate_download_link",
                     "bucket_name": bucket_name
                 }
+            },
+            {
+                "type": "Action.Submit",
+                "title": "👀 Preview",
+                "data": {
+                    "action": "preview_object",
+                    "bucket_name": bucket_name
+                }
+            },
+            {
+                "type": "Action.Submit",
+                "title": "📦 Download Several as ZIP",
+                "data": {
+                    "action": "zip_select",
+                    "bucket_name": bucket_name
+                }
             }
         ]
     }
 
+def s3_zip_select_card(bucket_name, object_list):
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.4",
+        "body": [
+            {"type": "TextBlock", "text": f"📦 Download from `{bucket_name}` as ZIP", "weight": "Bolder", "size": "Medium"},
+            {"type": "TextBlock", "text": "Pick files, or give a folder prefix to include everything under it.", "wrap": True},
+            {
+                "type": "Input.ChoiceSet",
+                "id": "object_keys",
+                "isMultiSelect": True,
+                "style": "expanded",
+                "choices": [{"title": obj, "value": obj} for obj in object_list]
+            },
+            {"type": "Input.Text", "id": "prefix", "placeholder": "Folder prefix, e.g. reports/2024/"}
+        ],
+        "actions": [
+            {
+                "type": "Action.Submit",
+                "title": "📦 Create ZIP Link",
+                "data": {
+                    "action": "download_zip",
+                    "bucket_name": bucket_name
+                }
+            }
+        ]
+    }
+
+def s3_zip_link_card(bucket_name, url, count=None, prefix="", valid_minutes=None):
+    what = f"{count} file(s)" if count else f"everything under `{prefix or '/'}`"
+    validity = f" The link works once, within {valid_minutes} minutes." if valid_minutes else ""
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.4",
+        "body": [
+            {"type": "TextBlock", "text": "📦 ZIP Download Ready", "weight": "Bolder", "size": "Large"},
+            {"type": "TextBlock", "text": f"Archive of {what} from `{bucket_name}`. It is built while it downloads.{validity}", "wrap": True}
+        ],
+        "actions": [
+            {"type": "Action.OpenUrl", "title": "⬇️ Download ZIP", "url": url}
+        ]
+    }
+
+def s3_preview_card(bucket_name, object_key, preview, max_columns=6):
+    body = [
+        {"type": "TextBlock", "text": f"👀 Preview of `{object_key}`", "weight": "Bolder", "size": "Medium", "wrap": True},
+        {"type": "TextBlock", "isSubtle": True, "spacing": "None", "wrap": True,
+         "text": f"🪣 {bucket_name}" + (f" · {preview['size']:,} bytes" if preview.get("size") else "")
+                 + (" · S3 Select" if preview.get("via") == "select" else "")}
+    ]
+    if preview["kind"] == "table" and preview["columns"]:
+        columns = preview["columns"][:max_columns]
+
+        def row(cells, header=False):
+            return {"type": "ColumnSet", "spacing": "Small", "separator": header, "columns": [
+                {"type": "Column", "width": "stretch", "items": [
+                    {"type": "TextBlock", "text": str(cell)[:60], "wrap": True, "size": "Small",
+                     "weight": "Bolder" if header else "Default"}
+                ]} for cell in cells[:max_columns]
+            ]}
+
+        body.append(row(columns, header=True))
+        body.extend(row(r) for r in preview["rows"])
+        if len(preview["columns"]) > max_columns:
+            body.append({"type": "TextBlock", "isSubtle": True, "size": "Small",
+                         "text": f"… {len(preview['columns']) - max_columns} more column(s) not shown"})
+    else:
+        body.append({"type": "TextBlock", "text": preview.get("text") or "(empty)", "fontType": "Monospace",
+                     "size": "Small", "wrap": True})
+    if preview.get("truncated"):
+        body.append({"type": "TextBlock", "isSubtle": True, "size": "Small", "text": "Showing the beginning of the file only."})
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.4",
+        "body": body,
+        "actions": [
+            {"type": "Action.Submit", "title": "🔗 Generate Download Link",
+             "data": {"action": "generate_download_link", "bucket_name": bucket_name, "object_key": object_key}}
+        ]
+    }
+
 # adaptive_cards.py
 
 def iam_create_user_card(policy_list: list):
@@ -756,3 +904,31 @@ def iam_audit_card():
 ]
 
     }
+
+def capabilities_card(reason=""):
+    # Deterministic answer when the LLM is unavailable; each button sends a routed command.
+    commands = [
+        ("🚀 Launch an EC2 instance", "create ec2 instance"),
+        ("🌐 Create a VPC", "create vpc"),
+        ("🪣 Create an S3 bucket", "create bucket"),
+        ("📤 Upload a file", "upload file"),
+        ("📥 Download a file", "download file"),
+        ("🖥️ List instances", "list my instances"),
+        ("👤 Create an IAM user", "create iam user"),
+        ("🧠 Audit IAM", "audit iam"),
+    ]
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.4",
+        "body": [
+            {"type": "TextBlock", "text": "🤖 Here's what I can do right now", "weight": "Bolder", "size": "Medium"},
+            {"type": "TextBlock", "text": reason or "The assistant can't answer free-form questions at the moment.",
+             "wrap": True, "isSubtle": True},
+            {"type": "TextBlock", "text": "These commands work without it:", "wrap": True},
+        ],
+        "actions": [
+            {"type": "Action.Submit", "title": title, "data": {"msteams": {"type": "imBack", "value": command}}}
+            for title, command in commands
+        ]
+    }
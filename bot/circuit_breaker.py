@@ -0,0 +1,88 @@
+# bot/circuit_breaker.py
+# Circuit breaker for the LLM backend.
+# After BREAKER_FAILURES consecutive failures or timeouts the breaker opens and calls are
+# refused immediately, so a stuck Ollama costs one deadline instead of one per message. After
+# BREAKER_RESET seconds a single trial call is let through (half-open): success closes the
+# breaker, failure opens it again. State and counts are exported as metrics.
+
+import os
+import time
+import logging
+import threading
+from aws_crew_tools import metrics
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURES", "3"))
+RESET_AFTER = float(os.getenv("BREAKER_RESET", "60"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge(f"breaker.{self.name}.state", self._state)
+        metrics.set_gauge(f"breaker.{self.name}.consecutive_failures", self._failures)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a trial call through."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_after - time.monotonic())
+
+    def allow(self):
+        """True if a call may go ahead; False means answer without calling."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self._state = HALF_OPEN
+                self._trial_running = False
+                logger.info(f"[CircuitBreaker] {self.name} half-open, trying one call")
+            if self._state == CLOSED or (self._state == HALF_OPEN and not self._trial_running):
+                self._trial_running = self._state == HALF_OPEN
+                self._publish()
+                return True
+        metrics.incr(f"breaker.{self.name}.rejected")
+        return False
+
+    def release(self):
+        """An allowed call never reached the backend (e.g. queue full); let the next one try."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"[CircuitBreaker] {self.name} closed")
+            self._state, self._failures, self._trial_running = CLOSED, 0, False
+            self._publish()
+
+    def record_failure(self, reason="error"):
+        """reason is counted separately, e.g. "timeout" or "error"."""
+        metrics.incr(f"breaker.{self.name}.failures.{reason}")
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"[CircuitBreaker] {self.name} open after {self._failures} failure(s) ({reason})")
+                    metrics.incr(f"breaker.{self.name}.opened")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._publish()
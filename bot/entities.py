@@ -0,0 +1,76 @@
+# bot/entities.py
+# Entity extraction for AWS identifiers in chat messages.
+# Every entity kind is one alternative of a single precompiled pattern, so a message is scanned
+# once, left to right, and each match comes back as a typed span. ARNs are tried first so the
+# ids inside them are not reported twice. Bucket names have no distinctive shape; they are only
+# taken from s3:// URIs and from "bucket <name>" / "bucket named <name>" phrases.
+
+import re
+from collections import namedtuple
+from aws_crew_tools import metrics
+
+Entity = namedtuple("Entity", "type value start end")
+
+_END = r"(?![\w-])"
+_OCTET = r"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+_BUCKET = r"[a-z0-9][a-z0-9.\-]{1,61}[a-z0-9](?![a-z0-9\-])(?!\.[a-z0-9])"
+# Words that follow "bucket" in commands without being a bucket name.
+_NOT_BUCKETS = ("named", "called", "name", "stats", "statistics", "size", "policy", "policies", "for", "of",
+                "in", "with", "and", "the", "to", "from", "please", "list", "is", "that", "which")
+
+_PATTERNS = [
+    ("arn", r"(?<![\w-])arn:aws(?:-cn|-us-gov|-iso(?:-[a-z])?)?:[a-z0-9\-]+:[a-z0-9\-]*:\d{0,12}:"
+            r"[^\s,;\"'<>()]*[^\s,;\"'<>().]"),
+    ("bucket_uri", rf"(?<![\w-])s3://(?P<bucket_uri_name>{_BUCKET})"),
+    ("instance_id", rf"(?<![\w-])i-(?:[0-9a-f]{{17}}|[0-9a-f]{{8}}){_END}"),
+    ("ami_id", rf"(?<![\w-])ami-(?:[0-9a-f]{{17}}|[0-9a-f]{{8}}){_END}"),
+    ("security_group_id", rf"(?<![\w-])sg-(?:[0-9a-f]{{17}}|[0-9a-f]{{8}}){_END}"),
+    ("subnet_id", rf"(?<![\w-])subnet-(?:[0-9a-f]{{17}}|[0-9a-f]{{8}}){_END}"),
+    ("vpc_id", rf"(?<![\w-])vpc-(?:[0-9a-f]{{17}}|[0-9a-f]{{8}}){_END}"),
+    ("cidr", rf"(?<![\d.]){_OCTET}(?:\.{_OCTET}){{3}}/(?:3[0-2]|[12]?\d)(?![\d/])"),
+    ("region", r"(?<![\w-])(?:us|eu|ap|sa|ca|me|af|il|mx|cn)(?:-gov|-iso[a-z]?)?-"
+               rf"(?:north|south|east|west|central|northeast|southeast|northwest|southwest)-\d{_END}"),
+    # Every family: t3.micro, m7g.2xlarge, c6in.metal, u-6tb1.112xlarge, mac2-m2pro.metal ...
+    ("instance_type", r"(?<![\w.-])(?:u-\d+tb\d*|[a-z]{1,6}\d+[a-z0-9]*(?:-[a-z0-9]+)?)\."
+                      rf"(?:nano|micro|small|medium|large|\d*xlarge|metal(?:-\d+xl)?){_END}"),
+    ("bucket_named", rf"\bbucket\s+(?:(?:named|called)\s+)?(?!(?:{'|'.join(_NOT_BUCKETS)})\b)"
+                     rf"[`'\"]?(?P<bucket_named_name>{_BUCKET})"),
+]
+
+# Alternatives whose value is an inner group rather than the whole match.
+_VALUE_GROUP = {"bucket_uri": ("bucket", "bucket_uri_name"), "bucket_named": ("bucket", "bucket_named_name")}
+
+_ENTITY_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in _PATTERNS), re.IGNORECASE)
+_GROUP_NAMES = {_ENTITY_RE.groupindex[name]: name for name, _ in _PATTERNS}
+
+TYPES = ("arn", "bucket", "instance_id", "ami_id", "security_group_id", "subnet_id", "vpc_id",
+         "cidr", "region", "instance_type")
+
+
+def extract(text):
+    """All entities in `text` as Entity spans, in order of appearance."""
+    found = []
+    with metrics.timer("entities.extract"):
+        for match in _ENTITY_RE.finditer(text or ""):
+            # lastindex is the alternative that matched: its group closes after any inner group.
+            name = _GROUP_NAMES[match.lastindex]
+            kind, group = _VALUE_GROUP.get(name, (name, name))
+            value = match.group(group)
+            # Ids, types and regions are lowercase in AWS; ARNs and bucket URIs keep their case.
+            if kind not in ("arn", "bucket"):
+                value = value.lower()
+            found.append(Entity(kind, value, match.start(group), match.end(group)))
+    return found
+
+
+def find(text):
+    """{type: [values]} for every type, without duplicates, in order of appearance."""
+    grouped = {kind: [] for kind in TYPES}
+    for entity in extract(text):
+        if entity.value not in grouped[entity.type]:
+            grouped[entity.type].append(entity.value)
+    return grouped
+
+
+def first(text, kind, default=None):
+    return next((e.value for e in extract(text) if e.type == kind), default)
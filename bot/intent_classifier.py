@@ -0,0 +1,136 @@
+# bot/intent_classifier.py
+# Local intent classifier for messages the keyword router does not match.
+# Messages are embedded CPU-only as hashed word, word-bigram and character-trigram features
+# (no model download), and compared with precomputed vectors of example utterances by cosine
+# similarity in NumPy. Only a confident, unambiguous match is routed; knowledge questions (their
+# own example class) and everything else still go to the CrewAI agent. The share of messages
+# that fall back is exported as a metric.
+
+import os
+import re
+import zlib
+import threading
+import numpy as np
+from aws_crew_tools import metrics
+
+DIM = 4096
+THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.4"))
+MARGIN = float(os.getenv("INTENT_CLASSIFIER_MARGIN", "0.05"))
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-\.]*")
+
+ASK_AGENT = "ask_agent"
+
+# Intent -> example utterances. Intent names match the TeamsBot._intent_<name> handlers.
+EXAMPLES = {
+    "create_ec2": [
+        "launch a new ec2 instance", "spin up a server", "i need a virtual machine", "get me a vm",
+        "create an instance", "can you give me a t3 micro", "provision a linux box", "i want a new server",
+    ],
+    "create_vpc": [
+        "create a vpc", "set up a new network with subnets", "build me a virtual private cloud",
+        "i need a network with public and private subnets", "provision a vpc with a nat gateway",
+    ],
+    "create_bucket": [
+        "make a new s3 bucket", "i need storage for files", "create storage bucket", "new bucket please",
+    ],
+    "upload_file": [
+        "upload a file to s3", "put this file in my bucket", "store a document in s3", "send a file to the bucket",
+    ],
+    "download_file": [
+        "download a file from s3", "get a file from my bucket", "share a download link", "fetch an object from s3",
+    ],
+    "list_instances": [
+        "list my instances", "show ec2 instances", "what servers are running", "which vms do i have",
+        "show running instances",
+    ],
+    "list_buckets": [
+        "list my buckets", "show s3 buckets", "what buckets do i have", "show my storage",
+    ],
+    "list_vpcs": [
+        "list vpcs", "show my networks", "what vpcs exist", "show virtual private clouds",
+    ],
+    "iam_create_user": [
+        "add a new iam user", "create a user account for a colleague", "give someone aws access",
+        "onboard a new user",
+    ],
+    "iam_create_group": ["create an iam group", "make a new group for developers", "new user group"],
+    "iam_create_role": ["create an iam role", "make a role for ec2", "new service role"],
+    "iam_policy": [
+        "attach a policy", "give a user read only access", "grant admin permissions", "remove a policy from a group",
+    ],
+    "iam_delete": ["delete an iam user", "remove a user", "offboard a user", "delete a group"],
+    "iam_enable_mfa": ["turn on mfa", "set up two factor authentication", "enable multi factor auth for a user"],
+    "iam_audit": ["audit iam", "check iam security", "review permissions", "find users without mfa"],
+    "greeting": ["hello", "hi there", "good morning", "hey bot", "how are you doing"],
+    # Knowledge questions: matching these sends the message to the agent on purpose.
+    ASK_AGENT: [
+        "what is a nat gateway", "what does aws mean", "aws means", "explain iam roles", "how much does s3 cost",
+        "what is the difference between a security group and a nacl", "why is my instance unreachable",
+        "how do i connect to my server", "what is a subnet", "tell me about vpc peering", "what is cloud computing",
+        "how does auto scaling work", "best practices for s3 security",
+        "stop my instance", "start the server again", "reboot the vm",
+    ],
+}
+
+
+def _bucket(feature):
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % DIM, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def embed(text):
+    """L2-normalised hashed feature vector for `text`."""
+    vec = np.zeros(DIM, dtype=np.float32)
+    words = _WORD.findall(text.lower())
+    features = [(f"w:{w}", 1.0) for w in words]
+    features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f" {w} "
+        features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+    for feature, weight in features:
+        idx, sign = _bucket(feature)
+        vec[idx] += sign * weight
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class IntentClassifier:
+    def __init__(self, examples=EXAMPLES, threshold=THRESHOLD, margin=MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.labels = list(examples)
+        rows, owners = [], []
+        for label_idx, label in enumerate(self.labels):
+            for utterance in examples[label]:
+                rows.append(embed(utterance))
+                owners.append(label_idx)
+        # Example vectors are computed once; a query is one matrix-vector product.
+        self.matrix = np.vstack(rows)
+        self.owners = np.array(owners)
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._fallbacks = 0
+
+    def scores(self, text):
+        """Best cosine similarity per intent label."""
+        sims = self.matrix @ embed(text)
+        best = np.full(len(self.labels), -1.0, dtype=np.float32)
+        np.maximum.at(best, self.owners, sims)
+        return dict(zip(self.labels, best.tolist()))
+
+    def classify(self, text):
+        """(label, score) for a confident match, else (None, score)."""
+        with metrics.timer("classifier.classify"):
+            ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        (label, score), runner_up = ranked[0], (ranked[1][1] if len(ranked) > 1 else -1.0)
+        confident = label != ASK_AGENT and score >= self.threshold and score - runner_up >= self.margin
+        with self._lock:
+            self._seen += 1
+            self._fallbacks += 0 if confident else 1
+            metrics.set_gauge("classifier.fallback_rate", round(self._fallbacks / self._seen, 4))
+        metrics.incr("classifier.routed" if confident else "classifier.fallback")
+        return (label, score) if confident else (None, score)
+
+
+classifier = IntentClassifier()
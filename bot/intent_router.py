@@ -0,0 +1,99 @@
+# bot/intent_router.py
+# Compiled intent router for free-text messages.
+# Every rule is a list of phrase groups; a rule matches when each group has at least one of its
+# phrases in the message. All phrases of all rules are compiled into one index keyed by their
+# first token, so a message is tokenized once and scanned once, whatever the number of rules.
+# Matching is on whole tokens ("hi" no longer matches "this"), and the winner is the matching
+# rule with the highest priority, so rule order no longer matters.
+
+import re
+import time
+import logging
+from collections import namedtuple
+from aws_crew_tools import metrics
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9\-\._]*")
+
+Rule = namedtuple("Rule", "name groups priority")
+Intent = namedtuple("Intent", "name priority")
+
+
+def _norm(token):
+    # Cheap plural folding so "instances"/"instance" and "buckets"/"bucket" index the same.
+    token = token.rstrip(".")
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+
+def tokenize(text):
+    return [_norm(t) for t in _TOKEN.findall(text.lower())]
+
+
+class IntentRouter:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._index = {}  # first token -> [(phrase tokens, rule idx, group idx)]
+        for r_idx, rule in enumerate(self.rules):
+            for g_idx, group in enumerate(rule.groups):
+                for phrase in group:
+                    tokens = tuple(tokenize(phrase))
+                    self._index.setdefault(tokens[0], []).append((tokens, r_idx, g_idx))
+        # Longest phrases first so a multi-word phrase is tried before its prefix.
+        for entries in self._index.values():
+            entries.sort(key=lambda e: -len(e[0]))
+
+    def matches(self, text):
+        """All matching rules as Intents, best first."""
+        tokens = tokenize(text)
+        satisfied = {}
+        for pos, token in enumerate(tokens):
+            for phrase, r_idx, g_idx in self._index.get(token, ()):
+                if tuple(tokens[pos:pos + len(phrase)]) == phrase:
+                    satisfied.setdefault(r_idx, set()).add(g_idx)
+        hits = [self.rules[r] for r, groups in satisfied.items() if len(groups) == len(self.rules[r].groups)]
+        hits.sort(key=lambda rule: (-rule.priority, self.rules.index(rule)))
+        return [Intent(rule.name, rule.priority) for rule in hits]
+
+    def route(self, text):
+        """Best matching Intent, or None when the message should go to the LLM fallback."""
+        started = time.perf_counter()
+        found = self.matches(text)
+        metrics.observe("router.route", time.perf_counter() - started)
+        if not found:
+            metrics.incr("router.fallback")
+            return None
+        metrics.incr(f"router.intent.{found[0].name}")
+        return found[0]
+
+
+# "start" is not here: "start instance i-..." is about an existing instance (see ec2_power).
+CREATE = ["create", "launch", "new", "build", "provision", "setup", "set up", "make", "spin up"]
+
+RULES = [
+    Rule("bucket_stats", [["bucket stats", "bucket size", "bucket statistics", "largest prefixes"]], 90),
+    # Ahead of creation and listings so "start the server" or "stop instances in all regions" reach the agent.
+    Rule("ec2_power", [["start", "stop", "reboot", "restart", "shut down", "power on", "power off",
+                        "turn on", "turn off"],
+                       ["ec2", "instance", "vm", "server"]], 85),
+    Rule("multi_region_list", [["all regions", "every region", "each region", "all the regions"],
+                               ["security group", "sg", "subnet", "vpc", "instance", "ec2", "server"]], 80),
+    Rule("list_instance_profiles", [["list", "show"], ["instance profile"]], 70),
+    Rule("create_vpc", [CREATE, ["vpc"]], 60),
+    Rule("create_ec2", [CREATE, ["ec2", "instance", "vm", "server"]], 55),
+    Rule("iam_create_user", [["create", "new", "add"], ["iam user"]], 60),
+    Rule("iam_create_group", [["create", "new", "add"], ["iam group"]], 60),
+    Rule("iam_create_role", [["create", "new", "add"], ["iam role"]], 60),
+    Rule("create_bucket", [["create", "new", "make"], ["bucket"]], 50),
+    Rule("upload_file", [["upload"], ["file", "s3", "bucket", "object"]], 50),
+    Rule("download_file", [["download"], ["file", "s3", "bucket", "object"]], 50),
+    Rule("iam_inline_policy", [["inline policy"]], 45),
+    Rule("iam_policy", [["attach", "detach"], ["policy"]], 44),
+    Rule("iam_attach_user_group", [["attach", "add"], ["user"], ["group"]], 42),
+    Rule("iam_enable_mfa", [["enable mfa", "mfa user", "mfa for", "setup mfa", "set up mfa"]], 40),
+    Rule("iam_audit", [["audit"], ["iam"]], 40),
+    Rule("iam_delete", [["delete", "remove"], ["iam", "user", "group", "role"]], 30),
+    Rule("greeting", [["hi", "hello", "hey", "yo", "how are you"]], 1),
+]
+
+router = IntentRouter(RULES)
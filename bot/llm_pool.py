@@ -0,0 +1,105 @@
+# bot/llm_pool.py
+# Worker pool for LLM work, in front of the model server.
+# At most LLM_CONCURRENCY calls run against Ollama at once; everything else waits in a bounded
+# priority queue where interactive chat goes ahead of background work (FIFO within a priority).
+# A full queue refuses new work at once (PoolBusy) instead of piling up, and a job whose turn
+# deadline passed while it was queued is dropped without calling the model. Queue wait and
+# service time are reported separately, per priority.
+
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from aws_crew_tools import metrics
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+
+INTERACTIVE = 0
+BACKGROUND = 10
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class PoolBusy(Exception):
+    """The queue is full; the caller should answer without the LLM."""
+
+
+class QueueTimeout(Exception):
+    """The job's deadline passed before a worker picked it up; the model was not called."""
+
+
+class LLMWorkerPool:
+    def __init__(self, concurrency=CONCURRENCY, max_queue=QUEUE_SIZE):
+        self.concurrency = concurrency
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._busy = 0
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._worker, name=f"llm-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _gauges(self):
+        metrics.set_gauge("llm_pool.queue_depth", self._queue.qsize())
+        metrics.set_gauge("llm_pool.busy", self._busy)
+
+    def submit(self, fn, priority=INTERACTIVE, deadline=None):
+        """
+        Queue fn(); returns a Future. deadline is a time.monotonic() value or None.
+        fn runs in a copy of the caller's context, so context variables (e.g. the conversation
+        for the tool cache) carry over to the worker.
+        """
+        self._start()
+        future = Future()
+        run = contextvars.copy_context().run
+        try:
+            self._queue.put_nowait((priority, next(self._seq), time.monotonic(), deadline,
+                                    lambda: run(fn), future))
+        except queue.Full:
+            metrics.incr("llm_pool.rejected")
+            raise PoolBusy(f"{self._queue.maxsize} LLM requests are already waiting")
+        self._gauges()
+        return future
+
+    def _worker(self):
+        while True:
+            priority, _, enqueued, deadline, fn, future = self._queue.get()
+            name = _PRIORITY_NAMES.get(priority, str(priority))
+            started = time.monotonic()
+            metrics.observe(f"llm_pool.queue_wait.{name}", started - enqueued)
+            if not future.set_running_or_notify_cancel():
+                metrics.incr("llm_pool.cancelled")
+                self._gauges()
+                continue
+            if deadline is not None and started >= deadline:
+                metrics.incr("llm_pool.expired")
+                future.set_exception(QueueTimeout(f"deadline passed after {started - enqueued:.1f}s in the queue"))
+                self._gauges()
+                continue
+
+            with self._lock:
+                self._busy += 1
+            self._gauges()
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                metrics.observe(f"llm_pool.service.{name}", time.monotonic() - started)
+                self._gauges()
+
+
+pool = LLMWorkerPool()
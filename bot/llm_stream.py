@@ -0,0 +1,105 @@
+# bot/llm_stream.py
+# Streaming of LLM tokens from the CrewAI agent into a chat turn.
+# With LLM_STREAMING on, the LLM is created with stream=True and CrewAI publishes every chunk on
+# its event bus. A TokenStream is bound to the worker that runs crew.kickoff() (context variable),
+# so concurrent turns each only see their own tokens. The bot polls the stream and edits a
+# placeholder message; before the agent reaches "Final Answer:" it shows what the agent is
+# doing (thought or tool), afterwards the answer as it is written.
+
+import os
+import re
+import time
+import logging
+import threading
+import contextvars
+from aws_crew_tools import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("LLM_STREAMING", "true").lower() == "true"
+UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "1.0"))
+
+try:
+    from crewai.events import crewai_event_bus, LLMCallStartedEvent, LLMStreamChunkEvent
+except ImportError:
+    try:
+        from crewai.utilities.events import crewai_event_bus, LLMCallStartedEvent, LLMStreamChunkEvent
+    except ImportError:  # CrewAI without stream events: answers arrive in one piece
+        crewai_event_bus = None
+
+_current = contextvars.ContextVar("llm_stream", default=None)
+_install_lock = threading.Lock()
+_installed = False
+
+_FINAL = "Final Answer:"
+_ACTION = re.compile(r"Action:\s*([^\n]+)")
+
+
+class TokenStream:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._text = ""  # output of the LLM call in progress
+        self.version = 0
+        self.started = time.monotonic()
+        self.first_token_at = None
+
+    def new_call(self):
+        # The agent calls the LLM once per reasoning step; only the current step is shown.
+        with self._lock:
+            self._text = ""
+            self.version += 1
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        with self._lock:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+                metrics.observe("llm.time_to_first_token", self.first_token_at - self.started)
+            self._text += chunk
+            self.version += 1
+
+    def visible(self):
+        """What to show for the tokens so far, or "" when there is nothing worth showing yet."""
+        with self._lock:
+            text = self._text
+        if _FINAL in text:
+            return text.split(_FINAL, 1)[1].strip()
+        actions = _ACTION.findall(text)
+        if actions:
+            return f"🔧 Using `{actions[-1].strip()}`…"
+        thought = text.replace("Thought:", "").strip()
+        return f"💭 _{thought[-300:]}_" if thought else ""
+
+
+def _on_call_started(source, event):
+    stream = _current.get()
+    if stream is not None:
+        stream.new_call()
+
+
+def _on_chunk(source, event):
+    stream = _current.get()
+    if stream is not None:
+        stream.feed(getattr(event, "chunk", ""))
+
+
+def available():
+    """True when streaming is on and CrewAI publishes chunk events (handlers installed once)."""
+    global _installed
+    if not ENABLED or crewai_event_bus is None:
+        return False
+    with _install_lock:
+        if not _installed:
+            crewai_event_bus.on(LLMCallStartedEvent)(_on_call_started)
+            crewai_event_bus.on(LLMStreamChunkEvent)(_on_chunk)
+            _installed = True
+    return True
+
+
+def bind(stream, fn, *args, **kwargs):
+    """Callable for a worker thread: runs fn with `stream` receiving this thread's tokens."""
+    def run():
+        _current.set(stream)
+        return fn(*args, **kwargs)
+    return run
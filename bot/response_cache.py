@@ -0,0 +1,171 @@
+# bot/response_cache.py
+# Response cache for the CrewAI fallback.
+# Answers are keyed by the normalised message. A miss on the exact key may still be served by a
+# cached message with exactly the same set of words (only order or filler differ) whose hashed
+# embedding is nearly identical and which names the same AWS identifiers. Negations and polarity
+# words ("not", "disable", "stopped", "read only") are words like any other, so "enable
+# versioning" never answers "disable versioning" and "terminate i-aaa" never answers
+# "terminate i-bbb". Entries expire after a TTL and the least recently used are evicted; the
+# cache is written to a JSON file under state/ and reloaded on start. Callers decide what may
+# be cached (crew_handler skips answers that used mutating tools).
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from aws_crew_tools import metrics
+from bot import entities
+from bot.intent_classifier import embed
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("RESPONSE_CACHE_FILE", os.path.join("state", "response_cache.json"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+# Answers built from read-only tool output (listings) go stale quickly.
+TOOL_TTL = int(os.getenv("RESPONSE_CACHE_TOOL_TTL", "60"))
+SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+ENABLED = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+
+_PUNCT = re.compile(r"[^\w\s\-\./:]")
+# Words that never change the answer; dropped from the key. Never add negations here.
+_FILLER = {"a", "an", "the", "please", "pls", "can", "could", "would", "you", "me", "tell", "hey", "hi"}
+
+
+def normalise(text):
+    return " ".join(w for w in _PUNCT.sub(" ", text.lower()).split() if w not in _FILLER)
+
+
+def _words(key):
+    return frozenset(key.split())
+
+
+def _signature(text):
+    return sorted({f"{e.type}:{e.value.lower()}" for e in entities.extract(text)})
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttl=TTL, similarity=SIMILARITY):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = None  # key -> {"answer", "expires", "seconds", "entities"}, oldest first
+        self._vectors = {}    # key -> embedding, rebuilt from keys on load
+        self._by_words = {}   # word set -> keys with exactly those words
+        self._lookups = 0
+        self._hits = 0
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    stored = json.load(f)
+            except ValueError:
+                logger.warning(f"[ResponseCache] Ignoring unreadable {self.path}")
+                stored = []
+            now = time.time()
+            for key, entry in stored:
+                if entry["expires"] > now:
+                    self._add(key, entry)
+        metrics.set_gauge("response_cache.entries", len(self._entries))
+
+    def _save(self):
+        # Write to a temp file and rename so a crash never leaves a half-written cache.
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(tmp, self.path)
+
+    def _add(self, key, entry):
+        self._entries[key] = entry
+        self._vectors[key] = embed(key)
+        self._by_words.setdefault(_words(key), set()).add(key)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+        same = self._by_words.get(_words(key), set())
+        same.discard(key)
+        if not same:
+            self._by_words.pop(_words(key), None)
+
+    def _similar(self, key, signature, now):
+        # Only messages made of the same words are candidates; the embedding then rules out
+        # reorderings that change the meaning ("copy a to b" / "copy b to a").
+        keys = [k for k in self._by_words.get(_words(key), ()) if k != key]
+        if not keys:
+            return None
+        sims = np.vstack([self._vectors[k] for k in keys]) @ embed(key)
+        for idx in np.argsort(-sims):
+            if sims[idx] < self.similarity:
+                break
+            entry = self._entries[keys[idx]]
+            if entry["expires"] > now and entry["entities"] == signature:
+                return keys[idx]
+        return None
+
+    def get(self, text):
+        """Cached answer for `text` (exact or near-duplicate), or None."""
+        if not ENABLED:
+            return None
+        key = normalise(text)
+        now = time.time()
+        with self._lock, metrics.timer("response_cache.lookup"):
+            self._load()
+            entry = self._entries.get(key)
+            if entry and entry["expires"] <= now:
+                self._drop(key)
+                entry = None
+            kind = "exact"
+            if entry is None:
+                kind = "similar"
+                match = self._similar(key, _signature(text), now)
+                entry = self._entries.get(match) if match else None
+                key = match
+            self._lookups += 1
+            if entry is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            metrics.set_gauge("response_cache.hit_rate", round(self._hits / self._lookups, 4))
+        if entry is None:
+            metrics.incr("response_cache.miss")
+            return None
+        metrics.incr(f"response_cache.hit.{kind}")
+        metrics.incr("response_cache.saved_seconds", entry["seconds"])
+        return entry["answer"]
+
+    def put(self, text, answer, seconds, ttl=None):
+        """Cache `answer`; `seconds` is what producing it cost, reported back as savings on hits."""
+        if not ENABLED:
+            return
+        key = normalise(text)
+        with self._lock:
+            self._load()
+            self._drop(key)
+            self._add(key, {
+                "answer": answer,
+                "expires": time.time() + (self.ttl if ttl is None else ttl),
+                "seconds": round(seconds, 3),
+                "entities": _signature(text),
+            })
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                metrics.incr("response_cache.evicted")
+            metrics.set_gauge("response_cache.entries", len(self._entries))
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"[ResponseCache] Could not persist cache: {e}")
+
+
+cache = ResponseCache()
@@ -1,21 +1,22 @@
 import os
+import time
+import asyncio
 import base64
 import logging
-import re
 import requests
-import spacy
 from botbuilder.core import TurnContext, MessageFactory
 from botbuilder.schema import Attachment
 from botbuilder.core.teams import TeamsActivityHandler
-from crew_handler import process_user_message
-from bot import adaptive_cards
-from botbuilder.schema import Activity
-from aws_crew_tools import iam
+from crew_handler import process_user_message, TURN_DEADLINE
+from bot import adaptive_cards, transfer_sessions, intent_router, intent_classifier, entities, llm_stream
+from botbuilder.schema import Activity, ActivityTypes
+from aws_crew_tools import iam, idempotency, metrics, tool_cache
 import pyotp
 import qrcode
 import io
-from aws_crew_tools.ec2 import create_instance, list_instance_profiles
-from aws_crew_tools.vpc import create_vpc_advanced
+from aws_crew_tools.ec2 import create_instance, list_instance_profiles, list_instances, list_security_groups, list_subnets
+from aws_crew_tools.vpc import create_vpc_advanced, list_vpcs, rollback_vpc_build
+from aws_crew_tools import regions, s3_inventory, s3_preview
 from botbuilder.schema.teams import TaskModuleRequest
 from botbuilder.schema.teams import TaskModuleContinueResponse, TaskModuleTaskInfo, TaskModuleResponse
 from bot.adaptive_cards import (
@@ -60,33 +61,44 @@ logging.basicConfig(filename='bot.log',
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load NLP
-try:
-    nlp = spacy.load("en_core_web_sm")
-except Exception:
-    import spacy.cli
-    spacy.cli.download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
-
-# Intent matchers
-launch_triggers = [
-    "create an instance", "launch ec2", "new ec2", "create ec2",
-    "spin up server", "start a vm", "make ec2", "build instance", "i want instance"
-]
+async def send_card(turn_context: TurnContext, card: dict):
+    await turn_context.send_activity(
+        MessageFactory.attachment(
+            Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
+        )
+    )
 
-greeting_triggers = ["hi", "hello", "hey", "yo", "how are you"]
-vpc_triggers = ["create vpc", "launch vpc", "build vpc", "new vpc"]
 
+def _format_choices(choices):
+    return "\n".join(f"- {c['title']}" for c in choices)
+
+# Multi-region listings: keywords -> (title, fn(region, client) returning text)
+MULTI_REGION_LISTINGS = [
+    (["security group", " sg"], "🛡️ Security Groups", lambda region, client: _format_choices(list_security_groups(region, client))),
+    (["subnet"], "🔀 Subnets", lambda region, client: _format_choices(list_subnets(region, client))),
+    (["vpc"], "🌐 VPCs", lambda region, client: list_vpcs(region, client)),
+    (["instance", "ec2", "server"], "🖥️ EC2 Instances", lambda region, client: list_instances(region, client)),
+]
+EMPTY_REGION_RESULTS = {"", "No instances found.", "No VPCs found."}
+FANOUT_UPDATE_INTERVAL = float(os.getenv("FANOUT_UPDATE_INTERVAL", "1.0"))
 
 
-def is_intent_match(user_input: str, trigger_list: list, threshold=80) -> bool:
-    from fuzzywuzzy import fuzz
-    user_input = user_input.lower()
-    return any(fuzz.partial_ratio(user_input, phrase) >= threshold for phrase in trigger_list)
 
 def parse_bool(val: str) -> bool:
     return val.strip().lower() == "true" if isinstance(val, str) else False
 
+def submission_token(turn_context: TurnContext, data: dict) -> str:
+    """
+    Deterministic client token for a card submission: the same card submitted twice
+    (or retried by Teams) maps to the same token. Retry cards carry the token explicitly.
+    """
+    if data.get("client_token"):
+        return data["client_token"]
+    activity = turn_context.activity
+    user_id = activity.from_property.id if activity.from_property else ""
+    fields = {k: v for k, v in data.items() if k != "msteams"}
+    return idempotency.client_token(user_id, activity.reply_to_id or "", fields)
+
 def generate_subnet_requests(data):
     public_count = int(data.get("public_subnet_count", 0))
     private_count = int(data.get("private_subnet_count", 0))
@@ -106,9 +118,37 @@ def generate_subnet_requests(data):
 
     return subnet_requests
 
+def upload_task_info(turn_context: TurnContext):
+    # The session lets the browser upload straight to S3 and still report back into this chat.
+    reference = TurnContext.get_conversation_reference(turn_context.activity)
+    session_id = transfer_sessions.create(reference.serialize(), turn_context.activity.from_property.id)
+    return TaskModuleTaskInfo(
+        title="Upload File to S3",
+        height="medium",
+        width="medium",
+        url=f"{BASE_URL}/upload?session={session_id}",
+        fallback_url=f"{BASE_URL}/upload?session={session_id}"
+    )
+
+# Card submissions that change AWS resources. They call boto3 directly rather than the agent's
+# tools, so the agent's memoized listings are dropped after them (see tool_cache).
+MUTATING_CARD_ACTIONS = {
+    "create_ec2", "create_vpc", "rollback_vpc", "create_s3_bucket", "create_iam_user", "create_iam_group",
+    "attach_user_to_group", "delete_iam_user", "mfa_finish", "create_iam_role", "create_inline_policy",
+}
+
 class TeamsBot(TeamsActivityHandler):
 
     async def on_message_activity(self, turn_context: TurnContext):
+        data = turn_context.activity.value
+        try:
+            await self._on_message(turn_context)
+        finally:
+            if isinstance(data, dict) and (data.get("action") in MUTATING_CARD_ACTIONS
+                                           or data.get("submit_action") == "iam_policy_action"):
+                tool_cache.invalidate_region(data.get("region"))
+
+    async def _on_message(self, turn_context: TurnContext):
         activity = turn_context.activity
         if activity.attachments and activity.attachments[0].content_type.startswith("application/"):
           user_id = turn_context.activity.from_property.id
@@ -151,6 +191,9 @@ class TeamsBot(TeamsActivityHandler):
                 return
             if action == "create_vpc":
                 await self._handle_vpc_creation(data, turn_context)
+                return
+            if action == "rollback_vpc":
+                await self._handle_vpc_rollback(data, turn_context)
                 return
                         # 🔐 IAM Card Submissions Routing
             if action == "create_iam_user":
@@ -222,13 +265,7 @@ class TeamsBot(TeamsActivityHandler):
                 return
 
             elif action == "open_upload_module":
-                task_info = TaskModuleTaskInfo(
-                    title="Upload File to S3",
-                    height="medium",
-                    width="medium",
-                    url=f"{BASE_URL}/upload",
-                    fallback_url=f"{BASE_URL}/upload"
-            )
+                task_info = upload_task_info(turn_context)
                 continue_response = TaskModuleContinueResponse(value=task_info)
                 invoke_response = TaskModuleResponse(task=continue_response)
 
@@ -241,229 +278,284 @@ class TeamsBot(TeamsActivityHandler):
             elif action == "generate_download_link":
                     await self._handle_s3_download_link(data, turn_context)
                     return
+
+            elif action == "preview_object":
+                    await self._handle_s3_preview(data, turn_context)
+                    return
+
+            elif action in ("zip_select", "download_zip"):
+                    await self._handle_s3_zip(data, turn_context)
+                    return
             
 
         
         elif activity.text:
             user_message = activity.text.strip().lower()
-
-            doc = nlp(user_message)
-
-            if any(greet in user_message for greet in greeting_triggers):
-                await turn_context.send_activity("👋 Hello! How can I help you today?")
-                return
-
-            # 🌐 Match VPC intents
-            if any(word in user_message for word in ["create", "launch", "new"]) and "vpc" in user_message:
-                card = adaptive_cards.vpc_full_creation_card()
-                await turn_context.send_activity(
-                    MessageFactory.attachment(
-                        Attachment(
-                            content_type="application/vnd.microsoft.card.adaptive",
-                            content=card
-                        )
-                    )
-                )
-                return
-
-            # 🚀 Match EC2 intents
-            if any(word in user_message for word in ["create", "launch", "new"]) and "ec2" in user_message:
-                detected_type = next((token.text for token in doc if re.match(r"t\d+\.\w+", token.text)), "t2.micro")
-                card = adaptive_cards.ec2_launch_card()
-                for item in card["body"]:
-                    if item.get("id") == "InstanceType":
-                        item["value"] = detected_type
-                        break
-                await turn_context.send_activity(
-                    MessageFactory.attachment(
-                        Attachment(
-                            content_type="application/vnd.microsoft.card.adaptive",
-                            content=card
-                        )
-                    )
-                )
-                return
-
-
-            if "list instance profiles" in user_message.lower():
-                profiles = list_instance_profiles()
-                if isinstance(profiles, list):
-                    formatted = "\n".join(f"- {p}" for p in profiles)
-                    await turn_context.send_activity(f"🧾 **Available Instance Profiles:**\n{formatted}")
-                else:
-                    await turn_context.send_activity(profiles)
-                return
-            
-            # 🪣 S3: Create Bucket
-            if "create" in user_message and "bucket" in user_message:
-                card = s3_create_bucket_card()
-                await turn_context.send_activity(
-                     MessageFactory.attachment(
-                          Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
-                     )
-                )
-                return
-        
-
-            # 🪣 S3: Upload to Bucket
             logging.info(f"[UserMessage] Received: {user_message}")
-            if "upload" in user_message and ("file" in user_message or "s3" in user_message or "upload file" in user_message):
-                logging.info("[IntentMatch] Upload file intent matched.")
-                success, buckets = list_s3_buckets()
-                if success:
-                   card = s3_upload_file_card([b["name"] for b in buckets])
-                   await turn_context.send_activity(
-                        MessageFactory.attachment(
-                           Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
-                        )
-                   )
-                else:
-                    await turn_context.send_activity(buckets)
+            deadline = time.monotonic() + TURN_DEADLINE
+            # One regex pass over the original text (ARNs and s3:// URIs keep their case).
+            found = entities.find(activity.text)
+
+            intent = intent_router.router.route(user_message)
+            if intent:
+                logging.info(f"[IntentMatch] {intent.name}")
+                await getattr(self, f"_intent_{intent.name}")(user_message, found, turn_context)
                 return
-        
 
-            # 🪣 S3: Download from Bucket
-            if "download" in user_message and "file" in user_message or "s3" in user_message:
-                success, buckets = list_s3_buckets()
-                if success:
-                   card = s3_download_file_card([b["name"] for b in buckets])
-                   await turn_context.send_activity(
-                      MessageFactory.attachment(
-                        Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
-                      )
-                   )
-                else:
-                  await turn_context.send_activity(buckets)
-                return
-            
-                        # 🔐 IAM: Create User
-            if "create" in user_message and "iam user" in user_message:
-                policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
-                card = iam_create_user_card(policies)
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
-
-            # 👥 IAM: Create Group
-            if "create" in user_message and "iam group" in user_message:
-                policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
-                card = iam_create_group_card(policies)
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
-
-            # ➕ IAM: Attach User to Group
-            if "attach" in user_message and "user" in user_message and "group" in user_message:
-                data = list_iam_users_and_groups()
-                if "error" in data:
-                    await turn_context.send_activity(data["error"])
-                    return
-                card = iam_attach_user_group_card([u["UserName"] for u in data["users"]], [g["GroupName"] for g in data["groups"]])
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
+            # No keyword hit: try the local classifier before the (slow) LLM agent.
+            label, score = intent_classifier.classifier.classify(user_message)
+            if label:
+                logging.info(f"[IntentClassifier] {label} ({score:.2f})")
+                await getattr(self, f"_intent_{label}")(user_message, found, turn_context)
                 return
 
-            # 📜 IAM: Attach/Detach Policy
-            if "policy" in user_message and ("attach" in user_message or "detach" in user_message):
-                data = list_iam_users_and_groups()
-                if "error" in data:
-                    await turn_context.send_activity(data["error"])
-                    return
-
-                users = [u["UserName"] for u in data["users"]]
-                groups = [g["GroupName"] for g in data["groups"]]
-                policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
-
-    # ✅ NEW WAY: pass both users and groups
-                card = adaptive_cards.iam_attach_detach_policy_card(
-                users=users,
-                groups=groups,
-                policies=policies
-    )
-
-                await turn_context.send_activity(
-                   MessageFactory.attachment(
-                        Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
-                )
-          )
-                return
-
-            # 📄 IAM: Inline Policy
-            if "inline policy" in user_message:
-                data = list_iam_users_and_groups()
-                if "error" in data:
-                    await turn_context.send_activity(data["error"])
-                    return
-                entities = [u["UserName"] for u in data["users"]] + [g["GroupName"] for g in data["groups"]]
-                card = iam_inline_policy_card(entities)
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
+            # CrewAI NLP fallback (off the event loop, bounded by the turn deadline)
+            await self._answer_with_agent(user_message, deadline, turn_context)
+    
+    # --- Free-text intents (see bot/intent_router.py) ---
+
+    async def _intent_greeting(self, user_message, found, turn_context: TurnContext):
+        await turn_context.send_activity("👋 Hello! How can I help you today?")
+
+    async def _intent_create_vpc(self, user_message, found, turn_context: TurnContext):
+        card = adaptive_cards.vpc_full_creation_card()
+        adaptive_cards.prefill_inputs(card, {"vpc_cidr": found["cidr"][0] if found["cidr"] else None})
+        await send_card(turn_context, card)
+
+    async def _intent_create_ec2(self, user_message, found, turn_context: TurnContext):
+        card = adaptive_cards.ec2_launch_card()
+        adaptive_cards.prefill_inputs(card, {
+            "InstanceType": found["instance_type"][0] if found["instance_type"] else "t2.micro",
+            "AmiId": found["ami_id"][0] if found["ami_id"] else None,
+            "SecurityGroupId": found["security_group_id"][0] if found["security_group_id"] else None,
+            "SubnetId": found["subnet_id"][0] if found["subnet_id"] else None,
+        })
+        await send_card(turn_context, card)
+
+    async def _intent_ec2_power(self, user_message, found, turn_context: TurnContext):
+        # Start/stop/reboot act on an existing instance; the agent has those tools.
+        await self._answer_with_agent(user_message, time.monotonic() + TURN_DEADLINE, turn_context)
+
+    async def _intent_multi_region_list(self, user_message, found, turn_context: TurnContext):
+        # 🌍 Multi-region listings (streamed region by region)
+        listing = next((l for l in MULTI_REGION_LISTINGS if any(k in f" {user_message}" for k in l[0])), None)
+        if listing:
+            await self._handle_multi_region_list(listing[1], listing[2], turn_context)
+        else:
+            await turn_context.send_activity("❓ What should I list across all regions? Try instances, VPCs, subnets or security groups.")
+
+    async def _intent_list_instance_profiles(self, user_message, found, turn_context: TurnContext):
+        profiles = list_instance_profiles()
+        if isinstance(profiles, list):
+            formatted = "\n".join(f"- {p}" for p in profiles)
+            await turn_context.send_activity(f"🧾 **Available Instance Profiles:**\n{formatted}")
+        else:
+            await turn_context.send_activity(profiles)
+
+    async def _intent_list_instances(self, user_message, found, turn_context: TurnContext):
+        await turn_context.send_activity(f"🖥️ **EC2 Instances:**\n{await asyncio.to_thread(list_instances)}")
+
+    async def _intent_list_vpcs(self, user_message, found, turn_context: TurnContext):
+        await turn_context.send_activity(f"🌐 **VPCs:**\n{await asyncio.to_thread(list_vpcs)}")
+
+    async def _intent_list_buckets(self, user_message, found, turn_context: TurnContext):
+        success, buckets = await asyncio.to_thread(list_s3_buckets)
+        if not success:
+            await turn_context.send_activity(buckets)
+            return
+        formatted = "\n".join(f"- {b['name']} ({b['region']})" for b in buckets) or "No buckets found."
+        await turn_context.send_activity(f"🪣 **S3 Buckets:**\n{formatted}")
+
+    async def _intent_create_bucket(self, user_message, found, turn_context: TurnContext):
+        card = s3_create_bucket_card()
+        adaptive_cards.prefill_inputs(card, {
+            "bucket_name": found["bucket"][0] if found["bucket"] else None,
+            "region": found["region"][0] if found["region"] else None,
+        })
+        await send_card(turn_context, card)
+
+    async def _intent_bucket_stats(self, user_message, found, turn_context: TurnContext):
+        await self._handle_bucket_stats(user_message, turn_context, found["bucket"][0] if found["bucket"] else None)
+
+    async def _intent_upload_file(self, user_message, found, turn_context: TurnContext):
+        success, buckets = list_s3_buckets()
+        if success:
+            card = s3_upload_file_card([b["name"] for b in buckets])
+            adaptive_cards.prefill_inputs(card, {"bucket_name": found["bucket"][0] if found["bucket"] else None})
+            await send_card(turn_context, card)
+        else:
+            await turn_context.send_activity(buckets)
+
+    async def _intent_download_file(self, user_message, found, turn_context: TurnContext):
+        success, buckets = list_s3_buckets()
+        if success:
+            card = s3_download_file_card([b["name"] for b in buckets])
+            adaptive_cards.prefill_inputs(card, {"bucket_name": found["bucket"][0] if found["bucket"] else None})
+            await send_card(turn_context, card)
+        else:
+            await turn_context.send_activity(buckets)
+
+    async def _intent_iam_create_user(self, user_message, found, turn_context: TurnContext):
+        policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
+        await send_card(turn_context, iam_create_user_card(policies))
+
+    async def _intent_iam_create_group(self, user_message, found, turn_context: TurnContext):
+        policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
+        await send_card(turn_context, iam_create_group_card(policies))
+
+    async def _intent_iam_create_role(self, user_message, found, turn_context: TurnContext):
+        policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
+        await send_card(turn_context, iam_create_role_card(policies))
+
+    async def _intent_iam_attach_user_group(self, user_message, found, turn_context: TurnContext):
+        data = list_iam_users_and_groups()
+        if "error" in data:
+            await turn_context.send_activity(data["error"])
+            return
+        await send_card(turn_context, iam_attach_user_group_card([u["UserName"] for u in data["users"]],
+                                                                 [g["GroupName"] for g in data["groups"]]))
 
-            # 🛡️ IAM: Create Role
-            if "create" in user_message and "iam role" in user_message:
-                policies = ["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
-                card = iam_create_role_card(policies)
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
+    async def _intent_iam_policy(self, user_message, found, turn_context: TurnContext):
+        data = list_iam_users_and_groups()
+        if "error" in data:
+            await turn_context.send_activity(data["error"])
+            return
+        card = adaptive_cards.iam_attach_detach_policy_card(
+            users=[u["UserName"] for u in data["users"]],
+            groups=[g["GroupName"] for g in data["groups"]],
+            policies=["ReadOnlyAccess", "AdministratorAccess", "PowerUserAccess"]
+        )
+        await send_card(turn_context, card)
 
-            # ❌ IAM: Delete User/Group/Role
-            if "delete" in user_message and ("iam" in user_message or "user" in user_message or "group" in user_message or "role" in user_message):
-                data = list_iam_users_and_groups()
-                if "error" in data:
-                    await turn_context.send_activity(data["error"])
-                    return
-                card = iam_delete_card([u["UserName"] for u in data["users"]],
-                                       [g["GroupName"] for g in data["groups"]],
-                                       [])  # add role list if needed later
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
+    async def _intent_iam_inline_policy(self, user_message, found, turn_context: TurnContext):
+        data = list_iam_users_and_groups()
+        if "error" in data:
+            await turn_context.send_activity(data["error"])
+            return
+        entities = [u["UserName"] for u in data["users"]] + [g["GroupName"] for g in data["groups"]]
+        await send_card(turn_context, iam_inline_policy_card(entities))
 
-            # 🔐 IAM: Enable MFA
-            if "enable mfa" in user_message or "mfa user" in user_message:
-                data = list_iam_users_and_groups()
-                if "error" in data:
-                    await turn_context.send_activity(data["error"])
-                    return
-                card = adaptive_cards.iam_enable_mfa_card_step1([u["UserName"] for u in data["users"]])
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
+    async def _intent_iam_delete(self, user_message, found, turn_context: TurnContext):
+        data = list_iam_users_and_groups()
+        if "error" in data:
+            await turn_context.send_activity(data["error"])
+            return
+        card = iam_delete_card([u["UserName"] for u in data["users"]],
+                               [g["GroupName"] for g in data["groups"]],
+                               [])  # add role list if needed later
+        await send_card(turn_context, card)
+
+    async def _intent_iam_enable_mfa(self, user_message, found, turn_context: TurnContext):
+        data = list_iam_users_and_groups()
+        if "error" in data:
+            await turn_context.send_activity(data["error"])
+            return
+        await send_card(turn_context, adaptive_cards.iam_enable_mfa_card_step1([u["UserName"] for u in data["users"]]))
 
-            # 🧠 IAM: Audit
-            if "audit" in user_message and "iam" in user_message:
-                card = iam_audit_card()
-                await turn_context.send_activity(MessageFactory.attachment(Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)))
-                return
+    async def _intent_iam_audit(self, user_message, found, turn_context: TurnContext):
+        await send_card(turn_context, iam_audit_card())
 
-            # CrewAI NLP fallback
-            response = process_user_message(user_message)
-            if isinstance(response, dict):
-                await turn_context.send_activity(
-                    MessageFactory.attachment(
-                        Attachment(
-                            content_type="application/vnd.microsoft.card.adaptive",
-                            content=response
-                        )
-                    )
-                )
-            elif response:
-                await turn_context.send_activity(response)
-            else:
-                await turn_context.send_activity("Sorry, I couldn't process your request.")
-    
     async def on_teams_task_module_fetch(self, turn_context: TurnContext, task_module_request: TaskModuleRequest):
         data = task_module_request.data
 
         if data.get("action") == "open_upload_module":
-            task_info = TaskModuleTaskInfo(
-                title="Upload File to S3",
-                height="medium",
-                width="medium",
-                url=f"{BASE_URL}/upload",
-                fallback_url=f"{BASE_URL}/upload"
-        )
+            task_info = upload_task_info(turn_context)
         return TaskModuleResponse(task=TaskModuleContinueResponse(value=task_info))
 
 
                 
 
+    async def _answer_with_agent(self, user_message, deadline, turn_context: TurnContext):
+        # Read-only tool results are shared by the agent runs of this conversation.
+        tool_cache.use_conversation(turn_context.activity.conversation.id)
+        stream = llm_stream.TokenStream() if llm_stream.available() else None
+        if stream is None:
+            response = await asyncio.to_thread(process_user_message, user_message, deadline)
+            if isinstance(response, dict):
+                await send_card(turn_context, response)
+            else:
+                await turn_context.send_activity(response or "Sorry, I couldn't process your request.")
+            return
+
+        # Streaming: typing indicator and a placeholder right away, then edit it as tokens arrive.
+        await turn_context.send_activity(Activity(type=ActivityTypes.typing))
+        placeholder = await turn_context.send_activity("⏳ Thinking…")
+        started = time.monotonic()
+
+        async def update(text=None, card=None):
+            activity = MessageFactory.text(text) if card is None else MessageFactory.attachment(
+                Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card))
+            activity.id = placeholder.id
+            await turn_context.update_activity(activity)
+
+        work = asyncio.ensure_future(asyncio.to_thread(process_user_message, user_message, deadline, stream))
+        shown_version, shown_text = 0, ""
+        while not work.done():
+            # Rate-limit message edits; Teams throttles rapid updates of the same activity.
+            await asyncio.wait({work}, timeout=llm_stream.UPDATE_INTERVAL)
+            text = stream.visible()
+            if work.done() or stream.version == shown_version or not text or text == shown_text:
+                continue
+            if not shown_text:
+                metrics.observe("llm.time_to_first_update", time.monotonic() - started)
+            shown_version, shown_text = stream.version, text
+            try:
+                await update(f"{text} ▌")
+            except Exception as e:
+                logger.warning(f"[Streaming] Could not update the placeholder: {e}")
+
+        response = work.result()
+        if isinstance(response, dict):
+            await update(card=response)
+        else:
+            await update(response or "Sorry, I couldn't process your request.")
+
+    async def _handle_multi_region_list(self, title, fetch, turn_context: TurnContext):
+        header = f"🌍 **{title} across all regions**"
+        placeholder = await turn_context.send_activity(f"{header}\n\n⏳ Querying regions...")
+        sections, empty, failed = [], [], []
+        total = 0
+        last_update = 0.0
+
+        def render(done):
+            text = header + "\n\n" + ("\n\n".join(sections) if sections else "")
+            if empty:
+                text += f"\n\n_No results in: {', '.join(sorted(empty))}_"
+            if failed:
+                text += "\n\n" + "\n".join(f"⚠️ {r}: {e}" for r, e in failed)
+            text += f"\n\n{'✅ Done' if done else '⏳ Still querying'} ({total} regions answered)"
+            return text
+
+        async def update(done=False):
+            activity = MessageFactory.text(render(done))
+            activity.id = placeholder.id
+            await turn_context.update_activity(activity)
+
+        results = regions.fan_out(fetch)
+        while True:
+            # The fan-out runs on worker threads; pull results without blocking the event loop.
+            item = await asyncio.to_thread(next, results, None)
+            if item is None:
+                break
+            region, result, error = item
+            total += 1
+            if error:
+                failed.append((region, error))
+            elif (result or "").strip() in EMPTY_REGION_RESULTS:
+                empty.append(region)
+            else:
+                sections.append(f"**{region}**\n{result.strip()}")
+            # Rate-limit message edits; Teams throttles rapid updates of the same activity.
+            if time.monotonic() - last_update >= FANOUT_UPDATE_INTERVAL:
+                last_update = time.monotonic()
+                await update()
+        await update(done=True)
+
     async def _handle_ec2_creation(self, data, turn_context: TurnContext):
+        client_token = submission_token(turn_context, data)
+        if not idempotency.begin(client_token):
+            await turn_context.send_activity("⏳ This EC2 request is already being processed.")
+            return
         try:
             name = data.get("Name", "")
             instance_type = data.get("InstanceType", "t2.micro")
@@ -506,11 +598,13 @@ class TeamsBot(TeamsActivityHandler):
                 termination_protection=termination_protection,
                 bootstrap_script_name=bootstrap_script_name,
                 elastic_ip=elastic_ip,
-                custom_tags=custom_tags
+                custom_tags=custom_tags,
+                client_token=client_token
             )
 
             # Result summary
             details = (
+                ("ℹ️ This request was already completed. Showing the original result.\n\n" if result.get("Replayed") else "") +
                 f"✅ **EC2 Instance Created Successfully!**\n\n"
                 f"🆔 **Name:** {name or 'N/A'}\n"
                 f"📦 **AMI:** {ami_id}\n"
@@ -531,10 +625,16 @@ class TeamsBot(TeamsActivityHandler):
         except Exception as e:
             logger.exception("❌ EC2 Creation Failed")
             await turn_context.send_activity(f"❌ Error creating EC2 instance: {str(e)}")
+        finally:
+            idempotency.finish(client_token)
 
     async def _handle_vpc_creation(self, data, turn_context: TurnContext):
         def parse_bool(val: str) -> bool:
             return val.strip().lower() == "true" if isinstance(val, str) else False
+        client_token = submission_token(turn_context, data)
+        if not idempotency.begin(client_token):
+            await turn_context.send_activity("⏳ This VPC request is already being processed.")
+            return
         try:
             vpc_name = data.get("vpc_name", "")
             cidr_block = data.get("vpc_cidr", "")
@@ -580,17 +680,20 @@ class TeamsBot(TeamsActivityHandler):
                 enable_nat=attach_nat,
                 route_table_mode=route_table_mode,
                 subnet_requests=subnet_requests,
-                custom_tags=custom_tags
+                custom_tags=custom_tags,
+                client_token=client_token
             )
 
             if isinstance(result, dict):
                 summary = (
+                    ("ℹ️ This request was already completed. Showing the original result.\n\n" if result.get("replayed") else "") +
                     f"✅ **VPC Created Successfully!**\n\n"
                     f"🔗 **VPC ID:** `{result['vpc_id']}`\n"
                     f"🌐 **CIDR:** `{result['cidr']}`\n"
                     f"📡 **IGW Attached:** {'Yes' if result['igw_id'] else 'No'}\n"
                     f"🔀 **Subnets Created:** {result['subnet_count']}\n"
                     f"🌐 **NAT Gateway:** {'Yes' if result['nat_gateway'] else 'No'}"
+                    + (f"\n🔁 **Resumed Steps:** {result['resumed_steps']}" if result.get('resumed_steps') else "")
                 )
                 await turn_context.send_activity(summary)
             else:
@@ -598,9 +701,51 @@ class TeamsBot(TeamsActivityHandler):
 
         except Exception as e:
             logger.exception("❌ VPC creation failed")
-            await turn_context.send_activity(f"❌ Failed to create VPC: {str(e)}")
+            card = adaptive_cards.vpc_build_failed_card(e, data, client_token, data.get("region", "us-east-1"))
+            await turn_context.send_activity(
+                MessageFactory.attachment(
+                    Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
+                )
+            )
+        finally:
+            idempotency.finish(client_token)
+
+    async def _handle_vpc_rollback(self, data, turn_context: TurnContext):
+        client_token = data.get("client_token")
+        if not client_token or not idempotency.begin(client_token):
+            await turn_context.send_activity("⏳ This VPC build is still being processed.")
+            return
+        try:
+            await turn_context.send_activity("🧹 Rolling back the VPC build...")
+            deleted = await asyncio.to_thread(rollback_vpc_build, client_token, data.get("region", "us-east-1"))
+            await turn_context.send_activity(
+                f"✅ Rollback complete. Deleted {len(deleted)} resource(s)." if deleted else "ℹ️ Nothing to roll back."
+            )
+        except Exception as e:
+            logger.exception("❌ VPC rollback failed")
+            await turn_context.send_activity(f"❌ Rollback failed: {str(e)}")
+        finally:
+            idempotency.finish(client_token)
     
 
+    async def _handle_bucket_stats(self, user_message, turn_context: TurnContext, bucket_name=None):
+        # "bucket stats my-bucket" / "bucket size of my-bucket" / "stats for s3://my-bucket"
+        if not bucket_name:
+            words = [w.strip("`'\".,?") for w in user_message.split()]
+            skip = {"bucket", "stats", "statistics", "size", "of", "for", "the", "largest", "prefixes", "in", "show", "what", "is"}
+            bucket_name = next((w for w in reversed(words) if w and w not in skip), None)
+        if not bucket_name:
+            await turn_context.send_activity("❓ Which bucket? Try `bucket stats my-bucket`.")
+            return
+        try:
+            stats = await asyncio.to_thread(s3_inventory.get_bucket_stats, bucket_name)
+            await turn_context.send_activity(s3_inventory.format_stats(stats))
+        except s3_inventory.InventoryNotConfigured as e:
+            await turn_context.send_activity(f"⚠️ {e} Enable S3 Inventory (CSV or Parquet) on the bucket to get stats without listing it.")
+        except Exception as e:
+            logger.exception("❌ Bucket stats failed")
+            await turn_context.send_activity(f"❌ Could not compute bucket stats: {str(e)}")
+
     async def _handle_s3_bucket_creation(self, data, turn_context: TurnContext):
        bucket_name = data.get("bucket_name")
        region = data.get("region")
@@ -655,6 +800,49 @@ class TeamsBot(TeamsActivityHandler):
          await turn_context.send_activity(message)
 
 
+    async def _handle_s3_preview(self, data, turn_context: TurnContext):
+        bucket_name = data.get("bucket_name")
+        object_key = data.get("object_key")
+        if not bucket_name or not object_key:
+            await turn_context.send_activity("⚠️ Please pick a file to preview.")
+            return
+        success, preview = await asyncio.to_thread(s3_preview.preview_object, bucket_name, object_key)
+        if not success:
+            await turn_context.send_activity(preview)
+            return
+        card = adaptive_cards.s3_preview_card(bucket_name, object_key, preview)
+        await turn_context.send_activity(
+            MessageFactory.attachment(
+                Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
+            )
+        )
+
+    async def _handle_s3_zip(self, data, turn_context: TurnContext):
+        bucket_name = data.get("bucket_name")
+        if data.get("action") == "zip_select":
+            success, object_list = list_s3_objects(bucket_name)
+            if not success:
+                await turn_context.send_activity(object_list)
+                return
+            card = adaptive_cards.s3_zip_select_card(bucket_name, object_list)
+        else:
+            # Multi-select values arrive comma separated.
+            keys = [k for k in (data.get("object_keys") or "").split(",") if k]
+            prefix = (data.get("prefix") or "").strip()
+            if not keys and not prefix:
+                await turn_context.send_activity("⚠️ Select at least one file or enter a folder prefix.")
+                return
+            token = transfer_sessions.create_zip_download(bucket_name, keys, "" if keys else prefix,
+                                                          user_id=turn_context.activity.from_property.id)
+            card = adaptive_cards.s3_zip_link_card(bucket_name, f"{BASE_URL}/download/zip/{token}",
+                                                   count=len(keys), prefix=prefix,
+                                                   valid_minutes=transfer_sessions.ZIP_TOKEN_TTL // 60)
+        await turn_context.send_activity(
+            MessageFactory.attachment(
+                Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card)
+            )
+        )
+
     async def _handle_s3_download_link(self, data, turn_context: TurnContext):
         try:
             bucket_name = data.get("bucket_name")
@@ -0,0 +1,143 @@
+# bot/transfer_sessions.py
+# Upload sessions for the S3 upload task module.
+# A session is opened when the task module is fetched and remembers the conversation, so the
+# browser's completion callback can post the result card back into the right chat. Sessions are
+# kept in a small JSON file so an upload can be finished after a bot restart.
+# ZIP download tokens live in the same store; they expire after ZIP_TOKEN_TTL and work once, and
+# only claim_zip_download() returns them: they are posted in chat and are never upload sessions.
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_PATH = os.getenv("UPLOAD_SESSIONS_FILE", os.path.join("state", "upload_sessions.json"))
+SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+ZIP_TOKEN_TTL = int(os.getenv("ZIP_TOKEN_TTL", "900"))
+
+_lock = threading.Lock()
+_sessions = None
+
+
+def _load():
+    global _sessions
+    if _sessions is None:
+        _sessions = {}
+        if os.path.exists(SESSIONS_PATH):
+            try:
+                with open(SESSIONS_PATH, encoding="utf-8") as f:
+                    _sessions = json.load(f)
+            except ValueError:
+                logger.warning(f"[TransferSessions] Ignoring unreadable {SESSIONS_PATH}")
+    return _sessions
+
+
+def _save():
+    # Write to a temp file and rename so a crash never leaves a half-written store.
+    os.makedirs(os.path.dirname(SESSIONS_PATH) or ".", exist_ok=True)
+    tmp = f"{SESSIONS_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_sessions, f)
+    os.replace(tmp, SESSIONS_PATH)
+
+
+def _expired(session, now):
+    return now - session.get("updated", 0) > SESSION_TTL or now > session.get("expires", now)
+
+
+def _expire(now):
+    stale = [sid for sid, s in _sessions.items() if _expired(s, now)]
+    for sid in stale:
+        del _sessions[sid]
+    return bool(stale)
+
+
+def create(conversation_reference, user_id):
+    """Open a session; conversation_reference is the serialized ConversationReference dict."""
+    session_id = uuid.uuid4().hex
+    now = time.time()
+    with _lock:
+        _load()
+        _expire(now)
+        _sessions[session_id] = {
+            "conversation": conversation_reference,
+            "user_id": user_id,
+            "created": now,
+            "updated": now,
+            "uploads": {},
+        }
+        _save()
+    return session_id
+
+
+def create_zip_download(bucket_name, keys=None, prefix="", user_id=None):
+    """Single-use token for /download/zip/<token>: explicit keys, or everything under a prefix."""
+    token = uuid.uuid4().hex
+    now = time.time()
+    with _lock:
+        _load()
+        _expire(now)
+        _sessions[token] = {
+            "kind": "zip_download",
+            "bucket_name": bucket_name,
+            "keys": list(keys or []),
+            "prefix": prefix,
+            "user_id": user_id,
+            "created": now,
+            "updated": now,
+            "expires": now + ZIP_TOKEN_TTL,
+        }
+        _save()
+    return token
+
+
+def claim_zip_download(token):
+    """The download behind a zip token, removing the token so the link cannot be used again."""
+    with _lock:
+        download = _load().get(token or "")
+        if not download or download.get("kind") != "zip_download":
+            return None
+        del _sessions[token]
+        _save()
+    return None if _expired(download, time.time()) else download
+
+
+def _upload_session(session_id):
+    session = _load().get(session_id or "")
+    return None if session is None or session.get("kind") == "zip_download" else session
+
+
+def get(session_id):
+    with _lock:
+        session = _upload_session(session_id)
+        if session and _expired(session, time.time()):
+            return None
+        return json.loads(json.dumps(session)) if session else None
+
+
+def update(session_id, **fields):
+    with _lock:
+        session = _upload_session(session_id)
+        if session is None:
+            return None
+        session.update(fields)
+        session["updated"] = time.time()
+        _save()
+        return dict(session)
+
+
+def update_upload(session_id, upload_key, **fields):
+    """Merge fields into one upload's record inside a session."""
+    with _lock:
+        session = _upload_session(session_id)
+        if session is None:
+            return None
+        upload = session.setdefault("uploads", {}).setdefault(upload_key, {})
+        upload.update(fields)
+        session["updated"] = time.time()
+        _save()
+        return json.loads(json.dumps(upload))
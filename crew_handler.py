@@ -2,30 +2,47 @@
 # Orchestrates request handling using CrewAI agents and direct boto3 calls.
 # Decides when to prompt the user for more info via Adaptive Cards vs. executing an AWS operation.
 from crewai import Agent, Task, Crew, LLM
-from aws_crew_tools import ec2, s3, iam, vpc  # import our AWS boto3 modules
-from bot import adaptive_cards
+from aws_crew_tools import ec2, s3, iam, vpc, metrics, tool_cache  # import our AWS boto3 modules
+from bot import adaptive_cards, entities, response_cache, llm_stream, llm_pool, intent_router
+from bot.circuit_breaker import CircuitBreaker
 
 # Initialize the CrewAI LLM to use the local Ollama LLaMA3 model.
 # The model and endpoint are read from environment variables (or default values).
 import os
+import json
+import time
+import logging
+import threading
+import requests
+from concurrent.futures import TimeoutError as FutureTimeout
 os.environ.setdefault("OLLAMA_API_BASE", "http://192.168.0.177:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "ollama/llama3:7b")
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://192.168.0.177:11434")
-aws_llm = LLM(model=OLLAMA_MODEL, base_url=OLLAMA_URL)
-
-# Define a single agent that can handle AWS requests using provided tools.
-aws_agent = Agent(
-    role="AWS Assistant",
-    goal="Help the user manage AWS resources via natural language commands",
-    backstory=("You are an AWS assistant agent. You can create and manage cloud resources (EC2 instances, S3 buckets, IAM users, VPCs) "
-               "on behalf of the user. You have access to tools that perform AWS actions. Use them as needed to fulfill the user's request."),
-    llm=aws_llm,
-    # Assign the AWS action tools to this agent (the agent can choose among these when reasoning).
-    tools=[
-        ec2.CreateEC2Tool(), ec2.ListEC2Tool(), ec2.TerminateEC2Tool(),
-        s3.CreateBucketTool(), s3.ListS3BucketsTool(),
-        vpc.CreateVPCTool(), vpc.ListVPCsTool(),
-        # IAM (Full Set)
+# Hard cap for a single LLM request; the per-turn deadline below is usually shorter.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Seconds a chat turn may spend end to end before the bot answers with the fallback card.
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "45"))
+# Below this remaining budget the LLM is not even tried.
+MIN_LLM_BUDGET = float(os.getenv("MIN_LLM_BUDGET", "3"))
+# Reasoning steps an agent may take per turn, so a run that outlives its turn still ends soon.
+AGENT_MAX_ITER = int(os.getenv("AGENT_MAX_ITER", "5"))
+# How long Ollama keeps the model loaded after a request ("30m", "1h", "-1" = forever).
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Re-warm the model this often (seconds, 0 = only at startup) so idle periods don't unload it.
+OLLAMA_KEEP_WARM_INTERVAL = float(os.getenv("OLLAMA_KEEP_WARM_INTERVAL", "0"))
+aws_llm = LLM(model=OLLAMA_MODEL, base_url=OLLAMA_URL, timeout=LLM_TIMEOUT, stream=llm_stream.ENABLED,
+              keep_alive=OLLAMA_KEEP_ALIVE)
+llm_breaker = CircuitBreaker("llm")
+logger = logging.getLogger(__name__)
+
+# AWS action tools grouped by service. Each request gets an agent with only the groups its
+# message is about, which keeps the tool schemas in the prompt short.
+TOOL_GROUPS = {
+    "ec2": [ec2.CreateEC2Tool(), ec2.ListEC2Tool(), ec2.TerminateEC2Tool()],
+    "s3": [s3.CreateBucketTool(), s3.ListS3BucketsTool()],
+    "vpc": [vpc.CreateVPCTool(), vpc.AddSubnetsTool(), vpc.ListVPCsTool()],
+    # IAM (Full Set)
+    "iam": [
         iam.CreateIAMUserTool(),
         iam.CreateIAMGroupTool(),
         iam.AttachUserToGroupTool(),
@@ -39,14 +56,155 @@ aws_agent = Agent(
         iam.EnableMfaTool(),
         iam.AuditIAMTool(),
     ],
-    verbose=False  # set True to debug agent reasoning if needed
-)
+}
+TOOL_SCOPING = os.getenv("AGENT_TOOL_SCOPING", "true").lower() == "true"
+
+# Cheap pre-classification: service keywords (singular, see intent_router.tokenize) and entity types.
+SCOPE_KEYWORDS = {
+    "ec2": {"ec2", "instance", "server", "vm", "ami", "machine", "terminate", "reboot"},
+    "s3": {"s3", "bucket", "object", "file", "upload", "download", "storage"},
+    "vpc": {"vpc", "subnet", "network", "cidr", "nat", "gateway", "route", "igw"},
+    "iam": {"iam", "user", "group", "role", "policy", "mfa", "permission", "access", "credential"},
+}
+SCOPE_ENTITIES = {"instance_id": "ec2", "instance_type": "ec2", "ami_id": "ec2", "bucket": "s3",
+                  "vpc_id": "vpc", "subnet_id": "vpc", "security_group_id": "vpc", "cidr": "vpc"}
+
+# The static part of every agent prompt. It is identical for all tool scopes and comes before
+# the tools and the user's message, so Ollama can reuse its evaluated prefix between requests.
+AGENT_ROLE = "AWS Assistant"
+AGENT_GOAL = "Help the user manage AWS resources via natural language commands"
+AGENT_BACKSTORY = ("You are an AWS assistant agent. You can create and manage cloud resources (EC2 instances, S3 buckets, IAM users, VPCs) "
+                   "on behalf of the user. You have access to tools that perform AWS actions. Use them as needed to fulfill the user's request.")
+# Same layout as CrewAI's system prompt opening.
+STATIC_PROMPT_PREFIX = f"You are {AGENT_ROLE}. {AGENT_BACKSTORY}\nYour personal goal is: {AGENT_GOAL}"
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def tool_scope(user_message):
+    """Sorted tuple of TOOL_GROUPS keys the message is about; all groups when nothing matches."""
+    if not TOOL_SCOPING:
+        return tuple(sorted(TOOL_GROUPS))
+    tokens = set(intent_router.tokenize(user_message))
+    scope = {group for group, words in SCOPE_KEYWORDS.items() if tokens & words}
+    for entity in entities.extract(user_message):
+        if entity.type == "arn":
+            service = entity.value.split(":")[2]
+            scope.add(service if service in TOOL_GROUPS else "iam")
+        elif entity.type in SCOPE_ENTITIES:
+            scope.add(SCOPE_ENTITIES[entity.type])
+    return tuple(sorted(scope or TOOL_GROUPS))
+
+
+def _schema_tokens(tools):
+    # Rough prompt cost of the tool list (~4 characters per token).
+    chars = 0
+    for tool in tools:
+        schema = getattr(tool, "args_schema", None)
+        chars += len(tool.name) + len(tool.description or "")
+        chars += len(json.dumps(schema.model_json_schema())) if schema is not None else 0
+    return chars // 4
+
+
+def agent_for(scope):
+    """Agent with the tools of `scope`, built once per scope and reused."""
+    with _agents_lock:
+        agent = _agents.get(scope)
+        if agent is None:
+            tools = [tool for group in scope for tool in TOOL_GROUPS[group]]
+            agent = _agents[scope] = Agent(
+                role=AGENT_ROLE,
+                goal=AGENT_GOAL,
+                backstory=AGENT_BACKSTORY,
+                llm=aws_llm,
+                # Assign the AWS action tools to this agent (the agent can choose among these when reasoning).
+                tools=tools,
+                max_iter=AGENT_MAX_ITER,
+                verbose=False  # set True to debug agent reasoning if needed
+            )
+            metrics.set_gauge(f"agent.tool_schema_tokens.{'+'.join(scope)}", _schema_tokens(tools))
+        return agent
+
+# Tools that only read; answers that used any other tool are never cached.
+READ_ONLY_TOOLS = {tool.name for tool in (ec2.ListEC2Tool(), s3.ListS3BucketsTool(), vpc.ListVPCsTool(), iam.AuditIAMTool())}
+# The S3 bucket list and IAM are account-wide: a change in any region makes them stale.
+ACCOUNT_WIDE_TOOLS = {tool.name for tool in (s3.ListS3BucketsTool(), iam.AuditIAMTool())}
+# Read-only results are memoized per conversation; other tools invalidate them (see tool_cache).
+for _group in TOOL_GROUPS.values():
+    tool_cache.install(_group, READ_ONLY_TOOLS, account_wide_names=ACCOUNT_WIDE_TOOLS)
+
+def _keep_alive_seconds(value):
+    value = str(value).strip().lower()
+    if value.startswith("-"):
+        return float("inf")
+    units = {"s": 1, "m": 60, "h": 3600}
+    return float(value[:-1]) * units[value[-1]] if value[-1:] in units else float(value)
+
+
+_last_llm_use = None  # time.monotonic() of the last warm-up or agent call
+
+
+def _mark_llm_used():
+    global _last_llm_use
+    _last_llm_use = time.monotonic()
+
 
-def process_user_message(user_message: str):
+def _model_is_warm():
+    return _last_llm_use is not None and time.monotonic() - _last_llm_use < _keep_alive_seconds(OLLAMA_KEEP_ALIVE)
+
+
+def warm_up():
+    """
+    Load the model into Ollama and evaluate the static prompt prefix, so the first user request
+    neither waits for the model to load nor for the agent preamble to be processed.
+    """
+    model = OLLAMA_MODEL.split("/", 1)[-1]
+    started = time.perf_counter()
+    try:
+        response = requests.post(f"{OLLAMA_URL.rstrip('/')}/api/generate", json={
+            "model": model,
+            "prompt": STATIC_PROMPT_PREFIX,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "stream": False,
+            "options": {"num_predict": 1},
+        }, timeout=LLM_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        metrics.incr("ollama.warmup_failed")
+        logger.warning(f"[Ollama] Warm-up of {model} failed: {e}")
+        return False
+    body = response.json()
+    _mark_llm_used()
+    metrics.observe("ollama.warmup", time.perf_counter() - started)
+    # Ollama reports durations in nanoseconds; load_duration is ~0 when the model was resident.
+    metrics.set_gauge("ollama.load_seconds", round(body.get("load_duration", 0) / 1e9, 3))
+    metrics.set_gauge("ollama.prefix_eval_seconds", round(body.get("prompt_eval_duration", 0) / 1e9, 3))
+    logger.info(f"[Ollama] {model} warm in {time.perf_counter() - started:.1f}s "
+                f"(load {body.get('load_duration', 0) / 1e9:.1f}s, keep_alive={OLLAMA_KEEP_ALIVE})")
+    return True
+
+
+def start_warm_up():
+    """Warm the model in the background at startup, then every OLLAMA_KEEP_WARM_INTERVAL seconds."""
+    def run():
+        while True:
+            warm_up()
+            if OLLAMA_KEEP_WARM_INTERVAL <= 0:
+                return
+            time.sleep(OLLAMA_KEEP_WARM_INTERVAL)
+    threading.Thread(target=run, name="ollama-warmup", daemon=True).start()
+
+
+def process_user_message(user_message: str, deadline: float = None, stream=None, priority=llm_pool.INTERACTIVE):
     """
     Process a user's message and determine an appropriate response.
     - If additional input is required, return an Adaptive Card (as dict) to collect info.
     - If it is a straightforward request, perform it directly or via CrewAI and return the result.
+    - deadline is a time.monotonic() value; when the LLM can't answer by then (or the circuit
+      breaker is open) the capabilities card is returned instead.
+    - stream (bot.llm_stream.TokenStream) receives the agent's tokens while it works.
+    - priority orders the request in the LLM worker pool (bot.llm_pool).
     """
     message_lower = user_message.lower()
 
@@ -80,19 +238,15 @@ def process_user_message(user_message: str):
         # Terminate an EC2 instance or delete other resource (requires an identifier).
         # For simplicity, handle EC2 instance termination; other deletions can be added similarly.
         if "instance" in message_lower:
-            # Expect an instance ID in the message (e.g., "terminate instance i-123abc")
-            parts = user_message.split()
-            # Find something that looks like an instance ID (starts with i-)
-            instance_id = None
-            for token in parts:
-                if token.startswith("i-"):
-                    instance_id = token
-                    break
+            # Expect an instance ID in the message (e.g., "terminate instance i-0123456789abcdef0").
+            # The id alone is not a termination request ("delete the tag Name from i-...").
+            instance_id = entities.first(user_message, "instance_id")
             if instance_id:
                 result = ec2.terminate_instance(instance_id=instance_id)
+                tool_cache.invalidate_region()
                 return f"**EC2 Instance Termination:** {result}"
             else:
-                return "Please specify the EC2 instance ID to terminate (e.g., 'terminate instance i-xxxxxx')."
+                return "Please specify the EC2 instance ID to terminate (e.g., 'terminate instance i-0123456789abcdef0')."
             
         # IAM Adaptive Card Fallbacks (submissions)
     if isinstance(user_message, dict):
@@ -164,19 +318,90 @@ def process_user_message(user_message: str):
 
 
     # 3. If not handled above, use the CrewAI agent to interpret and fulfill the request.
+    # Repeated questions are answered from the response cache without calling the LLM.
+    cached = response_cache.cache.get(user_message)
+    if cached is not None:
+        return cached
+
+    # Check the budget and the breaker before building anything for the LLM.
+    deadline = deadline or time.monotonic() + TURN_DEADLINE
+    remaining = deadline - time.monotonic()
+    if remaining < MIN_LLM_BUDGET:
+        metrics.incr("llm.skipped_no_budget")
+        return adaptive_cards.capabilities_card("There isn't enough time left in this turn to ask the assistant.")
+    # Answer right away instead of queueing behind a backend that keeps failing.
+    if not llm_breaker.allow():
+        return adaptive_cards.capabilities_card(
+            f"The assistant is not responding right now (next retry in {llm_breaker.retry_in():.0f}s).")
+
     # We create a single Task for the agent with the user's message as the goal/description.
-    task = Task(
-        description=user_message,
-        agent=aws_agent,
-        tools=aws_agent.tools,
-        expected_output="A concise result or answer for the user's request."
-    )
-    crew = Crew(agents=[aws_agent], tasks=[task])
-    # Run the crew to let the agent process the request.
+    # The agent only carries the tool groups the message is about. Each turn gets its own copy
+    # (same tools) so its execution time can be bounded by this turn's deadline.
+    scope = tool_scope(user_message)
+    scope_name = "+".join(scope)
+    try:
+        agent = agent_for(scope).model_copy(update={"max_execution_time": max(1, int(remaining))})
+        task = Task(
+            description=user_message,
+            agent=agent,
+            tools=agent.tools,
+            expected_output="A concise result or answer for the user's request."
+        )
+        # Record the tools the agent calls so answers built from mutating tools are not cached.
+        used_tools = []
+        crew = Crew(agents=[agent], tasks=[task],
+                    step_callback=lambda step: used_tools.append(getattr(step, "tool", None)))
+    except Exception:
+        llm_breaker.release()
+        raise
+
+    def kickoff():
+        # Time spent queued counts against the turn.
+        agent.max_execution_time = max(1, int(deadline - time.monotonic()))
+        return crew.kickoff()
+
+    # Run the crew in the LLM worker pool; the turn stops waiting at its deadline.
+    started = time.perf_counter()
+    warmth = "warm" if _model_is_warm() else "cold"
+    # Mutating tools refuse to run after the deadline, when the user has already been answered.
+    deadline_token = tool_cache.use_deadline(deadline)
+    try:
+        future = llm_pool.pool.submit(llm_stream.bind(stream, kickoff), priority=priority, deadline=deadline)
+    except llm_pool.PoolBusy:
+        llm_breaker.release()
+        return adaptive_cards.capabilities_card("The assistant is busy with other questions right now.")
+    finally:
+        tool_cache.deadline.reset(deadline_token)
     try:
-        output = crew.kickoff()
+        output = future.result(timeout=max(0, deadline - time.monotonic()))
+    except llm_pool.QueueTimeout:
+        llm_breaker.release()
+        metrics.incr("llm.queue_timeouts")
+        return adaptive_cards.capabilities_card("The assistant is busy with other questions right now.")
+    except FutureTimeout:
+        if future.cancel():
+            # Still queued: the model was never asked, so this says nothing about its health.
+            llm_breaker.release()
+            metrics.incr("llm.queue_timeouts")
+            return adaptive_cards.capabilities_card("The assistant is busy with other questions right now.")
+        # The worker finishes on its own, bounded by AGENT_MAX_ITER, LLM_TIMEOUT and its tools
+        # refusing to mutate after the deadline; the turn does not wait for it.
+        metrics.incr("llm.timeouts")
+        llm_breaker.record_failure("timeout")
+        return adaptive_cards.capabilities_card(f"The assistant didn't answer within {remaining:.0f}s.")
     except Exception as e:
+        llm_breaker.record_failure("error")
         return f"Sorry, I couldn't complete the request due to an error: {e}"
+    llm_breaker.record_success()
+    elapsed = time.perf_counter() - started
+    metrics.observe("crew.kickoff", elapsed)
+    metrics.observe(f"crew.kickoff.{scope_name}", elapsed)
+    metrics.observe(f"crew.kickoff.{warmth}", elapsed)
+    _mark_llm_used()
+    usage = getattr(output, "token_usage", None)
+    if usage is not None:
+        metrics.incr(f"llm.prompt_tokens.{scope_name}", getattr(usage, "prompt_tokens", 0) or 0)
+        metrics.incr(f"llm.requests.{scope_name}")
     
     if "created" in str(output).lower() and "instance" in str(output).lower():
     # Could be hallucinated — double-check if Adaptive Card wasn't triggered
@@ -185,8 +410,10 @@ def process_user_message(user_message: str):
 
     # The output from crew.kickoff() is expected to be the final answer from the agent (string).
     if output:
+        tools = {t for t in used_tools if t}
+        if tools <= READ_ONLY_TOOLS:
+            response_cache.cache.put(user_message, str(output), elapsed,
+                                     ttl=response_cache.TOOL_TTL if tools else None)
         return str(output)
     else:
         return "I'm not sure how to handle that request."
-    
-    
@@ -0,0 +1,128 @@
+# tests/test_cidr_allocator.py
+# Property-based tests for the buddy subnet allocator (aws_crew_tools/cidr_allocator.py):
+# planned subnets never overlap each other or existing subnets, stay inside the parent block,
+# and every set of requests that fits at all is allocated (checked against a brute-force
+# packer on small address spaces).
+
+import functools
+import ipaddress
+import pytest
+
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given, settings, strategies as st
+
+from aws_crew_tools import cidr_allocator
+
+# Usable hosts that map to /28 ... /22 subnets.
+HOSTS = [1, 11, 27, 59, 123, 251, 507, 1019]
+UNIT_PREFIX = 28
+
+
+def _requests(max_hosts=HOSTS[-1], max_size=40):
+    return st.lists(
+        st.fixed_dictionaries({
+            "hosts": st.sampled_from([h for h in HOSTS if h <= max_hosts]),
+            "type": st.sampled_from(["public", "private"]),
+        }),
+        min_size=1, max_size=max_size,
+    )
+
+
+@st.composite
+def _used_subnets(draw, parent, max_prefix_gap=4, max_count=6):
+    """Non-overlapping aligned subnets inside `parent`, like the existing subnets of a VPC."""
+    parent = ipaddress.ip_network(parent)
+    used = []
+    for _ in range(draw(st.integers(0, max_count))):
+        prefix = draw(st.integers(parent.prefixlen + 1, min(UNIT_PREFIX, parent.prefixlen + max_prefix_gap)))
+        candidates = list(parent.subnets(new_prefix=prefix))
+        subnet = candidates[draw(st.integers(0, len(candidates) - 1))]
+        if not any(subnet.overlaps(u) for u in used):
+            used.append(subnet)
+    return used
+
+
+def _try_plan(parent, requests, used=(), azs=None):
+    try:
+        return cidr_allocator.plan_subnets(parent, requests, used=[str(u) for u in used], azs=azs)
+    except ValueError:
+        return None
+
+
+def _fits_brute_force(parent, requests, used):
+    """Exhaustive aligned packing in /28 units (memoized on the taken bitmask); only for small parents."""
+    parent = ipaddress.ip_network(parent)
+    base = int(parent.network_address)
+    unit = 2 ** (32 - UNIT_PREFIX)
+    slots = parent.num_addresses // unit
+    taken = 0
+    for u in used:
+        start = (int(u.network_address) - base) // unit
+        taken |= ((1 << (u.num_addresses // unit)) - 1) << start
+    sizes = sorted((2 ** (32 - cidr_allocator.prefix_for_hosts(r["hosts"])) // unit for r in requests), reverse=True)
+
+    @functools.lru_cache(maxsize=None)
+    def place(idx, taken):
+        if idx == len(sizes):
+            return True
+        mask = (1 << sizes[idx]) - 1
+        return any(not taken & (mask << start) and place(idx + 1, taken | (mask << start))
+                   for start in range(0, slots, sizes[idx]))
+
+    return place(0, taken)
+
+
+def _assert_valid(plan, parent, requests, used=()):
+    parent = ipaddress.ip_network(parent)
+    networks = [a["network"] for a in plan]
+    assert len(plan) == len(requests)
+    for a, req in zip(plan, requests):
+        assert a["network"].subnet_of(parent)
+        assert a["network"].prefixlen == cidr_allocator.prefix_for_hosts(req["hosts"])
+        assert a["network"].num_addresses - cidr_allocator.AWS_RESERVED_ADDRESSES >= req["hosts"]
+    for i, net in enumerate(networks):
+        assert not any(net.overlaps(other) for other in networks[i + 1:])
+        assert not any(net.overlaps(u) for u in used)
+
+
+@settings(max_examples=200, deadline=None)
+@given(requests=_requests(), parent_prefix=st.integers(16, 22))
+def test_plans_fit_parent_without_overlap(requests, parent_prefix):
+    parent = f"10.0.0.0/{parent_prefix}"
+    plan = _try_plan(parent, requests)
+    needed = sum(2 ** (32 - cidr_allocator.prefix_for_hosts(r["hosts"])) for r in requests)
+    # Power-of-two blocks in an empty aligned parent: fits exactly when the sizes add up.
+    assert (plan is not None) == (needed <= ipaddress.ip_network(parent).num_addresses)
+    if plan is not None:
+        _assert_valid(plan, parent, requests)
+
+
+@settings(max_examples=300, deadline=None)
+@given(data=st.data())
+def test_allocates_into_holes_whenever_possible(data):
+    parent = "10.1.0.0/24"
+    used = data.draw(_used_subnets(parent))
+    requests = data.draw(_requests(max_hosts=59, max_size=12))
+    plan = _try_plan(parent, requests, used)
+    assert (plan is not None) == _fits_brute_force(parent, requests, used)
+    if plan is not None:
+        _assert_valid(plan, parent, requests, used)
+
+
+@settings(max_examples=100, deadline=None)
+@given(requests=_requests(max_hosts=251), azs=st.lists(st.sampled_from(["a", "b", "c", "d"]), min_size=1, max_size=4, unique=True))
+def test_each_tier_is_balanced_across_zones(requests, azs):
+    plan = _try_plan("10.2.0.0/16", requests, azs=azs)
+    assert plan is not None
+    for tier in ("public", "private"):
+        counts = [sum(1 for a in plan if a["type"] == tier and a["az"] == az) for az in azs]
+        assert max(counts) - min(counts) <= 1
+
+
+def test_used_space_is_never_handed_out():
+    used = ["10.3.0.0/26", "10.3.0.128/27"]
+    # Free: 10.3.0.64/26, 10.3.0.160/27, 10.3.0.192/26 -> room for two /26 but not three.
+    plan = cidr_allocator.plan_subnets("10.3.0.0/24", [{"hosts": 59, "type": "private"}] * 2, used=used)
+    assert sorted(str(a["network"]) for a in plan) == ["10.3.0.192/26", "10.3.0.64/26"]
+    with pytest.raises(ValueError):
+        cidr_allocator.plan_subnets("10.3.0.0/24", [{"hosts": 59, "type": "private"}] * 3, used=used)
@@ -0,0 +1,55 @@
+# tests/test_entities.py
+# Entity extraction, one parametrized table per entity type: what is found, what is rejected,
+# and ids inside ARNs that must not be reported a second time.
+
+import pytest
+
+from bot import entities
+
+ARN = "arn:aws:ec2:us-east-1:123456789012:instance/i-0123456789abcdef0"
+
+
+@pytest.mark.parametrize("text,kind,expected", [
+    # ARNs, and the ids and regions inside them are not reported twice
+    (f"describe {ARN}.", "arn", [ARN]),
+    (f"describe {ARN}", "instance_id", []),
+    (f"describe {ARN}", "region", []),
+    ("policy arn:aws-us-gov:iam::123456789012:role/Admin", "arn", ["arn:aws-us-gov:iam::123456789012:role/Admin"]),
+    (f"stop {ARN} and i-0fedcba9876543210", "instance_id", ["i-0fedcba9876543210"]),
+    # instance, AMI, security group, subnet and VPC ids: 8 or 17 hex digits
+    ("stop I-0123456789ABCDEF0 and i-1234abcd", "instance_id", ["i-0123456789abcdef0", "i-1234abcd"]),
+    ("stop i-0123456789abcdef01 or i-1234abc or xi-1234abcd", "instance_id", []),
+    ("launch from ami-0abcdef1234567890", "ami_id", ["ami-0abcdef1234567890"]),
+    ("open sg-12345678 to the world", "security_group_id", ["sg-12345678"]),
+    ("use subnet-0abc1234def567890 and subnet-1234567g", "subnet_id", ["subnet-0abc1234def567890"]),
+    ("peer vpc-1a2b3c4d with vpc-1a2b3c4d", "vpc_id", ["vpc-1a2b3c4d"]),
+    # buckets: s3:// URIs and "bucket <name>" phrases, minus the stop words
+    ("copy s3://My-Logs.example/path", "bucket", ["My-Logs.example"]),
+    ("delete bucket named `team-data-01`", "bucket", ["team-data-01"]),
+    ("show bucket called reports", "bucket", ["reports"]),
+    ("show bucket stats for prod-assets", "bucket", []),
+    ("list bucket policies and the bucket size", "bucket", []),
+    ("delete the bucket", "bucket", []),
+    # CIDRs: octets up to 255, prefixes up to /32
+    ("allow 10.0.0.0/16 and 192.168.1.10/32", "cidr", ["10.0.0.0/16", "192.168.1.10/32"]),
+    ("allow 0.0.0.0/0", "cidr", ["0.0.0.0/0"]),
+    ("allow 256.0.0.0/16 or 10.0.0.0/33 or 10.0.0/24", "cidr", []),
+    ("allow 10.0.0.0/16/8 or 1.10.0.0.0/16", "cidr", []),
+    # regions
+    ("move it to eu-central-1 and us-gov-west-1", "region", ["eu-central-1", "us-gov-west-1"]),
+    ("move it to ap-southeast-2b or xx-east-1", "region", []),
+    # instance types of every family
+    ("launch t3.micro, m7g.2xlarge and c6in.metal", "instance_type", ["t3.micro", "m7g.2xlarge", "c6in.metal"]),
+    ("launch u-6tb1.112xlarge", "instance_type", ["u-6tb1.112xlarge"]),
+    ("launch m7i-flex.large or mac2-m2pro.metal", "instance_type", ["m7i-flex.large", "mac2-m2pro.metal"]),
+    ("launch an M5.XLARGE", "instance_type", ["m5.xlarge"]),
+    ("launch t3.huge or version 1.2.large", "instance_type", []),
+])
+def test_find(text, kind, expected):
+    assert entities.find(text)[kind] == expected
+
+
+def test_spans_point_at_the_value():
+    text = "delete bucket named team-data-01 in eu-west-1"
+    for entity in entities.extract(text):
+        assert text[entity.start:entity.end].lower() == entity.value.lower()
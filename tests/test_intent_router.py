@@ -0,0 +1,26 @@
+# tests/test_intent_router.py
+# Every message of the labelled corpus (bench/intent_corpus.tsv) routes to its expected intent.
+
+import os
+import pytest
+
+from bot import intent_router
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "intent_corpus.tsv")
+
+
+def _corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [tuple(line.rstrip("\n").split("\t")) for line in f if line.strip() and not line.startswith("#")]
+
+
+@pytest.mark.parametrize("message,expected", _corpus())
+def test_corpus(message, expected):
+    found = intent_router.router.matches(message.lower())
+    assert (found[0].name if found else "llm") == expected
+
+
+def test_every_intent_has_a_handler():
+    teams_bot = pytest.importorskip("bot.teams_bot")
+    for rule in intent_router.RULES:
+        assert hasattr(teams_bot.TeamsBot, f"_intent_{rule.name}"), rule.name
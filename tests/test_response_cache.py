@@ -0,0 +1,45 @@
+# tests/test_response_cache.py
+# The response cache never answers a message with the answer to one of opposite meaning.
+
+import pytest
+
+pytest.importorskip("numpy")
+from bot import response_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return response_cache.ResponseCache(path=str(tmp_path / "cache.json"))
+
+
+@pytest.mark.parametrize("cached,asked", [
+    ("enable versioning on bucket logs", "disable versioning on bucket logs"),
+    ("which users have used their access keys", "which users have not used their access keys"),
+    ("list running instances", "list stopped instances"),
+    ("give alice read only access", "give alice full access"),
+    ("copy bucket a to bucket b", "copy bucket b to bucket a"),
+    ("terminate i-0aaaaaaaaaaaaaaaa", "terminate i-0bbbbbbbbbbbbbbbb"),
+    ("how many instances are running", "how many instances are not running"),
+])
+def test_different_meaning_is_a_miss(cache, cached, asked):
+    cache.put(cached, "cached answer", 1.0)
+    assert cache.get(asked) is None
+    assert cache.get(cached) == "cached answer"
+
+
+@pytest.mark.parametrize("cached,asked", [
+    ("What is a NAT gateway?", "what is a nat gateway"),
+    ("Can you please tell me what a NAT gateway is", "what nat gateway is"),
+])
+def test_same_message_is_a_hit(cache, cached, asked):
+    cache.put(cached, "cached answer", 1.0)
+    assert cache.get(asked) == "cached answer"
+
+
+def test_entries_survive_a_restart_and_expire(tmp_path):
+    path = str(tmp_path / "cache.json")
+    response_cache.ResponseCache(path=path).put("what is a subnet", "answer", 2.0)
+    response_cache.ResponseCache(path=path).put("what is a vpc", "short lived", 2.0, ttl=-1)
+    reloaded = response_cache.ResponseCache(path=path)
+    assert reloaded.get("what is a subnet") == "answer"
+    assert reloaded.get("what is a vpc") is None
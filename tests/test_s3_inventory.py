@@ -0,0 +1,173 @@
+# tests/test_s3_inventory.py
+# Bucket stats from small S3 Inventory fixtures read through LocalOpener: a gzip CSV report
+# (URL-encoded keys, versioned rows) and the same data as Parquet, also from a non-seekable stream.
+
+import io
+import csv
+import gzip
+import json
+from datetime import datetime, timezone
+from urllib.parse import quote_plus
+import pytest
+
+from aws_crew_tools import s3_inventory
+
+CONFIG_PREFIX = "inventory/source-bucket/daily/"
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc).timestamp()
+SCHEMA = ["Bucket", "Key", "VersionId", "IsLatest", "IsDeleteMarker", "Size", "LastModifiedDate", "StorageClass"]
+
+# (key as listed, size, last modified, storage class, is latest, is delete marker)
+ROWS = [
+    ("logs/2024/a.log", 100, "2024-05-30T10:00:00.000Z", "STANDARD", True, False),
+    ("logs/2024/b.log", 300, "2024-04-15T10:00:00.000Z", "STANDARD_IA", True, False),
+    ("logs/2024/b.log", 999, "2024-04-01T10:00:00.000Z", "STANDARD_IA", False, False),  # old version
+    ("media/photo.jpg", 5000, "2023-01-01T00:00:00.000Z", "GLACIER", True, False),
+    ("media/gone.jpg", 0, "2024-05-31T00:00:00.000Z", "", True, True),                   # delete marker
+    ("readme.txt", 10, "", "", True, False),
+    ("my docs/report.pdf", 50, "2024-05-01T00:00:00.000Z", "STANDARD", True, False),
+    ("c++/x.h", 7, "2024-05-31T00:00:00.000Z", "STANDARD", True, False),
+]
+PREFIXES = {"logs/": (2, 400), "media/": (1, 5000), "(root)": (1, 10), "my docs/": (1, 50), "c++/": (1, 7)}
+
+
+def _write_manifest(root, file_format, files):
+    report = root / CONFIG_PREFIX / "2024-06-01T01-00Z"
+    report.mkdir(parents=True, exist_ok=True)
+    (root / CONFIG_PREFIX / "hive").mkdir(exist_ok=True)  # not a dated report folder
+    manifest = {"sourceBucket": "source-bucket", "fileFormat": file_format,
+                "fileSchema": ", ".join(SCHEMA), "files": [{"key": key} for key in files]}
+    (report / "manifest.json").write_text(json.dumps(manifest))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(s3_inventory, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(s3_inventory, "_cache", {})
+
+
+@pytest.fixture
+def csv_report(tmp_path):
+    root = tmp_path / "dest"
+    data_key = "inventory/source-bucket/daily/data/part-0.csv.gz"
+    (root / "inventory/source-bucket/daily/data").mkdir(parents=True)
+    with gzip.open(root / data_key, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        for i, (key, size, modified, storage_class, latest, marker) in enumerate(ROWS):
+            # CSV reports URL-encode keys.
+            writer.writerow(["source-bucket", quote_plus(key, safe="/"), f"v{i}", str(latest).lower(),
+                             str(marker).lower(), size if not marker else "", modified, storage_class])
+    _write_manifest(root, "CSV", [data_key])
+    return root
+
+
+@pytest.fixture
+def parquet_report(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    root = tmp_path / "dest"
+    data_key = "inventory/source-bucket/daily/data/part-0.parquet"
+    (root / "inventory/source-bucket/daily/data").mkdir(parents=True)
+    modified = [datetime.strptime(r[2][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc) if r[2] else None
+                for r in ROWS]
+    table = pa.table({
+        "bucket": ["source-bucket"] * len(ROWS),
+        # Parquet reports keep keys as they are.
+        "key": [r[0] for r in ROWS],
+        "version_id": [f"v{i}" for i in range(len(ROWS))],
+        "is_latest": [r[4] for r in ROWS],
+        "is_delete_marker": [r[5] for r in ROWS],
+        "size": pa.array([None if r[5] else r[1] for r in ROWS], type=pa.int64()),
+        "last_modified_date": pa.array(modified, type=pa.timestamp("ms", tz="UTC")),
+        "storage_class": [r[3] or None for r in ROWS],
+    })
+    pq.write_table(table, root / data_key, row_group_size=2)
+    _write_manifest(root, "Parquet", [data_key])
+    return root
+
+
+def _stats(root, opener=None):
+    return s3_inventory.get_bucket_stats("source-bucket", opener=opener or s3_inventory.LocalOpener(str(root)),
+                                         config_prefix=CONFIG_PREFIX)
+
+
+def _manifest(root):
+    with open(root / CONFIG_PREFIX / "2024-06-01T01-00Z" / "manifest.json") as f:
+        return json.load(f)
+
+
+def _prefixes(stats):
+    return {p["prefix"]: (p["objects"], p["bytes"]) for p in stats["prefixes"]}
+
+
+def _check(stats):
+    assert stats["report"] == "2024-06-01T01-00Z"
+    assert stats["report_rows"] == len(ROWS)
+    assert stats["objects"] == 6
+    assert stats["bytes"] == 5467
+    assert stats["storage_classes"] == {
+        "GLACIER": {"objects": 1, "bytes": 5000},
+        "STANDARD": {"objects": 4, "bytes": 167},
+        "STANDARD_IA": {"objects": 1, "bytes": 300},
+    }
+    # Keys with a space and with a literal '+' come out as listed, whatever the report format.
+    assert _prefixes(stats) == PREFIXES
+
+
+def test_csv_report(csv_report, monkeypatch):
+    monkeypatch.setattr(s3_inventory, "BATCH_ROWS", 3)  # several batches
+    _check(_stats(csv_report))
+
+
+def test_age_buckets(csv_report):
+    stats = s3_inventory.compute_stats(s3_inventory.LocalOpener(str(csv_report)), _manifest(csv_report), now=NOW)
+    ages = {label: v["objects"] for label, v in stats["ages"].items()}
+    # readme.txt has no date and is in no age bucket.
+    assert ages == {"< 7 days": 2, "7–30 days": 0, "30–90 days": 2, "90–365 days": 0, "> 1 year": 1}
+
+
+def _fold(root, **options):
+    stats = s3_inventory.InventoryStats(now=NOW, url_encoded_keys=True, **options)
+    for batch in s3_inventory.file_batches(s3_inventory.LocalOpener(str(root)), _manifest(root)):
+        stats.add_batch(batch)
+    return stats.to_dict()
+
+
+def test_prefix_depth(csv_report):
+    assert _prefixes(_fold(csv_report, prefix_depth=2)) == {"logs/2024/": (2, 400), "(root)": (4, 5067)}
+
+
+def test_prefix_limit_folds_the_rest(csv_report):
+    stats = _fold(csv_report, max_prefixes=2)
+    assert stats["prefix_count"] == 3
+    assert s3_inventory.OTHER_PREFIX in _prefixes(stats)
+    assert sum(p["bytes"] for p in stats["prefixes"]) == stats["bytes"]
+
+
+def test_results_are_cached(csv_report):
+    first = _stats(csv_report)
+    (csv_report / CONFIG_PREFIX / "2024-06-01T01-00Z" / "manifest.json").unlink()
+    assert _stats(csv_report) == first
+
+
+def test_missing_report(tmp_path):
+    with pytest.raises(s3_inventory.InventoryNotConfigured):
+        _stats(tmp_path)
+
+
+class _StreamingOpener(s3_inventory.LocalOpener):
+    """Hands out non-seekable streams, like S3's get_object body."""
+
+    def open(self, key):
+        with super().open(key) as f:
+            data = f.read()
+        stream = io.BufferedReader(io.BytesIO(data))
+        stream.seekable = lambda: False
+        return stream
+
+
+def test_parquet_report(parquet_report):
+    _check(_stats(parquet_report))
+
+
+def test_parquet_from_a_non_seekable_stream(parquet_report):
+    _check(_stats(parquet_report, opener=_StreamingOpener(str(parquet_report))))
@@ -0,0 +1,43 @@
+# tests/test_s3_preview.py
+# Object previews against moto: the ranged GET covers small and gzipped objects, and an empty
+# object (which S3 answers with 416 InvalidRange for any range) previews as empty.
+
+import gzip
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+
+from aws_crew_tools import s3_preview
+
+BUCKET = "preview-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.mark.parametrize("key,body,expected", [
+    ("empty.txt", b"", {"kind": "text", "text": "", "size": 0, "truncated": False}),
+    ("empty.csv", b"", {"kind": "table", "columns": [], "rows": [], "size": 0, "truncated": False}),
+    ("notes.txt", b"one\ntwo", {"kind": "text", "text": "one\ntwo", "size": 7, "truncated": False}),
+    ("data.csv.gz", gzip.compress(b"a,b\n1,2\n"), {"kind": "table", "columns": ["a", "b"], "rows": [["1", "2"]]}),
+])
+def test_preview(s3, key, body, expected):
+    s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+    ok, preview = s3_preview.preview_object(BUCKET, key, use_select=False)
+    assert ok, preview
+    assert {name: preview[name] for name in expected} == expected
+
+
+def test_long_object_is_truncated(s3):
+    s3.put_object(Bucket=BUCKET, Key="long.txt", Body=b"line\n" * 1000)
+    ok, preview = s3_preview.preview_object(BUCKET, "long.txt", max_bytes=1024, max_rows=5, use_select=False)
+    assert ok and preview["truncated"] and preview["text"].splitlines() == ["line"] * 5
@@ -0,0 +1,94 @@
+# tests/test_s3_transfer.py
+# Dedupe in s3_transfer.upload: identical content is skipped only when the stored object also has
+# the requested storage class, and the requested ACL is applied to a skipped object.
+# Browser multipart uploads only complete with the declared part count and size.
+# upload_file_to_s3 reports every upload failure as (False, message).
+
+import os
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+from botocore.exceptions import EndpointConnectionError
+
+from aws_crew_tools import s3_transfer
+
+BUCKET = "transfer-tests"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _upload(client, body, **extra_args):
+    return s3_transfer.upload(BUCKET, "k", body, extra_args=extra_args, client=client, dedupe=True)
+
+
+def test_identical_content_is_skipped(client):
+    body = os.urandom(1024)
+    assert not _upload(client, body, StorageClass="STANDARD")["skipped"]
+    assert _upload(client, body, StorageClass="STANDARD")["skipped"]
+    assert not _upload(client, os.urandom(1024), StorageClass="STANDARD")["skipped"]
+
+
+def test_other_storage_class_is_uploaded_again(client):
+    body = os.urandom(1024)
+    _upload(client, body, StorageClass="STANDARD")
+    assert not _upload(client, body, StorageClass="STANDARD_IA")["skipped"]
+    assert client.head_object(Bucket=BUCKET, Key="k")["StorageClass"] == "STANDARD_IA"
+    assert _upload(client, body, StorageClass="STANDARD_IA")["skipped"]
+
+
+def test_requested_acl_is_applied_when_skipped(client):
+    body = os.urandom(1024)
+    _upload(client, body, ACL="private")
+    assert _upload(client, body, ACL="public-read")["skipped"]
+    grants = client.get_object_acl(Bucket=BUCKET, Key="k")["Grants"]
+    assert any(g["Grantee"].get("URI", "").endswith("/global/AllUsers") and g["Permission"] == "READ"
+               for g in grants)
+
+
+def _browser_upload(client, *parts):
+    upload_id = s3_transfer.create_browser_upload(BUCKET, "big", client=client)
+    for number, body in enumerate(parts, 1):
+        client.upload_part(Bucket=BUCKET, Key="big", UploadId=upload_id, PartNumber=number, Body=body)
+    return upload_id
+
+
+def test_browser_upload_completes_with_the_declared_size(client):
+    upload_id = _browser_upload(client, os.urandom(1024))
+    assert s3_transfer.complete_browser_upload(BUCKET, "big", upload_id, 1, 1024, client=client) == 1024
+    assert client.head_object(Bucket=BUCKET, Key="big")["ContentLength"] == 1024
+
+
+def test_browser_upload_larger_than_declared_is_not_completed(client):
+    upload_id = _browser_upload(client, os.urandom(2048))
+    with pytest.raises(s3_transfer.SizeMismatch):
+        s3_transfer.complete_browser_upload(BUCKET, "big", upload_id, 1, 1024, client=client)
+    assert "Contents" not in client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_browser_upload_ignores_parts_beyond_the_part_count(client):
+    upload_id = _browser_upload(client, os.urandom(1024), os.urandom(1024))
+    assert s3_transfer.complete_browser_upload(BUCKET, "big", upload_id, 1, 1024, client=client) == 1024
+
+
+@pytest.mark.parametrize("error", [
+    EndpointConnectionError(endpoint_url="https://s3.amazonaws.com"),
+    ValueError(f"Upload exceeds {s3_transfer.MAX_PARTS} parts; raise S3_PART_SIZE_MB."),
+])
+def test_upload_failures_are_reported(monkeypatch, error):
+    s3 = pytest.importorskip("aws_crew_tools.s3")
+
+    def fail(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(s3_transfer, "upload", fail)
+    success, message = s3.upload_file_to_s3(BUCKET, b"data", "f.txt")
+    assert not success and message.startswith("❌")
@@ -0,0 +1,68 @@
+# tests/test_s3_zip.py
+# stream_zip always ends with a valid archive: objects that fail, even part way through a large
+# one, are listed in _errors.txt, and open object bodies are closed when the client goes away.
+
+import io
+import zipfile
+import pytest
+
+from botocore.response import StreamingBody
+from aws_crew_tools import s3_zip
+
+LARGE = s3_zip.SMALL_OBJECT + 1
+
+
+class _Body(io.RawIOBase):
+    def __init__(self, size, fail_after=None):
+        self.remaining = size
+        self.fail_after = fail_after
+        self.sent = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.fail_after is not None and self.sent >= self.fail_after:
+            raise ConnectionResetError("connection reset by peer")
+        n = min(len(buffer), self.remaining)
+        buffer[:n] = b"x" * n
+        self.remaining -= n
+        self.sent += n
+        return n
+
+
+class _S3:
+    def __init__(self, sizes, fail_after=None):
+        self.sizes = sizes
+        self.fail_after = fail_after or {}
+        self.bodies = {}
+
+    def get_object(self, Bucket, Key):
+        size = self.sizes[Key]
+        body = StreamingBody(io.BufferedReader(_Body(size, self.fail_after.get(Key))), size)
+        self.bodies[Key] = body
+        return {"ContentLength": size, "Body": body}
+
+
+def _archive(client, keys, prefetch=4):
+    return zipfile.ZipFile(io.BytesIO(b"".join(s3_zip.stream_zip("b", keys, client=client, prefetch=prefetch))))
+
+
+def test_large_object_failing_part_way_is_reported():
+    client = _S3({"small.txt": 10, "big.bin": LARGE, "after.txt": 5}, fail_after={"big.bin": s3_zip.CHUNK * 2})
+    archive = _archive(client, ["small.txt", "big.bin", "after.txt"])
+    assert archive.testzip() is None
+    assert archive.read("after.txt") == b"x" * 5
+    assert len(archive.read("big.bin")) < LARGE
+    assert "big.bin: truncated after" in archive.read("_errors.txt").decode()
+    assert client.bodies["big.bin"]._raw_stream.closed
+
+
+def test_closing_the_stream_closes_pending_bodies():
+    keys = [f"big-{i}.bin" for i in range(6)]
+    client = _S3({key: LARGE for key in keys})
+    stream = s3_zip.stream_zip("b", keys, client=client, prefetch=4)
+    next(stream)
+    stream.close()
+    assert len(client.bodies) >= 2
+    assert all(body._raw_stream.closed for body in client.bodies.values())
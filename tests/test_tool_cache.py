@@ -0,0 +1,81 @@
+# tests/test_tool_cache.py
+# Read-only tool results are memoized per conversation, mutating tools drop them, and mutating
+# tools refuse to run once the turn's deadline has passed. Changes made without the tools
+# (invalidate_region) drop them as well.
+
+import time
+import pytest
+
+from aws_crew_tools import tool_cache
+
+
+@pytest.fixture(autouse=True)
+def scope(monkeypatch):
+    monkeypatch.setattr(tool_cache, "_account_id", "123456789012")
+    monkeypatch.setattr(tool_cache, "_entries", {})
+    monkeypatch.setattr(tool_cache, "ENABLED", True)
+    token = tool_cache.use_conversation("conversation-1")
+    yield
+    tool_cache.conversation.reset(token)
+
+
+def _counter():
+    calls = []
+
+    def run(**kwargs):
+        calls.append(kwargs)
+        return f"result {len(calls)}"
+    return run, calls
+
+
+def test_mutation_drops_memoized_results():
+    listing, listed = _counter()
+    change, changed = _counter()
+    cached = tool_cache.memoized("list", listing)
+    mutate = tool_cache.invalidating("change", change)
+    assert cached(region_name="eu-west-1") == cached(region_name="eu-west-1") == "result 1"
+    mutate(region_name="eu-west-1")
+    assert cached(region_name="eu-west-1") == "result 2"
+    assert len(changed) == 1
+
+
+def test_mutation_refused_after_deadline():
+    listing, _ = _counter()
+    change, changed = _counter()
+    cached = tool_cache.memoized("list", listing)
+    mutate = tool_cache.invalidating("change", change)
+    cached(region_name="eu-west-1")
+
+    token = tool_cache.use_deadline(time.monotonic() - 1)
+    try:
+        assert "not run" in mutate(region_name="eu-west-1")
+    finally:
+        tool_cache.deadline.reset(token)
+    assert changed == []
+    assert cached(region_name="eu-west-1") == "result 1"
+
+    token = tool_cache.use_deadline(time.monotonic() + 60)
+    try:
+        assert mutate(region_name="eu-west-1") == "result 1"
+    finally:
+        tool_cache.deadline.reset(token)
+    assert len(changed) == 1
+
+
+@pytest.mark.parametrize("listing_kwargs,account_wide", [({"all_regions": True}, False), ({}, True)])
+def test_mutation_in_any_region_drops_results_spanning_regions(listing_kwargs, account_wide):
+    listing, _ = _counter()
+    change, _ = _counter()
+    cached = tool_cache.memoized("list", listing, account_wide=account_wide)
+    mutate = tool_cache.invalidating("change", change)
+    assert cached(**listing_kwargs) == cached(**listing_kwargs) == "result 1"
+    mutate(region_name="ap-southeast-2")
+    assert cached(**listing_kwargs) == "result 2"
+
+
+def test_changes_outside_the_tools_drop_results():
+    listing, _ = _counter()
+    cached = tool_cache.memoized("list", listing)
+    cached(region_name="eu-west-1")
+    tool_cache.invalidate_region("eu-west-1")
+    assert cached(region_name="eu-west-1") == "result 2"
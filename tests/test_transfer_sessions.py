@@ -0,0 +1,34 @@
+# tests/test_transfer_sessions.py
+# ZIP download tokens share the session store but are never accepted as upload sessions, and
+# work only once.
+
+import pytest
+
+from bot import transfer_sessions
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer_sessions, "SESSIONS_PATH", str(tmp_path / "sessions.json"))
+    monkeypatch.setattr(transfer_sessions, "_sessions", None)
+
+
+def test_zip_token_is_not_an_upload_session():
+    token = transfer_sessions.create_zip_download("bucket", keys=["a.txt"], user_id="u1")
+    assert transfer_sessions.get(token) is None
+    assert transfer_sessions.update(token, status="x") is None
+    assert transfer_sessions.update_upload(token, "key", status="presigned") is None
+    assert transfer_sessions.claim_zip_download(token)["keys"] == ["a.txt"]
+
+
+def test_zip_token_works_once():
+    token = transfer_sessions.create_zip_download("bucket", prefix="logs/")
+    assert transfer_sessions.claim_zip_download(token)["prefix"] == "logs/"
+    assert transfer_sessions.claim_zip_download(token) is None
+
+
+def test_upload_session_is_not_a_zip_token():
+    session_id = transfer_sessions.create({"conversation": {"id": "c"}}, "u1")
+    assert transfer_sessions.update_upload(session_id, "key", status="presigned")["status"] == "presigned"
+    assert transfer_sessions.get(session_id)["uploads"]["key"]["status"] == "presigned"
+    assert transfer_sessions.claim_zip_download(session_id) is None
@@ -0,0 +1,103 @@
+# tests/test_vpc_build.py
+# VPC builds against moto: API calls are counted under the phase that made them, subnets added
+# to an existing VPC fill the gaps between its subnets, a cached CIDR index forgets VPCs deleted
+# outside the bot, and a rolled-back build can be resumed with the same client token (EC2's
+# ClientToken rules for the NAT gateway are enforced by a hook, moto ignores them).
+
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+from botocore.exceptions import ClientError
+
+from aws_crew_tools import cidr_index, idempotency, vpc
+
+REGION = "us-east-1"
+TOKEN = idempotency.client_token("test-vpc-build")
+
+
+@pytest.fixture
+def aws(tmp_path, monkeypatch):
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", REGION)):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(idempotency, "JOURNAL_PATH", str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(idempotency, "_entries", None)
+    with moto.mock_aws():
+        yield
+
+
+@pytest.fixture
+def nat_tokens(aws):
+    tokens = {}
+
+    def check_client_token(params, **kwargs):
+        # EC2: the same ClientToken with different parameters is IdempotentParameterMismatch.
+        token = params.get("ClientToken")
+        if token and tokens.setdefault(token, params["SubnetId"]) != params["SubnetId"]:
+            raise ClientError({"Error": {"Code": "IdempotentParameterMismatch", "Message": token}},
+                              "CreateNatGateway")
+
+    boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register("provide-client-params.ec2.CreateNatGateway", check_client_token)
+    yield tokens
+    boto3.DEFAULT_SESSION = None
+
+
+def test_calls_after_a_step_leave_its_phase(aws):
+    ec2 = boto3.client("ec2", region_name=REGION)
+    engine = vpc._ProvisioningEngine(ec2)
+    try:
+        engine.run("vpc", lambda: len(ec2.describe_vpcs()["Vpcs"]))
+        ec2.describe_subnets()
+        ec2.describe_route_tables()
+    finally:
+        engine.shutdown()
+    assert {phase: stats["api_calls"] for phase, stats in engine.phases.items()} == {"vpc": 1, "other": 2}
+
+
+def test_added_subnets_fill_the_gaps(aws):
+    ec2 = boto3.client("ec2", region_name=REGION)
+    vpc_id = ec2.create_vpc(CidrBlock="10.50.0.0/24")["Vpc"]["VpcId"]
+    for cidr in ("10.50.0.0/26", "10.50.0.128/26"):
+        ec2.create_subnet(VpcId=vpc_id, CidrBlock=cidr)
+    igw_id = ec2.create_internet_gateway()["InternetGateway"]["InternetGatewayId"]
+    ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+    public_rt = ec2.create_route_table(VpcId=vpc_id)["RouteTable"]["RouteTableId"]
+    ec2.create_route(RouteTableId=public_rt, DestinationCidrBlock="0.0.0.0/0", GatewayId=igw_id)
+
+    added = vpc.add_subnets_to_vpc(vpc_id, [{"hosts": 50, "type": "public"}, {"hosts": 50, "type": "private"}], REGION)
+    assert sorted(s["cidr"] for s in added) == ["10.50.0.192/26", "10.50.0.64/26"]
+    assert [s["route_table_id"] for s in added] == [public_rt, None]
+    associated = {a["SubnetId"] for a in ec2.describe_route_tables(RouteTableIds=[public_rt])["RouteTables"][0]["Associations"]}
+    assert associated == {added[0]["subnet_id"]}
+    with pytest.raises(ValueError):
+        vpc.add_subnets_to_vpc(vpc_id, [{"hosts": 50, "type": "private"}], REGION)
+
+
+def test_overlap_with_a_vpc_deleted_out_of_band_is_rechecked(aws, monkeypatch):
+    ec2 = boto3.client("ec2", region_name=REGION)
+    stale_vpc = ec2.create_vpc(CidrBlock="10.60.0.0/16")["Vpc"]["VpcId"]
+    monkeypatch.setattr(cidr_index, "_index", cidr_index.build_account_index(regions=[REGION]))
+    assert cidr_index.cached_account_index().conflicts("10.60.0.0/16")
+    ec2.delete_vpc(VpcId=stale_vpc)
+
+    summary = vpc.create_vpc_advanced("test-vpc", "10.60.0.0/16", REGION)
+    assert summary["cidr_conflicts"] == []
+
+
+def _build():
+    return vpc.create_vpc_advanced(
+        "test-vpc", "10.40.0.0/16", REGION, enable_igw=True, enable_nat=True,
+        subnet_requests=[{"hosts": 100, "type": "public"}, {"hosts": 100, "type": "private"}],
+        client_token=TOKEN,
+    )
+
+
+def test_resume_after_rollback_builds_again(nat_tokens):
+    first = _build()
+    vpc.rollback_vpc_build(TOKEN, REGION)
+    second = _build()
+    assert second["vpc_id"] != first["vpc_id"]
+    assert second["nat_gateway"] and not second.get("replayed")
+    assert len(nat_tokens) == 2